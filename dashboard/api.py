@@ -1,34 +1,126 @@
+import copy
+import os
+import re
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, time, timedelta, timezone
 from .db import get_mongodb_connection
+from . import bucketing
+from .counting import fetch_page_with_total, get_total
+from .filters import DATE_FILTER_FIELDS, get_timezone
+from .indexes import EQUIPMENT_KEYSET_FIELDS
+from .keyset import InvalidCursor, fetch_keyset_page
+from .lru import LRUCache
+from .monitoring import timed_section
+from .projection import build_projection, strip_unrequested
+from .relations import RELATION_COLLECTIONS, hydrate_relations, relation_stages
+from .rollups import ROLLUP_SOURCE_FIELDS, record_write
+from .snapshot import get_snapshot
+from .versions import bump_version
+from .status import STATUS_UNSPECIFIED, build_status_fields
+from .search import (
+    SEARCH_FIELDS, INTERNAL_FIELDS_PROJECTION, build_search_fields, build_text_clause
+)
 
-def get_equipments(filters=None, page=1, page_size=20, sort_field=None, sort_order=1, group_by=None):
+# Champs date convertis en chaînes ISO dans les réponses
+EQUIPMENT_DATE_FIELDS = ['creation_date', 'dms', 'created_at', 'updated_at']
+
+# Récupération groupée : nombre maximal de clés par requête
+BATCH_MAX_KEYS = int(os.getenv('BATCH_MAX_KEYS', 5000))
+
+# Recherche exacte (scanners) : champs interrogeables et cache des articles fréquents
+LOOKUP_FIELDS = ('barcode', 'serial')
+LOOKUP_MAX_MATCHES = 20
+_lookup_cache = LRUCache(
+    maxsize=int(os.getenv('LOOKUP_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('LOOKUP_CACHE_TTL', 60)),
+)
+
+
+def _serialize_equipment(doc):
     """
-    Récupère la liste des équipements avec pagination et filtrage
+    Convertit un document équipement pour la sérialisation JSON
+    (ObjectId en chaîne, dates en ISO 8601). Le document est modifié sur place.
+    """
+    doc['_id'] = str(doc['_id'])
+    for field in EQUIPMENT_DATE_FIELDS:
+        if field in doc and isinstance(doc[field], datetime):
+            doc[field] = doc[field].isoformat()
+    return doc
+
+def _id_values(equipment_id):
+    """
+    Variantes d'un identifiant d'équipement : ObjectId pour les documents créés
+    par l'application, chaîne telle quelle pour ceux importés avec un _id texte.
+    """
+    equipment_id = str(equipment_id).strip()
+    values = [equipment_id]
+    if ObjectId.is_valid(equipment_id):
+        values.insert(0, ObjectId(equipment_id))
+    return values
+
+def build_equipment_query(filters=None):
+    """
+    Construit la requête MongoDB correspondant aux filtres de l'API équipements
     """
-    db = get_mongodb_connection()
-    collection = db['equipment']
-    
-    # Construire la requête de filtrage
     query = {}
+    text_clauses = []
     if filters:
         for key, value in filters.items():
             if value is not None and value != '':
                 if key in ['model', 'serial', 'barcode', 'status', 'location']:
-                    query[key] = {'$regex': f'.*{value}.*', '$options': 'i'}
+                    # Recherche indexée selon le mode configuré (voir dashboard.search)
+                    clause = build_text_clause(key, value)
+                    if clause:
+                        text_clauses.append(clause)
                 elif key in ['creation_date', 'dms']:
-                    # Gestion des plages de dates
+                    # Gestion des plages de dates (bornes typées, voir dashboard.filters)
                     if isinstance(value, dict):
                         date_query = {}
-                        if 'gte' in value:
-                            date_query['$gte'] = value['gte']
-                        if 'lte' in value:
-                            date_query['$lte'] = value['lte']
+                        for op in ('gte', 'gt', 'lte', 'lt'):
+                            for name in (op, f'${op}'):
+                                if name in value:
+                                    date_query[f'${op}'] = value[name]
                         if date_query:
                             query[key] = date_query
     
+    # Plusieurs filtres texte peuvent porter sur les mêmes champs techniques
+    if len(text_clauses) == 1:
+        query.update(text_clauses[0])
+    elif text_clauses:
+        query['$and'] = text_clauses
+    
+    return query
+
+def get_equipments(filters=None, page=1, page_size=20, sort_field=None, sort_order=1, group_by=None,
+                   cursor=None, count_mode='exact', fields=None, include=None, serialize=True):
+    """
+    Récupère la liste des équipements avec pagination et filtrage
+    
+    Si cursor n'est pas None (chaîne vide pour la première page), la pagination
+    se fait par curseur (keyset) au lieu de skip/limit.
+    count_mode choisit le calcul du total (voir dashboard.counting).
+    fields limite les champs renvoyés (voir dashboard.projection).
+    include ajoute les relations de la page (voir dashboard.relations).
+    serialize=False laisse ObjectId et dates natifs (rendus par MongoJSONRenderer).
+    """
+    db = get_mongodb_connection()
+    collection = db['equipment']
+    
+    # Construire la requête de filtrage
+    query = build_equipment_query(filters)
+    
+    # Champ date : regroupement par période (voir get_equipment_timeline)
+    if group_by in DATE_FILTER_FIELDS:
+        return get_equipment_timeline(filters, group_by)[0]
+    
     # Gestion du groupement si demandé
     if group_by:
+        # Sans filtre, réponse calculée sur l'instantané en mémoire s'il est à jour
+        snapshot = get_snapshot(db) if not query else None
+        grouped = snapshot.group_counts(group_by) if snapshot is not None else None
+        if grouped is not None:
+            return grouped
+        
         pipeline = [
             {'$match': query} if query else {'$match': {}},
             {'$group': {
@@ -51,90 +143,572 @@ def get_equipments(filters=None, page=1, page_size=20, sort_field=None, sort_ord
         
         return formatted_results
     
-    # Si pas de groupement, on fait une requête normale avec pagination
-    # Compter le nombre total de documents
-    total = collection.count_documents(query)
+    # Pagination par curseur : pas de skip ni de comptage
+    if cursor is not None:
+        sort_field = sort_field or '_id'
+        if sort_field != '_id' and sort_field not in EQUIPMENT_KEYSET_FIELDS:
+            raise InvalidCursor(f'Tri non supporté en mode curseur: {sort_field}')
+        # La clé de tri doit figurer dans les documents pour construire les jetons
+        projection = build_projection(fields, extra=(sort_field,)) or INTERNAL_FIELDS_PROJECTION
+        docs, next_token, prev_token = fetch_keyset_page(
+            collection, query, projection, sort_field, sort_order, page_size, cursor
+        )
+        # Jetons construits : la clé de tri ne reste que si elle a été demandée
+        strip_unrequested(docs, fields, extra=(sort_field,))
+        hydrate_relations(collection, docs, include)
+        if serialize:
+            with timed_section('serialize'):
+                docs = [_serialize_equipment(doc) for doc in docs]
+        return {
+            'page_size': page_size,
+            'next': next_token,
+            'prev': prev_token,
+            'results': docs
+        }
     
     # Configuration du tri
     sort = [(sort_field, sort_order)] if sort_field else [('_id', 1)]
-    
-    # Récupération des données avec pagination
     skip = (page - 1) * page_size
-    cursor = collection.find(query).sort(sort).skip(skip).limit(page_size)
+    projection = build_projection(fields) or INTERNAL_FIELDS_PROJECTION
     
-    # Conversion des ObjectId en chaînes pour la sérialisation JSON
-    equipments = []
-    for doc in cursor:
-        doc['_id'] = str(doc['_id'])
+    if count_mode == 'facet':
+        # Page et total exact en un seul aller-retour
+        docs, total = fetch_page_with_total(collection, query, projection, sort, skip, page_size)
+        approximate = False
+    else:
+        # Compter le nombre total de documents (exact, estimé ou mis en cache)
+        total, approximate = get_total(collection, query, count_mode, unfiltered=not query)
         
-        # Conversion des dates en chaînes ISO
-        date_fields = ['creation_date', 'dms', 'created_at', 'updated_at']
-        for field in date_fields:
-            if field in doc and isinstance(doc[field], datetime):
-                doc[field] = doc[field].isoformat()
-        
-        equipments.append(doc)
+        # Récupération des données avec pagination
+        docs = list(
+            collection.find(query, projection).sort(sort).skip(skip).limit(page_size)
+        )
+    
+    hydrate_relations(collection, docs, include)
+    
+    # Conversion des ObjectId et des dates pour la sérialisation JSON
+    if serialize:
+        with timed_section('serialize'):
+            docs = [_serialize_equipment(doc) for doc in docs]
     
     return {
         'total': total,
+        'total_approximate': approximate,
         'page': page,
         'page_size': page_size,
-        'results': equipments
+        'results': docs
     }
 
-def get_equipment(equipment_id):
+def get_equipment_timeline(filters=None, field='creation_date', granularity='day', tz=None):
+    """
+    Compte les équipements par période sur un champ date.
+    
+    Args:
+        filters (dict): Filtres (comme get_equipments)
+        field (str): Champ date ('creation_date' ou 'dms')
+        granularity (str): 'day', 'week', 'month', 'quarter' ou 'year'
+        tz (ZoneInfo): Fuseau des périodes (défaut settings.TIME_ZONE)
+    
+    Returns:
+        tuple: (série continue [{'_id': 'YYYY-MM-DD', 'count': int}], granularité effective)
+    """
+    db = get_mongodb_connection()
+    collection = db['equipment']
+    tz = tz or get_timezone()
+    
+    query = build_equipment_query(filters)
+    query[field] = {**query.get(field, {}), '$type': 'date'}
+    
+    # Bornes de la plage couverte (deux lectures servies par l'index du champ)
+    first = collection.find_one(query, {field: 1}, sort=[(field, 1)])
+    if not first:
+        return [], granularity
+    last = collection.find_one(query, {field: 1}, sort=[(field, -1)])
+    start = bucketing.local_date(first[field], tz)
+    end = bucketing.local_date(last[field], tz)
+    granularity = bucketing.choose_granularity(start, end, granularity)
+    
+    pipeline = [
+        {'$match': query},
+        {'$group': {
+            '_id': bucketing.bucket_expression(field, granularity, tz),
+            'count': {'$sum': 1}
+        }},
+    ]
+    counts = {
+        bucketing.local_date(item['_id'], tz): item['count']
+        for item in collection.aggregate(pipeline)
+    }
+    return bucketing.fill_gaps(counts, start, end, granularity), granularity
+
+def _evolution_window(period, granularity, tz):
+    """
+    Périodes couvrant une fenêtre d'analyse.
+
+    Returns:
+        tuple: (périodes [date locale], granularité effective, début UTC de la
+        première période, (opérateur, borne haute UTC))
+    """
+    end_op, end_bound = next((op, value) for op, value in period.items() if op != '$gte')
+    start = bucketing.local_date(period['$gte'], tz)
+    end = bucketing.local_date(
+        end_bound - timedelta(microseconds=1) if end_op == '$lt' else end_bound, tz
+    )
+    granularity = bucketing.choose_granularity(start, end, granularity)
+    periods = list(bucketing.iter_periods(start, end, granularity))
+    # La fenêtre commence au début de sa première période
+    window_start = datetime.combine(periods[0], time.min, tzinfo=tz).astimezone(timezone.utc)
+    return periods, granularity, window_start, (end_op, end_bound)
+
+
+def _evolution_stages(window_start, end, granularity, tz):
+    """
+    Étapes d'agrégation des ajouts et du stock cumulé par (période, statut).
+
+    Les équipements créés avant window_start forment une ligne de référence
+    (période None) par statut ; $setWindowFields cumule ensuite les ajouts.
+    """
+    end_op, end_bound = end
+    return [
+        {'$match': {'creation_date': {end_op: end_bound}}},
+        {'$project': {'_id': 0, 'creation_date': 1, 'normalized_status': 1}},
+        {'$group': {
+            '_id': {
+                'period': {'$cond': [
+                    {'$lt': ['$creation_date', window_start]},
+                    None,
+                    bucketing.bucket_expression('creation_date', granularity, tz),
+                ]},
+                'status': {'$ifNull': ['$normalized_status', STATUS_UNSPECIFIED]},
+            },
+            'added': {'$sum': 1},
+        }},
+        {'$setWindowFields': {
+            'partitionBy': '$_id.status',
+            'sortBy': {'_id.period': 1},
+            'output': {
+                'stock': {'$sum': '$added', 'window': {'documents': ['unbounded', 'current']}},
+            },
+        }},
+    ]
+
+
+def _evolution_series(items, periods, tz):
+    """Séries continues {statut: [n]} des ajouts et du stock à partir des lignes agrégées."""
+    rows = {}
+    for item in items:
+        key = item['_id']['period']
+        rows.setdefault(item['_id']['status'], {})[
+            bucketing.local_date(key, tz) if key is not None else None
+        ] = item
+
+    added, stock = {}, {}
+    for status, by_period in rows.items():
+        # Stock de départ : créations antérieures à la fenêtre
+        current = by_period[None]['stock'] if None in by_period else 0
+        added[status], stock[status] = [], []
+        for day in periods:
+            row = by_period.get(day)
+            if row:
+                current = row['stock']
+            added[status].append(row['added'] if row else 0)
+            stock[status].append(current)
+    return added, stock
+
+
+def get_equipment_evolution(period, granularity='month', tz=None):
+    """
+    Ajouts par période et stock cumulé par statut normalisé.
+
+    Une seule agrégation, couverte par l'index (creation_date,
+    normalized_status) : les équipements créés avant la fenêtre forment une
+    ligne de référence par statut, ceux de la fenêtre sont regroupés par
+    période ($dateTrunc), puis $setWindowFields cumule les ajouts par statut.
+    Le stock d'une période est le nombre d'équipements créés jusqu'à sa fin,
+    classés selon leur statut actuel. Le calcul est fait sur l'instantané en
+    mémoire (dashboard.snapshot) lorsqu'il est à jour.
+
+    Args:
+        period (dict): Fenêtre {'$gte': datetime UTC, '$lt'/'$lte': datetime UTC}
+            (voir filters.parse_period)
+        granularity (str): 'day', 'week', 'month', 'quarter' ou 'year'
+        tz (ZoneInfo): Fuseau des périodes (défaut settings.TIME_ZONE)
+
+    Returns:
+        dict: {'periods': [date locale], 'granularity': str,
+               'added': {statut: [n]}, 'stock': {statut: [n]}}
+    """
+    db = get_mongodb_connection()
+    tz = tz or get_timezone()
+    periods, granularity, window_start, end = _evolution_window(period, granularity, tz)
+    snapshot = get_snapshot(db)
+    if snapshot is not None:
+        added, stock = snapshot.evolution(window_start, end, periods, tz)
+    else:
+        pipeline = _evolution_stages(window_start, end, granularity, tz)
+        added, stock = _evolution_series(
+            db['equipment'].aggregate(pipeline, allowDiskUse=True), periods, tz
+        )
+    return {'periods': periods, 'granularity': granularity, 'added': added, 'stock': stock}
+
+
+def _positive_value():
+    """Expression : purchase_value si c'est un nombre positif, sinon 0."""
+    return {'$cond': [
+        {'$and': [{'$isNumber': '$purchase_value'}, {'$gt': ['$purchase_value', 0]}]},
+        '$purchase_value',
+        0,
+    ]}
+
+
+def _summary_facet(db, query, window_start, end, periods, granularity, tz, top_locations):
+    """
+    Agrégation $facet du résumé : un seul parcours des équipements filtrés.
+
+    Returns:
+        tuple: (totaux, statuts, localisations, {date locale: créations}, (ajouts, stock))
+    """
+    pipeline = [
+        {'$match': query},
+        {'$facet': {
+            'totals': [
+                {'$group': {'_id': None, 'count': {'$sum': 1}, 'total_value': {'$sum': _positive_value()}}},
+            ],
+            'statuses': [
+                {'$group': {
+                    '_id': {'$ifNull': ['$normalized_status', STATUS_UNSPECIFIED]},
+                    'count': {'$sum': 1},
+                    'total_value': {'$sum': _positive_value()},
+                }},
+                {'$sort': {'count': -1, '_id': 1}},
+            ],
+            'locations': [
+                {'$match': {'location': {'$nin': [None, '']}}},
+                {'$group': {
+                    '_id': '$location',
+                    'count': {'$sum': 1},
+                    'total_value': {'$sum': _positive_value()},
+                }},
+                {'$sort': {'count': -1, '_id': 1}},
+                {'$limit': top_locations},
+            ],
+            # Ajouts par jour local, regroupés ensuite selon la plage couverte
+            'timeline': [
+                {'$match': {'creation_date': {'$type': 'date'}}},
+                {'$group': {
+                    '_id': bucketing.bucket_expression('creation_date', 'day', tz),
+                    'count': {'$sum': 1},
+                }},
+            ],
+            'evolution': _evolution_stages(window_start, end, granularity, tz),
+        }},
+    ]
+    result = next(db['equipment'].aggregate(pipeline, allowDiskUse=True))
+
+    totals = result['totals'][0] if result['totals'] else {'count': 0, 'total_value': 0}
+    daily = {bucketing.local_date(item['_id'], tz): item['count'] for item in result['timeline']}
+    return (
+        totals,
+        result['statuses'],
+        result['locations'],
+        daily,
+        _evolution_series(result['evolution'], periods, tz),
+    )
+
+
+def get_dashboard_summary(filters=None, period=None, granularity='month', tz=None, top_locations=10):
+    """
+    Calcule tous les indicateurs du tableau de bord en une seule agrégation.
+
+    Un $facet unique parcourt les équipements filtrés une fois et produit :
+    totaux, répartition par statut normalisé, localisations principales,
+    série des ajouts par période (comme group_by=creation_date) et évolution
+    du stock sur la fenêtre period (comme get_equipment_evolution).
+    Sans filtre, les mêmes indicateurs sont calculés sur l'instantané en
+    mémoire (dashboard.snapshot) lorsqu'il est à jour.
+
+    Args:
+        filters (dict): Filtres (comme get_equipments)
+        period (dict): Fenêtre de l'évolution (voir filters.parse_period)
+        granularity (str): Granularité de la série et de l'évolution
+        tz (ZoneInfo): Fuseau des périodes (défaut settings.TIME_ZONE)
+        top_locations (int): Nombre de localisations renvoyées
+
+    Returns:
+        dict: {'total', 'total_value', 'statuses', 'locations', 'timeline', 'evolution'}
+    """
+    db = get_mongodb_connection()
+    tz = tz or get_timezone()
+    periods, evolution_granularity, window_start, end = _evolution_window(period, granularity, tz)
+    query = build_equipment_query(filters)
+
+    # Sans filtre, tout est calculé sur l'instantané en mémoire s'il est à jour
+    snapshot = get_snapshot(db) if not query else None
+    statuses = snapshot.totals('status') if snapshot is not None else None
+    locations = snapshot.totals('location', limit=top_locations) if snapshot is not None else None
+    if statuses is not None and locations is not None:
+        count, total_value = snapshot.total()
+        totals = {'count': count, 'total_value': total_value}
+        daily = snapshot.daily_counts(tz)
+        added, stock = snapshot.evolution(window_start, end, periods, tz)
+    else:
+        totals, statuses, locations, daily, (added, stock) = _summary_facet(
+            db, query, window_start, end, periods, evolution_granularity, tz, top_locations
+        )
+
+    timeline, timeline_granularity = [], granularity
+    if daily:
+        start, end_day = min(daily), max(daily)
+        timeline_granularity = bucketing.choose_granularity(start, end_day, granularity)
+        counts = {}
+        for day, count in daily.items():
+            period_start = bucketing.truncate_date(day, timeline_granularity)
+            counts[period_start] = counts.get(period_start, 0) + count
+        timeline = bucketing.fill_gaps(counts, start, end_day, timeline_granularity)
+
+    return {
+        'total': totals['count'],
+        'total_value': totals['total_value'],
+        'statuses': statuses,
+        'locations': locations,
+        'timeline': {'granularity': timeline_granularity, 'buckets': timeline},
+        'evolution': {
+            'granularity': evolution_granularity,
+            'periods': periods,
+            'added': added,
+            'stock': stock,
+        },
+    }
+
+
+def get_equipment(equipment_id, fields=None, include=None, serialize=True):
     """
     Récupère un équipement par son ID
+    
+    fields limite les champs renvoyés (voir dashboard.projection).
+    include ajoute les relations demandées dans la même agrégation
+    (voir dashboard.relations).
+    serialize=False laisse ObjectId et dates natifs (rendus par MongoJSONRenderer).
     """
     try:
         db = get_mongodb_connection()
-        doc = db['equipment'].find_one({'_id': ObjectId(equipment_id)})
+        projection = build_projection(fields) or INTERNAL_FIELDS_PROJECTION
+        query = {'_id': {'$in': _id_values(equipment_id)}}
+        if include:
+            pipeline = [
+                {'$match': query},
+                {'$limit': 1},
+                {'$project': projection},
+            ] + relation_stages(include)
+            doc = next(db['equipment'].aggregate(pipeline), None)
+        else:
+            doc = db['equipment'].find_one(query, projection)
         
         if not doc:
             return None
-            
-        # Conversion de l'ObjectId en chaîne
-        doc['_id'] = str(doc['_id'])
-        
-        # Conversion des dates en chaînes ISO
-        date_fields = ['creation_date', 'dms', 'created_at', 'updated_at']
-        for field in date_fields:
-            if field in doc and isinstance(doc[field], datetime):
-                doc[field] = doc[field].isoformat()
-                
-        return doc
+        
+        # Conversion de l'ObjectId et des dates en chaînes
+        return _serialize_equipment(doc) if serialize else doc
     except:
         return None
 
+def get_equipments_batch(keys, key_field='_id', fields=None):
+    """
+    Récupère plusieurs équipements en une seule requête $in.
+    
+    Args:
+        keys (list): Identifiants ou codes-barres demandés
+        key_field (str): '_id' ou 'barcode'
+        fields (list): Champs renvoyés (voir dashboard.projection)
+        
+    Returns:
+        list: Un élément par clé demandée, dans l'ordre de la requête :
+        {'key', 'found': True, 'equipment'} ou {'key', 'found': False}
+    """
+    keys = [str(key).strip() for key in keys]
+    # Clés demandées par variante : une valeur stockée (ex. code-barres 12345.0)
+    # est rattachée aux clés dont elle égale une variante, comme dans le $in
+    owners = {}
+    for key in keys:
+        if not key:
+            continue
+        for value in (_id_values(key) if key_field == '_id' else _lookup_values(key)):
+            owners.setdefault(value, [])
+            if key not in owners[value]:
+                owners[value].append(key)
+    
+    found = {}
+    if owners:
+        db = get_mongodb_connection()
+        projection = build_projection(fields, extra=(key_field,)) or INTERNAL_FIELDS_PROJECTION
+        docs = db['equipment'].find({key_field: {'$in': list(owners)}}, projection).sort('_id', 1)
+        with timed_section('serialize'):
+            for doc in docs:
+                requested = owners.get(doc.get(key_field), ())
+                strip_unrequested([doc], fields, extra=(key_field,))
+                equipment = _serialize_equipment(doc)
+                for key in requested:
+                    # Premier document (par _id) pour une clé portée par plusieurs documents
+                    found.setdefault(key, equipment)
+    
+    results = []
+    for key in keys:
+        equipment = found.get(key)
+        if equipment is None:
+            results.append({'key': key, 'found': False})
+        else:
+            results.append({'key': key, 'found': True, 'equipment': equipment})
+    return results
+
 def get_equipment_relations(equipment_id, relation_type):
     """
     Récupère les relations d'un équipement (designations, families, etc.)
+    
+    Les collections 'equipment_<type>' écrites par l'import référencent
+    l'équipement par son _id sous forme de chaîne.
     """
-    db = get_mongodb_connection()
+    if relation_type not in RELATION_COLLECTIONS:
+        return None
     
-    # Vérifier que l'équipement existe
-    equipment = get_equipment(equipment_id)
+    equipment = get_equipment(equipment_id, fields=['_id'], include=[relation_type])
     if not equipment:
         return None
+    return equipment[relation_type]
+
+
+def _lookup_values(value):
+    """
+    Variantes exactes d'une valeur scannée : la chaîne telle quelle et, pour un code
+    numérique, l'entier correspondant (l'import pandas peut stocker des nombres).
+    """
+    values = [value]
+    if value.isdigit():
+        values.append(int(value))
+    return values
+
+
+def _dup_bases(value):
+    """
+    Préfixes des codes-barres '<code>_dup_N' d'une valeur scannée : le
+    dédoublonnage de l'import écrit '<code>' tel que stocké, soit '12345.0'
+    pour un code numérique lu en flottant par pandas.
+    """
+    bases = [value]
+    if value.isdigit():
+        bases.append(str(float(int(value))))
+    return bases
+
+
+def _lookup_key(value):
+    """
+    Valeur scannée correspondant à un code stocké (clé du cache de recherche) :
+    partie '<code>' d'un '<code>_dup_N', sans la décimale '.0' d'un code
+    numérique lu en flottant.
+    """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).rsplit('_dup_', 1)[0]
+    if value.endswith('.0') and value[:-2].isdigit():
+        value = value[:-2]
+    return value
+
+
+def _dup_suffix(barcode, bases):
+    """Rang N d'un code-barres de la forme '<base>_dup_N' (0 pour la valeur exacte)."""
+    if isinstance(barcode, str):
+        for base in bases:
+            if barcode.startswith(f'{base}_dup_'):
+                try:
+                    return int(barcode[len(base) + len('_dup_'):])
+                except ValueError:
+                    pass
+    return 0
+
+
+def lookup_equipment(field, value):
+    """
+    Recherche exacte et indexée d'un équipement par code-barres ou numéro de série.
+    
+    Le dédoublonnage de scripts/import_data.py renomme les codes-barres en double
+    en '<code>_dup_N' ('12345.0_dup_N' pour un code numérique importé en
+    flottant) : l'étiquette physique porte toujours '<code>'. Une recherche
+    par code-barres renvoie donc le document portant exactement la valeur scannée
+    dans 'result' et les documents '<code>_dup_N' dans 'duplicates' (par N
+    croissant), avec 'ambiguous' à True lorsqu'il en existe. Un code '<code>_dup_N'
+    saisi tel quel est trouvé exactement. Pour un numéro de série (non unique),
+    les autres documents de même série figurent aussi dans 'duplicates'.
+    
+    Les résultats sont mis en cache LOOKUP_CACHE_TTL secondes (60 par défaut)
+    dans la mémoire du processus : les écritures applicatives n'invalident que
+    le cache du processus qui les traite, les autres workers peuvent renvoyer
+    l'ancien résultat jusqu'à expiration.
     
-    # Selon le type de relation demandé
-    if relation_type == 'designations':
-        collection = db['designations']
-        return list(collection.find({'equipment_id': ObjectId(equipment_id)}))
+    Args:
+        field (str): 'barcode' ou 'serial'
+        value (str): Valeur scannée
+        
+    Returns:
+        dict: {'match', 'value', 'result', 'duplicates', 'ambiguous'} ou None si introuvable
+    """
+    value = value.strip()
+    if field not in LOOKUP_FIELDS or not value:
+        return None
     
-    elif relation_type == 'families':
-        collection = db['families']
-        return list(collection.find({'equipment_id': ObjectId(equipment_id)}))
+    key = (field, value)
+    cached = _lookup_cache.get(key)
+    if cached is not None:
+        return copy.deepcopy(cached['payload'])
     
-    elif relation_type == 'subfamilies':
-        collection = db['subfamilies']
-        return list(collection.find({'equipment_id': ObjectId(equipment_id)}))
+    db = get_mongodb_connection()
+    clauses = [{field: {'$in': _lookup_values(value)}}]
+    if field == 'barcode':
+        # Regex ancrées : parcours d'intervalle sur l'index barcode
+        clauses += [
+            {'barcode': {'$regex': f'^{re.escape(base)}_dup_[0-9]+$'}} for base in _dup_bases(value)
+        ]
+    query = clauses[0] if len(clauses) == 1 else {'$or': clauses}
     
-    elif relation_type == 'locations':
-        collection = db['locations']
-        return list(collection.find({'equipment_id': ObjectId(equipment_id)}))
+    docs = list(
+        db['equipment'].find(query, INTERNAL_FIELDS_PROJECTION)
+        .sort('_id', 1)
+        .limit(LOOKUP_MAX_MATCHES)
+    )
+    if not docs:
+        return None
     
-    return None
+    if field == 'barcode':
+        bases = _dup_bases(value)
+        docs.sort(key=lambda doc: _dup_suffix(doc.get('barcode'), bases))
+    docs = [_serialize_equipment(doc) for doc in docs]
+    
+    payload = {
+        'match': field,
+        'value': value,
+        'result': docs[0],
+        'duplicates': docs[1:],
+        'ambiguous': len(docs) > 1,
+    }
+    _lookup_cache.set(key, {'ids': {doc['_id'] for doc in docs}, 'payload': payload})
+    return copy.deepcopy(payload)
+
+
+def invalidate_lookup_cache(equipment_id=None, doc=None):
+    """
+    Retire du cache de recherche exacte les entrées concernant un équipement
+    (par son ID) et celles dont la clé correspond à ses codes (document écrit).
+    
+    Le cache est propre au processus : seul celui qui traite l'écriture est
+    invalidé, les autres attendent l'expiration (LOOKUP_CACHE_TTL).
+    """
+    if equipment_id is not None:
+        equipment_id = str(equipment_id)
+        _lookup_cache.delete_where(lambda entry: equipment_id in entry['ids'])
+    if doc:
+        for field in LOOKUP_FIELDS:
+            if doc.get(field) not in (None, ''):
+                value = str(doc[field])
+                _lookup_cache.delete((field, value))
+                _lookup_cache.delete((field, _lookup_key(doc[field])))
 
 
 def create_equipment(equipment_data):
@@ -156,10 +730,19 @@ def create_equipment(equipment_data):
         equipment_data['creation_date'] = now
         equipment_data['updated_at'] = now
         
+        # Champs techniques de recherche
+        equipment_data.update(build_search_fields(equipment_data))
+        
+        # Statut normalisé (voir dashboard.status)
+        equipment_data.update(build_status_fields(equipment_data))
+        
         # Insérer le nouvel équipement
         result = collection.insert_one(equipment_data)
         
         if result.inserted_id:
+            invalidate_lookup_cache(doc=equipment_data)
+            record_write(new_doc=equipment_data, db=db)
+            bump_version('equipment', db)
             return True, {'_id': str(result.inserted_id)}
         else:
             return False, {'error': 'Échec de la création de l\'équipement'}
@@ -184,12 +767,21 @@ def update_equipment(equipment_id, update_data):
         collection = db['equipment']
         
         # Vérifier que l'équipement existe
-        if not collection.find_one({'_id': ObjectId(equipment_id)}):
+        existing = collection.find_one({'_id': ObjectId(equipment_id)})
+        if not existing:
             return False, {'error': 'Équipement non trouvé'}
         
         # Mettre à jour la date de modification
         update_data['updated_at'] = datetime.utcnow()
         
+        # Recalculer les champs de recherche si un champ indexé change
+        if any(field in update_data for field in SEARCH_FIELDS):
+            update_data.update(build_search_fields({**existing, **update_data}))
+        
+        # Recalculer le statut normalisé si le statut change
+        if 'status' in update_data:
+            update_data.update(build_status_fields(update_data))
+        
         # Mettre à jour l'équipement
         result = collection.update_one(
             {'_id': ObjectId(equipment_id)},
@@ -197,6 +789,9 @@ def update_equipment(equipment_id, update_data):
         )
         
         if result.modified_count > 0:
+            invalidate_lookup_cache(equipment_id, doc={**existing, **update_data})
+            record_write(existing, {**existing, **update_data}, db=db)
+            bump_version('equipment', db)
             return True, {'message': 'Équipement mis à jour avec succès'}
         else:
             return False, {'error': 'Aucune modification effectuée'}
@@ -220,13 +815,17 @@ def delete_equipment(equipment_id):
         collection = db['equipment']
         
         # Vérifier que l'équipement existe
-        if not collection.find_one({'_id': ObjectId(equipment_id)}):
+        existing = collection.find_one({'_id': ObjectId(equipment_id)}, list(ROLLUP_SOURCE_FIELDS))
+        if not existing:
             return False, {'error': 'Équipement non trouvé'}
         
         # Supprimer l'équipement
         result = collection.delete_one({'_id': ObjectId(equipment_id)})
         
         if result.deleted_count > 0:
+            invalidate_lookup_cache(equipment_id)
+            record_write(old_doc=existing, db=db)
+            bump_version('equipment', db)
             return True, {'message': 'Équipement supprimé avec succès'}
         else:
             return False, {'error': 'Échec de la suppression de l\'équipement'}
@@ -1,10 +1,40 @@
+import re
 from bson import ObjectId
 from datetime import datetime
 from .db import get_mongodb_connection
+from .counting import fetch_page_with_total, get_total
+from .geo import GEO_SOURCE_FIELDS, build_geo_fields, geo_backfill_done, viewport_contains, viewport_query
+from .indexes import LOCATION_KEYSET_FIELDS
+from .keyset import InvalidCursor, fetch_keyset_page
+from .monitoring import timed_section
+from .projection import build_projection, strip_unrequested
+from .versions import bump_version
 
-def get_locations(filters=None, page=1, page_size=20, sort_field=None, sort_order=1, group_by=None):
+# Champs date convertis en chaînes ISO dans les réponses
+LOCATION_DATE_FIELDS = ['creation_date', 'imported_at']
+
+
+def _serialize_location(doc):
+    """
+    Convertit un document localisation pour la sérialisation JSON
+    (ObjectId en chaîne, dates en ISO 8601). Le document est modifié sur place.
+    """
+    doc['_id'] = str(doc['_id'])
+    for field in LOCATION_DATE_FIELDS:
+        if field in doc and isinstance(doc[field], datetime):
+            doc[field] = doc[field].isoformat()
+    return doc
+
+def get_locations(filters=None, page=1, page_size=20, sort_field=None, sort_order=1, group_by=None,
+                  cursor=None, count_mode='exact', fields=None, serialize=True):
     """
     Récupérer la liste des localisations avec filtrage et pagination
+    
+    Si cursor n'est pas None (chaîne vide pour la première page), la pagination
+    se fait par curseur (keyset) au lieu de skip/limit.
+    count_mode choisit le calcul du total (voir dashboard.counting).
+    fields limite les champs renvoyés (voir dashboard.projection).
+    serialize=False laisse ObjectId et dates natifs (rendus par MongoJSONRenderer).
     """
     try:
         db = get_mongodb_connection()
@@ -23,7 +53,7 @@ def get_locations(filters=None, page=1, page_size=20, sort_field=None, sort_orde
         if filters:
             # Filtres de recherche textuelle
             if 'site_name' in filters and filters['site_name']:
-                query['site_name'] = {'$regex': f'.*{filters["site_name"]}.*', '$options': 'i'}
+                query['site_name'] = {'$regex': re.escape(filters['site_name']), '$options': 'i'}
             
             # Filtres exacts
             for field in ['province', 'region', 'category', 'snrt_rs']:
@@ -60,61 +90,80 @@ def get_locations(filters=None, page=1, page_size=20, sort_field=None, sort_orde
             
             return formatted_results
         
-        # Si pas de groupement, on fait une requête normale avec pagination
-        # Compter le nombre total de documents
-        total = collection.count_documents(query)
+        # Pagination par curseur : pas de skip ni de comptage
+        if cursor is not None:
+            sort_field = sort_field or 'site_name'
+            if sort_field != '_id' and sort_field not in LOCATION_KEYSET_FIELDS:
+                raise InvalidCursor(f'Tri non supporté en mode curseur: {sort_field}')
+            # La clé de tri doit figurer dans les documents pour construire les jetons
+            projection = build_projection(fields, extra=(sort_field,))
+            docs, next_token, prev_token = fetch_keyset_page(
+                collection, query, projection, sort_field, sort_order, page_size, cursor
+            )
+            # Jetons construits : la clé de tri ne reste que si elle a été demandée
+            strip_unrequested(docs, fields, extra=(sort_field,))
+            if serialize:
+                with timed_section('serialize'):
+                    docs = [_serialize_location(doc) for doc in docs]
+            return {
+                'page_size': page_size,
+                'next': next_token,
+                'prev': prev_token,
+                'results': docs
+            }
         
         # Configuration du tri
         sort = [(sort_field, sort_order)] if sort_field else [('site_name', 1)]
-        
-        # Récupération des données avec pagination
         skip = (page - 1) * page_size
-        cursor = collection.find(query).sort(sort).skip(skip).limit(page_size)
+        projection = build_projection(fields)
         
-        # Conversion des ObjectId en chaînes pour la sérialisation JSON
-        locations = []
-        for doc in cursor:
-            doc['_id'] = str(doc['_id'])
-            
-            # Conversion des dates en chaînes ISO
-            date_fields = ['creation_date', 'imported_at']
-            for field in date_fields:
-                if field in doc and isinstance(doc[field], datetime):
-                    doc[field] = doc[field].isoformat()
+        if count_mode == 'facet':
+            # Page et total exact en un seul aller-retour
+            docs, total = fetch_page_with_total(collection, query, projection, sort, skip, page_size)
+            approximate = False
+        else:
+            # Compter le nombre total de documents (exact, estimé ou mis en cache).
+            # Le filtre de base écarte des documents : l'estimation de la collection
+            # entière ne s'applique jamais, le total sans filtre passe par le cache
+            total, approximate = get_total(collection, query, count_mode, unfiltered=not query)
             
-            locations.append(doc)
+            # Récupération des données avec pagination
+            docs = list(collection.find(query, projection).sort(sort).skip(skip).limit(page_size))
+        
+        # Conversion des ObjectId et des dates pour la sérialisation JSON
+        if serialize:
+            with timed_section('serialize'):
+                docs = [_serialize_location(doc) for doc in docs]
         
         return {
             'total': total,
+            'total_approximate': approximate,
             'page': page,
             'page_size': page_size,
-            'results': locations
+            'results': docs
         }
     
+    except InvalidCursor:
+        raise
     except Exception as e:
         return {'error': str(e)}
 
-def get_location(location_id):
+def get_location(location_id, fields=None, serialize=True):
     """
     Récupère une localisation par son ID
+    
+    fields limite les champs renvoyés (voir dashboard.projection).
+    serialize=False laisse ObjectId et dates natifs (rendus par MongoJSONRenderer).
     """
     try:
         db = get_mongodb_connection()
-        doc = db['locations'].find_one({'_id': ObjectId(location_id)})
+        doc = db['locations'].find_one({'_id': ObjectId(location_id)}, build_projection(fields))
         
         if not doc:
             return None
-            
-        # Conversion de l'ObjectId en chaîne
-        doc['_id'] = str(doc['_id'])
         
-        # Conversion des dates en chaînes ISO
-        date_fields = ['creation_date', 'imported_at']
-        for field in date_fields:
-            if field in doc and isinstance(doc[field], datetime):
-                doc[field] = doc[field].isoformat()
-                
-        return doc
+        # Conversion de l'ObjectId et des dates en chaînes
+        return _serialize_location(doc) if serialize else doc
     except:
         return None
 
@@ -155,10 +204,14 @@ def create_location(location_data):
         location_data['creation_date'] = now
         location_data['imported_at'] = now
         
+        # Position canonique (voir dashboard.geo)
+        location_data.update(build_geo_fields(location_data))
+        
         # Insérer la nouvelle localisation
         result = collection.insert_one(location_data)
         
         if result.inserted_id:
+            bump_version('locations', db)
             return True, {'_id': str(result.inserted_id)}
         else:
             return False, {'error': 'Échec de la création de la localisation'}
@@ -175,12 +228,17 @@ def update_location(location_id, update_data):
         collection = db['locations']
         
         # Vérifier que la localisation existe
-        if not collection.find_one({'_id': ObjectId(location_id)}):
+        existing = collection.find_one({'_id': ObjectId(location_id)})
+        if not existing:
             return False, {'error': 'Localisation non trouvée'}
         
         # Mettre à jour la date de modification
         update_data['updated_at'] = datetime.utcnow()
         
+        # Recalculer la position si des coordonnées changent
+        if any(field in update_data for field in GEO_SOURCE_FIELDS):
+            update_data.update(build_geo_fields({**existing, **update_data}))
+        
         # Mettre à jour la localisation
         result = collection.update_one(
             {'_id': ObjectId(location_id)},
@@ -188,6 +246,7 @@ def update_location(location_id, update_data):
         )
         
         if result.modified_count > 0:
+            bump_version('locations', db)
             return True, {'message': 'Localisation mise à jour avec succès'}
         else:
             return False, {'error': 'Aucune modification effectuée'}
@@ -211,6 +270,7 @@ def delete_location(location_id):
         result = collection.delete_one({'_id': ObjectId(location_id)})
         
         if result.deleted_count > 0:
+            bump_version('locations', db)
             return True, {'message': 'Localisation supprimée avec succès'}
         else:
             return False, {'error': 'Échec de la suppression de la localisation'}
@@ -279,69 +339,64 @@ def get_locations_statistics():
     except Exception as e:
         return {'error': str(e)}
 
-def get_locations_for_map():
+def get_locations_for_map(viewport=None):
     """
-    Récupère les localisations avec coordonnées pour affichage sur carte
+    Récupère les localisations positionnées pour affichage sur carte
+    
+    Args:
+        viewport (tuple): Zone (ouest, sud, est, nord) en degrés, voir
+            geo.parse_viewport ; None pour toutes les localisations
+    
+    Les positions sont lues dans le champ canonique geo (voir dashboard.geo).
+    Tant que scripts/backfill_location_geo.py n'a pas été exécuté, les
+    localisations sans champ geo sont aussi lues et positionnées depuis leurs
+    anciens champs de coordonnées.
     """
     try:
         db = get_mongodb_connection()
         collection = db['locations']
         
-        # Récupérer les localisations avec coordonnées sous différents schémas possibles
-        query = {
-            '$or': [
-                {'coordinates.latitude': {'$ne': None}, 'coordinates.longitude': {'$ne': None}},
-                {'lat': {'$ne': None}, 'lng': {'$ne': None}},
-                {'latitude': {'$ne': None}, 'longitude': {'$ne': None}},
-            ]
-        }
+        # Zone d'affichage : $geoWithin servi par l'index 2dsphere
+        query = viewport_query(viewport) if viewport else {'geo': {'$ne': None}}
         
         projection = {
             'site_name': 1,
             'province': 1,
             'region': 1,
             'category': 1,
-            'coordinates': 1,
-            'lat': 1,
-            'lng': 1,
-            'latitude': 1,
-            'longitude': 1,
+            'geo': 1,
+            'coordinates.altitude': 1,
             'services': 1
         }
         
-        locations = list(collection.find(query, projection))
+        legacy = not geo_backfill_done(db)
+        if legacy:
+            # Localisations antérieures au champ geo : position calculée ici
+            query = {'$or': [query, {'geo': {'$exists': False}}]}
+            projection.pop('coordinates.altitude')
+            projection.update({field: 1 for field in GEO_SOURCE_FIELDS})
         
         # Formater pour la carte
         map_data = []
-        for loc in locations:
-            # Extraire lat/lng sous différentes clés et convertir en float
-            lat = None
-            lng = None
-            if isinstance(loc.get('coordinates'), dict):
-                lat = loc['coordinates'].get('latitude', lat)
-                lng = loc['coordinates'].get('longitude', lng)
-            lat = loc.get('lat', lat)
-            lng = loc.get('lng', lng)
-            lat = loc.get('latitude', lat)
-            lng = loc.get('longitude', lng)
-
-            try:
-                lat_f = float(lat) if lat is not None else None
-                lng_f = float(lng) if lng is not None else None
-            except (TypeError, ValueError):
-                lat_f, lng_f = None, None
-
-            if lat_f is None or lng_f is None:
+        for loc in collection.find(query, projection):
+            geo = loc.get('geo')
+            if geo is None and legacy:
+                geo = build_geo_fields(loc)['geo']
+            if geo is None:
                 continue
-
+            lng, lat = geo['coordinates']
+            # Écarter les points de la marge ajoutée autour de la zone
+            if viewport and not viewport_contains(viewport, lng, lat):
+                continue
+            
             map_data.append({
                 '_id': str(loc['_id']),
                 'name': loc.get('site_name', ''),
                 'province': loc.get('province', ''),
                 'region': loc.get('region', ''),
                 'category': loc.get('category', ''),
-                'lat': lat_f,
-                'lng': lng_f,
+                'lat': lat,
+                'lng': lng,
                 'altitude': (loc.get('coordinates') or {}).get('altitude'),
                 'services': loc.get('services', {})
             })
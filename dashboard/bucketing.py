@@ -0,0 +1,117 @@
+"""
+Regroupement temporel des équipements (group_by sur un champ date).
+
+Les dates sont tronquées côté serveur avec $dateTrunc dans le fuseau demandé,
+puis les périodes vides sont complétées ici pour que le graphique reçoive une
+série continue. Le nombre de périodes est plafonné : si la plage couverte
+dépasse le plafond, la granularité est élargie (jour → semaine → mois…).
+"""
+import os
+from datetime import date, timedelta, timezone
+
+# Granularités de la plus fine à la plus large
+GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+
+# Nombre maximal de périodes renvoyées
+MAX_BUCKETS = int(os.getenv('TIMELINE_MAX_BUCKETS', 500))
+
+# Longueur approximative d'une période en jours (choix de la granularité)
+_APPROX_DAYS = {'day': 1, 'week': 7, 'month': 31, 'quarter': 92, 'year': 366}
+
+
+def truncate_date(day, granularity):
+    """Début (date locale) de la période contenant day."""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if granularity == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_period(day, granularity):
+    """Début de la période suivante."""
+    if granularity == 'day':
+        return day + timedelta(days=1)
+    if granularity == 'week':
+        return day + timedelta(weeks=1)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def choose_granularity(start, end, granularity, max_buckets=MAX_BUCKETS):
+    """
+    Élargit la granularité tant que la plage [start, end] dépasse le plafond.
+
+    Args:
+        start, end (date): Bornes locales de la plage couverte
+        granularity (str): Granularité demandée
+
+    Returns:
+        str: Granularité effective
+    """
+    span = (end - start).days + 1
+    for candidate in GRANULARITIES[GRANULARITIES.index(granularity):]:
+        if span / _APPROX_DAYS[candidate] <= max_buckets:
+            return candidate
+    return GRANULARITIES[-1]
+
+
+def bucket_expression(field, granularity, tz):
+    """Expression $dateTrunc tronquant field dans le fuseau tz."""
+    expression = {'date': f'${field}', 'unit': granularity, 'timezone': tz.key}
+    if granularity == 'week':
+        # Semaines ISO (lundi), comme truncate_date()
+        expression['startOfWeek'] = 'monday'
+    return {'$dateTrunc': expression}
+
+
+def local_date(value, tz):
+    """Date locale (dans tz) d'un datetime renvoyé par MongoDB."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(tz).date()
+
+
+def iter_periods(start, end, granularity, max_buckets=MAX_BUCKETS):
+    """Débuts (dates locales) des périodes couvrant [start, end]."""
+    current = truncate_date(start, granularity)
+    last = truncate_date(end, granularity)
+    count = 0
+    while current <= last and count < max_buckets:
+        yield current
+        current = next_period(current, granularity)
+        count += 1
+
+
+def period_label(day, granularity):
+    """Libellé d'une période : '2024-03-11', '2024-03', '2024-T1' ou '2024'."""
+    if granularity == 'month':
+        return day.strftime('%Y-%m')
+    if granularity == 'quarter':
+        return f'{day.year}-T{(day.month - 1) // 3 + 1}'
+    if granularity == 'year':
+        return str(day.year)
+    return day.isoformat()
+
+
+def fill_gaps(counts, start, end, granularity, max_buckets=MAX_BUCKETS):
+    """
+    Construit la série continue des périodes entre start et end.
+
+    Args:
+        counts (dict): {date locale de début de période: nombre}
+        start, end (date): Bornes locales de la plage couverte
+
+    Returns:
+        list: [{'_id': 'YYYY-MM-DD', 'count': int}, ...] (au plus max_buckets)
+    """
+    return [
+        {'_id': period.isoformat(), 'count': counts.get(period, 0)}
+        for period in iter_periods(start, end, granularity, max_buckets)
+    ]
+
@@ -0,0 +1,157 @@
+"""
+Regroupement (clustering) des localisations de la carte par tuile.
+
+La carte demande des tuiles web (z, x, y) comme pour son fond de carte. Dans
+chaque tuile, les sites sont regroupés sur une grille de CLUSTER_CELL_SIZE
+pixels, alignée sur la projection Web Mercator : une cellule n'est jamais à
+cheval sur deux tuiles, les groupes ne sont donc ni coupés ni dupliqués. Une
+cellule d'un seul site renvoie le site lui-même ; au-delà de
+CLUSTER_MAX_ZOOM, tous les sites sont renvoyés individuellement.
+
+Les positions (champ geo, voir dashboard.geo) et les services de tous les
+sites sont chargés une fois par version de la collection 'locations' dans un
+index en mémoire (propre à chaque processus) ; chaque tuile est ensuite
+calculée sans requête MongoDB, puis mise en cache par le cache des réponses
+(clé incluant la version : une modification de localisation invalide les
+tuiles).
+"""
+import math
+import os
+import threading
+
+import numpy as np
+
+from .db import get_mongodb_connection
+from .geo import MAX_ZOOM
+from .versions import get_version
+
+# Taille d'une tuile et d'une cellule de regroupement (pixels)
+TILE_SIZE = 256
+CLUSTER_CELL_SIZE = int(os.getenv('CLUSTER_CELL_SIZE', 64))
+# Niveau de zoom à partir duquel les sites ne sont plus regroupés
+CLUSTER_MAX_ZOOM = int(os.getenv('CLUSTER_MAX_ZOOM', 14))
+
+# Services comptés dans chaque groupe
+CLUSTER_SERVICES = ('tnt', 'fm', 'am')
+
+# Latitude maximale de la projection Web Mercator
+_MAX_MERCATOR_LATITUDE = 85.05112878
+
+_index = None
+_index_lock = threading.Lock()
+
+
+class InvalidTile(ValueError):
+    """Coordonnées de tuile hors de la grille du niveau de zoom."""
+
+
+class _SiteIndex:
+    """Positions (Web Mercator normalisé, [0, 1)) et services des sites positionnés."""
+
+    def __init__(self, version, docs):
+        self.version = version
+        self.sites = []
+        lngs, lats = [], []
+        services = {service: [] for service in CLUSTER_SERVICES}
+        for doc in docs:
+            lng, lat = doc['geo']['coordinates']
+            doc_services = doc.get('services') or {}
+            self.sites.append({
+                '_id': str(doc['_id']),
+                'name': doc.get('site_name', ''),
+                'province': doc.get('province', ''),
+                'region': doc.get('region', ''),
+                'category': doc.get('category', ''),
+                'lat': lat,
+                'lng': lng,
+                'services': doc_services,
+            })
+            lngs.append(lng)
+            lats.append(lat)
+            for service in CLUSTER_SERVICES:
+                services[service].append(bool(doc_services.get(service)))
+
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.x, self.y = _mercator(self.lngs, self.lats)
+        self.services = {service: np.asarray(values, dtype=bool) for service, values in services.items()}
+
+
+def _mercator(lngs, lats):
+    """Coordonnées Web Mercator normalisées ([0, 1), origine en haut à gauche)."""
+    lats = np.radians(np.clip(lats, -_MAX_MERCATOR_LATITUDE, _MAX_MERCATOR_LATITUDE))
+    x = (lngs + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lats) + 1.0 / np.cos(lats)) / math.pi) / 2.0
+    # Le bord droit (lng = 180) appartient à la première tuile
+    return np.mod(x, 1.0), np.clip(y, 0.0, np.nextafter(1.0, 0.0))
+
+
+def _get_index(db):
+    """Index des sites à jour de la version courante de 'locations'."""
+    global _index
+    version = get_version('locations', db)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            projection = {'site_name': 1, 'province': 1, 'region': 1, 'category': 1, 'geo': 1, 'services': 1}
+            docs = db['locations'].find({'geo': {'$ne': None}}, projection)
+            _index = _SiteIndex(version, docs)
+        return _index
+
+
+def get_tile_clusters(z, x, y, db=None):
+    """
+    Groupes et sites isolés d'une tuile.
+
+    Args:
+        z, x, y (int): Coordonnées de la tuile (schéma XYZ de Leaflet/OSM)
+
+    Returns:
+        dict: {'z', 'x', 'y', 'clusters': [{'lat', 'lng', 'count', 'services',
+               'bounds'}], 'sites': [site]} ; bounds vaut
+               [ouest, sud, est, nord] des sites du groupe
+
+    Raises:
+        InvalidTile: si la tuile n'existe pas à ce niveau de zoom
+    """
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise InvalidTile(f'Tuile inexistante: {z}/{x}/{y}')
+
+    db = db if db is not None else get_mongodb_connection()
+    index = _get_index(db)
+
+    # Pixels des sites au niveau z, relatifs au coin de la tuile
+    scale = 2 ** z * TILE_SIZE
+    px = index.x * scale - x * TILE_SIZE
+    py = index.y * scale - y * TILE_SIZE
+    members = np.flatnonzero((px >= 0) & (px < TILE_SIZE) & (py >= 0) & (py < TILE_SIZE))
+
+    result = {'z': z, 'x': x, 'y': y, 'clusters': [], 'sites': []}
+    if z >= CLUSTER_MAX_ZOOM:
+        result['sites'] = [index.sites[i] for i in members]
+        return result
+
+    # Cellule de chaque site de la tuile
+    cells_per_row = TILE_SIZE // CLUSTER_CELL_SIZE
+    cells = (py[members] // CLUSTER_CELL_SIZE).astype(np.int64) * cells_per_row \
+        + (px[members] // CLUSTER_CELL_SIZE).astype(np.int64)
+    order = np.argsort(cells, kind='stable')
+    groups = np.split(members[order], np.flatnonzero(np.diff(cells[order])) + 1) if len(members) else []
+
+    for group in groups:
+        if len(group) == 1:
+            result['sites'].append(index.sites[group[0]])
+            continue
+        lngs, lats = index.lngs[group], index.lats[group]
+        result['clusters'].append({
+            'lat': float(lats.mean()),
+            'lng': float(lngs.mean()),
+            'count': int(len(group)),
+            'services': {
+                service: int(index.services[service][group].sum()) for service in CLUSTER_SERVICES
+            },
+            'bounds': [float(lngs.min()), float(lats.min()), float(lngs.max()), float(lats.max())],
+        })
+    return result
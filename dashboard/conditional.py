@@ -0,0 +1,134 @@
+"""
+Requêtes conditionnelles (ETag / Last-Modified) pilotées par les versions des
+collections (dashboard.versions).
+
+Une réponse de lecture ne dépend que de l'URL, de l'en-tête Accept et des
+données des collections lues. Toute écriture applicative incrémente la version
+de la collection concernée : l'ETag est donc calculé avant la vue, à partir de
+ces seuls éléments, et une requête If-None-Match (ou If-Modified-Since)
+satisfaite reçoit un 304 sans que la vue ni sa requête MongoDB ne soient
+exécutées. Le coût d'une revalidation est une lecture de 'collection_versions'.
+
+Les réponses qui dépendent aussi de la date du jour (fenêtres glissantes
+« 12 derniers mois ») déclarent time_relative=True ; une requête portant une
+plage relative (<champ>_range=today, last_30d...) en dépend aussi. Leur ETag
+change en plus à minuit, dans le fuseau de la requête (?tz=). Un fuseau
+invalide ne produit pas de validateurs : la vue répond son erreur 400.
+"""
+import hashlib
+import logging
+from datetime import datetime, time, timezone
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .filters import DATE_FILTER_FIELDS, InvalidFilter, get_timezone
+from .versions import get_versions_info
+
+logger = logging.getLogger(__name__)
+
+
+def time_components(request, time_relative=False):
+    """
+    Composante temporelle d'une réponse, commune à son ETag et à sa clé dans
+    le cache des réponses (dashboard.response_cache).
+
+    Args:
+        request: Requête (plages relatives <champ>_range et fuseau ?tz=)
+        time_relative (bool): La réponse dépend de la date du jour
+
+    Returns:
+        tuple: (date du jour dans le fuseau de la requête au format ISO,
+        début de ce jour en secondes epoch), ou (None, None) si la réponse
+        ne dépend pas de la date
+
+    Raises:
+        InvalidFilter: si le fuseau ?tz= est invalide
+    """
+    if not time_relative and not any(request.GET.get(f'{field}_range') for field in DATE_FILTER_FIELDS):
+        return None, None
+    # Fenêtres glissantes et plages relatives recalculées à chaque changement de jour local
+    tz = get_timezone(request.GET.get('tz'))
+    today = datetime.now(timezone.utc).astimezone(tz).date()
+    return today.isoformat(), int(datetime.combine(today, time.min, tzinfo=tz).timestamp())
+
+
+def compute_validators(name, collections, request, time_relative=False):
+    """
+    Calcule l'ETag fort et la date Last-Modified d'une réponse.
+
+    Args:
+        name (str): Nom de l'endpoint
+        collections (tuple): Collections dont dépend la réponse
+        request: Requête (chemin, paramètres et en-tête Accept)
+        time_relative (bool): La réponse dépend de la date du jour (les
+            plages relatives <champ>_range sont détectées dans la requête)
+
+    Returns:
+        tuple: (etag, last_modified en secondes epoch ou None)
+    """
+    versions, updated_at = get_versions_info(collections)
+    last_modified = int(updated_at.timestamp()) if updated_at else None
+
+    day, started_at = time_components(request, time_relative)
+    if started_at is not None:
+        last_modified = max(last_modified or 0, started_at)
+
+    payload = repr((
+        name,
+        request.path,
+        sorted(request.GET.lists()),
+        request.META.get('HTTP_ACCEPT', ''),
+        sorted(versions.items()),
+        day,
+    ))
+    etag = f'"{hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]}"'
+    return etag, last_modified
+
+
+def conditional_response(name, collections, time_relative=False):
+    """
+    Décorateur de vue (fonction) ajoutant ETag et Last-Modified aux réponses
+    200 et répondant 304 aux requêtes conditionnelles satisfaites.
+
+    Les vues basées sur une classe l'utilisent via
+    method_decorator(..., name='get'). Placé au-dessus de cached_response, le
+    304 est renvoyé avant même la consultation du cache.
+
+    Args:
+        name (str): Nom de l'endpoint
+        collections (tuple): Collections dont dépend la réponse
+        time_relative (bool): La réponse dépend de la date du jour
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            try:
+                etag, last_modified = compute_validators(name, collections, request, time_relative)
+            except InvalidFilter:
+                # Fuseau ?tz= invalide : la vue renvoie l'erreur de validation
+                return view(request, *args, **kwargs)
+            except Exception:
+                # Versions illisibles (MongoDB indisponible) : la vue gère l'erreur
+                logger.exception('Validateurs indisponibles pour %s', name)
+                return view(request, *args, **kwargs)
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Accept',))
+            # Revalidation systématique : pas de fraîcheur heuristique côté navigateur
+            patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,84 @@
+"""
+Stratégies de calcul du total des listes paginées.
+
+- 'exact'     : count_documents() puis find() (deux allers-retours, comportement historique)
+- 'facet'     : page et total dans une seule agrégation $facet (un aller-retour)
+- 'estimated' : estimated_document_count() (métadonnées) si aucun filtre, sinon 'cached'
+- 'cached'    : count_documents() mis en cache quelques secondes par filtre normalisé
+
+Les totaux issus de l'estimation ou du cache sont signalés comme approximatifs.
+"""
+import os
+
+from bson import json_util
+
+from .lru import LRUCache
+
+COUNT_MODES = ('exact', 'facet', 'estimated', 'cached')
+
+# Durée de vie (secondes) des totaux mis en cache
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', 30))
+
+_count_cache = LRUCache(maxsize=512, ttl=COUNT_CACHE_TTL)
+
+
+def _cache_key(collection, query):
+    """Clé de cache : collection + filtre sérialisé de façon canonique."""
+    return f'{collection.full_name}:{json_util.dumps(query, sort_keys=True)}'
+
+
+def get_total(collection, query, count_mode='exact', unfiltered=False):
+    """
+    Calcule le total des documents correspondant à la requête.
+
+    Args:
+        collection: Collection PyMongo
+        query (dict): Filtre MongoDB
+        count_mode (str): 'exact', 'estimated' ou 'cached'
+        unfiltered (bool): True si la requête ne restreint pas la collection
+
+    Returns:
+        tuple: (total, approximate)
+    """
+    if count_mode == 'estimated' and unfiltered:
+        return collection.estimated_document_count(), True
+
+    if count_mode in ('estimated', 'cached'):
+        key = _cache_key(collection, query)
+        total = _count_cache.get(key)
+        if total is not None:
+            return total, True
+        total = collection.count_documents(query)
+        _count_cache.set(key, total)
+        return total, False
+
+    return collection.count_documents(query), False
+
+
+def fetch_page_with_total(collection, query, projection, sort, skip, limit):
+    """
+    Récupère une page et le total exact en une seule agrégation $facet.
+
+    Le $match initial profite des index ; le tri s'effectue ensuite sur les
+    documents filtrés, ce mode convient donc surtout aux filtres sélectifs.
+
+    Returns:
+        tuple: (documents, total)
+    """
+    page_stages = [{'$sort': dict(sort)}]
+    if skip:
+        page_stages.append({'$skip': skip})
+    page_stages.append({'$limit': limit})
+    if projection:
+        page_stages.append({'$project': projection})
+
+    pipeline = [
+        {'$match': query},
+        {'$facet': {
+            'results': page_stages,
+            'total': [{'$count': 'n'}],
+        }},
+    ]
+    result = next(collection.aggregate(pipeline, allowDiskUse=True), None) or {}
+    total = result['total'][0]['n'] if result.get('total') else 0
+    return result.get('results', []), total
@@ -1,7 +1,9 @@
+import atexit
 import os
 import sys
+import threading
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import ConnectionFailure, PyMongoError
 
 # Ajouter le répertoire parent au chemin Python
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -10,6 +12,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from dotenv import load_dotenv
 load_dotenv()
 
+from .monitoring import command_listener
+
 # Configuration MongoDB
 MONGODB_CONFIG = {
     'default': {
@@ -17,40 +21,158 @@ MONGODB_CONFIG = {
         'host': os.getenv('DB_HOST', 'localhost'),
         'port': int(os.getenv('DB_PORT', 27017)),
         'tz_aware': True,
+        # Paramètres du pool de connexions (partagé par tout le processus)
+        'max_pool_size': int(os.getenv('DB_MAX_POOL_SIZE', 50)),
+        'min_pool_size': int(os.getenv('DB_MIN_POOL_SIZE', 0)),
+        'max_idle_time_ms': int(os.getenv('DB_MAX_IDLE_TIME_MS', 60000)),
+        # Timeouts (en millisecondes)
+        'server_selection_timeout_ms': int(os.getenv('DB_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        'connect_timeout_ms': int(os.getenv('DB_CONNECT_TIMEOUT_MS', 5000)),
+        'socket_timeout_ms': int(os.getenv('DB_SOCKET_TIMEOUT_MS', 30000)),
+        'heartbeat_frequency_ms': int(os.getenv('DB_HEARTBEAT_FREQUENCY_MS', 10000)),
+        # Instrumentation des commandes (voir dashboard.monitoring)
+        'command_monitoring': os.getenv('DB_COMMAND_MONITORING', 'True') == 'True',
     }
 }
 
+# Registre des clients MongoDB, un par alias et par processus.
+# MongoClient est thread-safe et gère son propre pool : on le crée une seule fois
+# puis on le réutilise pour toutes les requêtes.
+_clients = {}
+_clients_lock = threading.Lock()
+_clients_pid = os.getpid()
+
+
+def _resolve_alias(connection_alias):
+    """Retourne l'alias effectivement utilisé (repli sur 'default')."""
+    return connection_alias if connection_alias in MONGODB_CONFIG else 'default'
+
+
+def _reset_after_fork():
+    """
+    Oublie les clients hérités du processus parent.
+
+    Un MongoClient n'est pas réutilisable après un fork (sockets et threads de
+    surveillance appartiennent au parent) : chaque worker d'un serveur pre-fork
+    (gunicorn, uWSGI) recrée donc paresseusement ses propres clients.
+    """
+    global _clients, _clients_lock, _clients_pid
+    _clients = {}
+    _clients_lock = threading.Lock()
+    _clients_pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _create_client(db_config):
+    """Construit un MongoClient à partir d'une entrée de MONGODB_CONFIG."""
+    event_listeners = [command_listener] if db_config.get('command_monitoring', True) else []
+    return MongoClient(
+        host=db_config['host'],
+        port=db_config['port'],
+        tz_aware=db_config.get('tz_aware', True),
+        maxPoolSize=db_config.get('max_pool_size', 50),
+        minPoolSize=db_config.get('min_pool_size', 0),
+        maxIdleTimeMS=db_config.get('max_idle_time_ms', 60000),
+        serverSelectionTimeoutMS=db_config.get('server_selection_timeout_ms', 5000),
+        connectTimeoutMS=db_config.get('connect_timeout_ms', 5000),
+        socketTimeoutMS=db_config.get('socket_timeout_ms', 30000),
+        heartbeatFrequencyMS=db_config.get('heartbeat_frequency_ms', 10000),
+        event_listeners=event_listeners,
+        connect=False,  # Connexion établie à la première opération
+    )
+
+
+def get_mongodb_client(connection_alias='default'):
+    """
+    Retourne le MongoClient partagé pour l'alias donné, en le créant au besoin.
+
+    Args:
+        connection_alias (str): Alias de la connexion à utiliser (par défaut: 'default')
+
+    Returns:
+        pymongo.MongoClient: Client MongoDB du processus courant
+    """
+    alias = _resolve_alias(connection_alias)
+
+    # Sécurité supplémentaire si register_at_fork n'est pas disponible
+    if _clients_pid != os.getpid():
+        _reset_after_fork()
+
+    client = _clients.get(alias)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(alias)
+        if client is None:
+            client = _create_client(MONGODB_CONFIG[alias])
+            _clients[alias] = client
+    return client
+
+
 def get_mongodb_connection(connection_alias='default'):
     """
-    Crée et retourne une connexion à la base de données MongoDB.
-    
+    Retourne la base de données MongoDB associée à l'alias.
+
+    Le client sous-jacent est mis en commun pour tout le processus : aucun ping ni
+    nouvelle connexion n'est effectué ici. Utiliser check_mongodb_health() pour
+    vérifier explicitement la disponibilité du serveur.
+
     Args:
         connection_alias (str): Alias de la connexion à utiliser (par défaut: 'default')
-        
+
     Returns:
         pymongo.database.Database: Instance de la base de données MongoDB
     """
     try:
-        # Récupérer la configuration MongoDB
-        db_config = MONGODB_CONFIG.get(connection_alias, MONGODB_CONFIG['default'])
-        
-        # Créer une connexion au serveur MongoDB
-        client = MongoClient(
-            host=db_config['host'],
-            port=db_config['port'],
-            tz_aware=db_config.get('tz_aware', True),
-            serverSelectionTimeoutMS=5000  # Timeout de 5 secondes
-        )
-        
-        # Tester la connexion
-        client.admin.command('ping')
-        
-        # Retourner la base de données spécifiée
-        return client[db_config['name']]
-        
-    except ConnectionFailure as e:
-        print(f"Échec de la connexion à MongoDB: {e}")
-        raise
+        alias = _resolve_alias(connection_alias)
+        client = get_mongodb_client(alias)
+        return client[MONGODB_CONFIG[alias]['name']]
+
     except Exception as e:
         print(f"Erreur inattendue lors de la connexion à MongoDB: {e}")
         raise
+
+
+def check_mongodb_health(connection_alias='default'):
+    """
+    Vérifie que le serveur MongoDB répond (commande ping).
+
+    Args:
+        connection_alias (str): Alias de la connexion à vérifier
+
+    Returns:
+        tuple: (ok, error) où ok est un booléen et error le message d'erreur éventuel
+    """
+    try:
+        get_mongodb_client(connection_alias).admin.command('ping')
+        return True, None
+    except ConnectionFailure as e:
+        print(f"Échec de la connexion à MongoDB: {e}")
+        return False, str(e)
+    except PyMongoError as e:
+        return False, str(e)
+
+
+def close_mongodb_connections():
+    """
+    Ferme tous les clients MongoDB du processus courant.
+    Appelée automatiquement à l'arrêt de l'interpréteur.
+    """
+    global _clients
+    with _clients_lock:
+        clients, _clients = _clients, {}
+    if _clients_pid != os.getpid():
+        # Clients hérités d'un autre processus : ne pas toucher à leurs sockets
+        return
+    for client in clients.values():
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+atexit.register(close_mongodb_connections)
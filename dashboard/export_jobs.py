@@ -0,0 +1,286 @@
+"""
+Exports asynchrones des équipements.
+
+Un export soumis devient une tâche exécutée dans un pool de threads borné :
+la requête HTTP rend la main immédiatement avec l'identifiant de la tâche, dont
+l'avancement (lignes écrites) est consultable pendant la génération.
+
+L'état des tâches est conservé dans la collection 'export_jobs' (visible de
+tous les processus du serveur, purgée par un index TTL). Les fichiers produits
+sont mis en cache sur disque sous une clé dérivée du format, des filtres
+normalisés et de la version de la collection 'equipment' (voir
+dashboard.versions) : un export identique sur des données inchangées est servi
+sans être régénéré. Le cache est borné en durée (TTL) et en taille (les
+fichiers les moins récemment servis sont supprimés en premier).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson import json_util
+
+from .db import get_mongodb_connection
+from .exports import iter_csv, iter_equipments, write_xlsx
+from .versions import get_version
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = 'export_jobs'
+
+# Formats disponibles : extension et type MIME
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+# Tâches exécutées simultanément par processus
+EXPORT_JOB_WORKERS = int(os.getenv('EXPORT_JOB_WORKERS', 2))
+
+# Cache disque des fichiers produits
+EXPORT_CACHE_DIR = os.getenv(
+    'EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'dem_dashboard_exports')
+)
+EXPORT_CACHE_TTL = int(os.getenv('EXPORT_CACHE_TTL', 3600))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_BYTES', 1024 ** 3))
+
+# Durée de conservation de l'état des tâches (index TTL)
+EXPORT_JOB_RETENTION = int(os.getenv('EXPORT_JOB_RETENTION', 86400))
+
+# Durée au-delà de laquelle une tâche non terminée est considérée comme abandonnée
+EXPORT_JOB_TIMEOUT = int(os.getenv('EXPORT_JOB_TIMEOUT', 3600))
+
+# Fréquence de mise à jour de l'avancement (en lignes)
+PROGRESS_EVERY = 5000
+
+_executor = None
+_executor_lock = threading.Lock()
+_indexes_ready = False
+
+
+def _get_executor():
+    """Pool de threads créé à la première soumission (un par processus)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=EXPORT_JOB_WORKERS, thread_name_prefix='export-job'
+            )
+        return _executor
+
+
+def _jobs():
+    """Collection des tâches, avec ses index créés au premier usage."""
+    global _indexes_ready
+    collection = get_mongodb_connection()[JOBS_COLLECTION]
+    if not _indexes_ready:
+        collection.create_index([('created_at', 1)], expireAfterSeconds=EXPORT_JOB_RETENTION)
+        collection.create_index([('cache_key', 1), ('status', 1)])
+        _indexes_ready = True
+    return collection
+
+
+def cache_key(export_format, filters):
+    """
+    Clé de cache d'un export : format, filtres normalisés et version des données.
+    """
+    payload = json_util.dumps({
+        'format': export_format,
+        'filters': filters or {},
+        'version': get_version('equipment'),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_path(key, export_format):
+    """Chemin du fichier en cache pour une clé."""
+    return os.path.join(EXPORT_CACHE_DIR, f'{key}.{EXPORT_FORMATS[export_format][0]}')
+
+
+def _cached_file(key, export_format):
+    """
+    Retourne le chemin du fichier en cache s'il existe et n'a pas expiré, en
+    marquant son dernier accès (politique LRU).
+    """
+    path = cache_path(key, export_format)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if time.time() - stat.st_mtime > EXPORT_CACHE_TTL:
+        _remove(path)
+        return None
+    os.utime(path, (time.time(), stat.st_mtime))
+    return path
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def prune_cache():
+    """
+    Supprime les fichiers expirés puis, si le cache dépasse sa taille maximale,
+    les moins récemment servis.
+    """
+    if not os.path.isdir(EXPORT_CACHE_DIR):
+        return
+    now = time.time()
+    entries = []
+    for entry in os.scandir(EXPORT_CACHE_DIR):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        if now - stat.st_mtime > EXPORT_CACHE_TTL:
+            # Fichier expiré, ou fichier partiel abandonné (.*.part)
+            _remove(entry.path)
+        elif not entry.name.startswith('.'):
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= EXPORT_CACHE_MAX_BYTES:
+            break
+        _remove(path)
+        total -= size
+
+
+def _serialize_job(job):
+    """Convertit un document de tâche pour la réponse de l'API."""
+    return {
+        'id': job['_id'],
+        'format': job['format'],
+        'status': job['status'],
+        'rows': job.get('rows', 0),
+        'cached': job.get('cached', False),
+        'error': job.get('error'),
+        'created_at': job['created_at'].isoformat(),
+        'finished_at': job['finished_at'].isoformat() if job.get('finished_at') else None,
+    }
+
+
+def submit_export(export_format, filters=None):
+    """
+    Soumet un export. Si le fichier est déjà en cache, la tâche est créée
+    terminée ; si un export identique est en cours, sa tâche est renvoyée.
+
+    Args:
+        export_format (str): 'csv' ou 'xlsx'
+        filters (dict): Filtres (comme get_equipments)
+
+    Returns:
+        dict: État de la tâche
+    """
+    key = cache_key(export_format, filters)
+    jobs = _jobs()
+    now = datetime.now(timezone.utc)
+
+    if _cached_file(key, export_format):
+        job = {
+            '_id': uuid.uuid4().hex, 'format': export_format, 'cache_key': key,
+            'status': 'done', 'cached': True, 'rows': None,
+            'created_at': now, 'finished_at': now,
+        }
+        # Reprendre le nombre de lignes de la tâche qui a produit le fichier
+        previous = jobs.find_one({'cache_key': key, 'status': 'done', 'rows': {'$ne': None}},
+                                 {'rows': 1}, sort=[('finished_at', -1)])
+        job['rows'] = previous['rows'] if previous else None
+        jobs.insert_one(job)
+        return _serialize_job(job)
+
+    running = jobs.find_one({
+        'cache_key': key,
+        'status': {'$in': ['pending', 'running']},
+        # Une tâche plus ancienne a été interrompue (redémarrage du processus)
+        'created_at': {'$gte': now - timedelta(seconds=EXPORT_JOB_TIMEOUT)},
+    })
+    if running:
+        return _serialize_job(running)
+
+    job = {
+        '_id': uuid.uuid4().hex, 'format': export_format, 'cache_key': key,
+        'filters': json_util.dumps(filters or {}), 'status': 'pending', 'rows': 0,
+        'created_at': now,
+    }
+    jobs.insert_one(job)
+    _get_executor().submit(_run_export, job['_id'], export_format, filters, key)
+    return _serialize_job(job)
+
+
+class _ProgressCounter:
+    """Relaie les documents en publiant l'avancement toutes les PROGRESS_EVERY lignes."""
+
+    def __init__(self, docs, job_id, jobs):
+        self.docs = docs
+        self.job_id = job_id
+        self.jobs = jobs
+        self.rows = 0
+
+    def __iter__(self):
+        for doc in self.docs:
+            yield doc
+            self.rows += 1
+            if self.rows % PROGRESS_EVERY == 0:
+                self.jobs.update_one({'_id': self.job_id}, {'$set': {'rows': self.rows}})
+
+
+def _run_export(job_id, export_format, filters, key):
+    """Exécute une tâche d'export (dans le pool de threads)."""
+    jobs = _jobs()
+    jobs.update_one({'_id': job_id}, {'$set': {'status': 'running'}})
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=EXPORT_CACHE_DIR, prefix='.', suffix='.part')
+    try:
+        docs = _ProgressCounter(iter_equipments(filters), job_id, jobs)
+        with os.fdopen(fd, 'wb') as output:
+            if export_format == 'xlsx':
+                write_xlsx(docs, output)
+            else:
+                for chunk in iter_csv(docs):
+                    output.write(chunk.encode('utf-8'))
+        # Publication atomique dans le cache
+        os.replace(tmp_path, cache_path(key, export_format))
+        jobs.update_one({'_id': job_id}, {'$set': {
+            'status': 'done', 'rows': docs.rows, 'finished_at': datetime.now(timezone.utc),
+        }})
+    except Exception as e:
+        logger.exception("Échec de l'export %s", job_id)
+        _remove(tmp_path)
+        jobs.update_one({'_id': job_id}, {'$set': {
+            'status': 'failed', 'error': str(e), 'finished_at': datetime.now(timezone.utc),
+        }})
+    finally:
+        prune_cache()
+
+
+def get_job(job_id):
+    """
+    Retourne l'état d'une tâche, ou None si elle est inconnue.
+    """
+    job = _jobs().find_one({'_id': job_id})
+    return _serialize_job(job) if job else None
+
+
+def get_job_file(job_id):
+    """
+    Retourne le fichier d'une tâche terminée.
+
+    Returns:
+        tuple: (chemin, type MIME, extension) ou None si indisponible
+    """
+    job = _jobs().find_one({'_id': job_id})
+    if not job or job['status'] != 'done':
+        return None
+    path = _cached_file(job['cache_key'], job['format'])
+    if not path:
+        return None
+    extension, content_type = EXPORT_FORMATS[job['format']]
+    return path, content_type, extension
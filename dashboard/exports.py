@@ -0,0 +1,397 @@
+"""
+Exports des équipements en flux.
+
+Les documents sont lus par lots (batch_size) sur un curseur projeté et écrits au
+fil de l'eau : la mémoire consommée ne dépend pas du nombre de lignes exportées
+et il n'y a plus de plafond de lignes. Les filtres sont ceux de l'API
+(build_equipment_query), donc servis par les mêmes index.
+
+Le CSV est envoyé au client pendant sa production. Un classeur XLSX ne peut être
+envoyé qu'une fois fermé : il est écrit ligne par ligne par XlsxWriter en mode
+constant_memory dans un fichier temporaire, puis servi depuis ce fichier.
+
+Les formats colonnes (Parquet, Arrow IPC) conservent les types (dates,
+nombres) : les documents sont regroupés en lots de colonnes typées
+(record batches) envoyés au fil de l'eau. Ils nécessitent pyarrow, importé
+seulement à la production d'un export de ce type.
+"""
+import csv
+import importlib.util
+import io
+import math
+import os
+import tempfile
+import zlib
+from datetime import datetime, timezone
+
+from bson import Decimal128, ObjectId
+
+from .api import build_equipment_query
+from .db import get_mongodb_connection
+
+# Colonnes exportées, dans l'ordre
+EQUIPMENT_EXPORT_FIELDS = [
+    '_id', 'model', 'brand', 'serial', 'barcode', 'status', 'location',
+    'family', 'subfamily', 'inventory_number', 'purchase_value',
+    'creation_date', 'updated_at',
+]
+
+# Documents lus par aller-retour sur le curseur
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 2000))
+
+# Lignes CSV regroupées par fragment envoyé au client
+CSV_ROWS_PER_CHUNK = 500
+
+# Lignes de données par feuille XLSX (limite Excel : 1 048 576 lignes, en-tête compris)
+XLSX_MAX_ROWS = 1048575
+
+# Format des colonnes date (heure UTC)
+XLSX_DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Identifiants toujours écrits en texte (pas de notation scientifique ni de zéros perdus)
+XLSX_TEXT_FIELDS = ('_id', 'serial', 'barcode', 'inventory_number')
+
+
+def iter_equipments(filters=None, fields=EQUIPMENT_EXPORT_FIELDS, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Parcourt les équipements filtrés sans les charger tous en mémoire.
+
+    Aucun tri n'est imposé : le planificateur reste libre de choisir l'index du
+    filtre le plus sélectif. Aucun comptage n'est effectué.
+
+    Yields:
+        dict: Documents bruts limités aux champs demandés
+    """
+    db = get_mongodb_connection()
+    projection = {field: 1 for field in fields}
+    cursor = db['equipment'].find(build_equipment_query(filters), projection).batch_size(batch_size)
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def _csv_value(value):
+    """Valeur d'une cellule CSV."""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    if isinstance(value, float) and not math.isfinite(value):
+        return ''
+    return value
+
+
+def iter_csv(docs, fieldnames=EQUIPMENT_EXPORT_FIELDS, rows_per_chunk=CSV_ROWS_PER_CHUNK):
+    """
+    Convertit un flux de documents en fragments CSV (en-tête compris).
+
+    Yields:
+        str: Fragment de CSV contenant au plus rows_per_chunk lignes
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fieldnames)
+    rows = 0
+    for doc in docs:
+        writer.writerow([_csv_value(doc.get(field)) for field in fieldnames])
+        rows += 1
+        if rows % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compresse un flux de fragments (bytes) au format gzip, fragment par fragment.
+
+    Yields:
+        bytes: Données gzip
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Indique si un en-tête Accept-Encoding autorise gzip.
+
+    Les poids q sont respectés : 'gzip;q=0' refuse gzip, et '*' ne s'applique
+    que si gzip n'est pas cité explicitement.
+    """
+    weights = {}
+    for item in (accept_encoding or '').split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        coding = coding.lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in weights:
+            return weights[coding] > 0
+    return False
+
+
+def _xlsx_sheet(workbook, index, fieldnames, header_format):
+    """Ajoute une feuille (Equipements, Equipements 2...) et écrit l'en-tête."""
+    name = 'Equipements' if index == 1 else f'Equipements {index}'
+    sheet = workbook.add_worksheet(name)
+    sheet.write_row(0, 0, fieldnames, header_format)
+    sheet.freeze_panes(1, 0)
+    return sheet
+
+
+def _xlsx_write_cell(sheet, row, col, value, date_format, as_text=False):
+    """Écrit une cellule avec son type Excel (nombre, date ou texte)."""
+    if value is None:
+        return
+    if as_text:
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        sheet.write_string(row, col, str(value))
+    elif isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        sheet.write_datetime(row, col, value, date_format)
+    elif isinstance(value, bool):
+        sheet.write_boolean(row, col, value)
+    elif isinstance(value, (int, float, Decimal128)):
+        number = float(value.to_decimal()) if isinstance(value, Decimal128) else value
+        if isinstance(number, float) and not math.isfinite(number):
+            return
+        sheet.write_number(row, col, number)
+    else:
+        sheet.write_string(row, col, str(value))
+
+
+def write_xlsx(docs, output, fieldnames=EQUIPMENT_EXPORT_FIELDS, max_rows=XLSX_MAX_ROWS):
+    """
+    Écrit un flux de documents dans un classeur XLSX en mémoire constante.
+
+    Au-delà de max_rows lignes, les suivantes sont écrites dans une nouvelle
+    feuille (avec son en-tête).
+
+    Args:
+        docs (iterable): Documents bruts
+        output: Chemin ou fichier binaire de destination
+        fieldnames (list): Colonnes exportées
+
+    Returns:
+        int: Nombre de lignes écrites
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'tmpdir': tempfile.gettempdir(),
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    header_format = workbook.add_format({'bold': True})
+    date_format = workbook.add_format({'num_format': XLSX_DATE_FORMAT})
+
+    text_columns = [field in XLSX_TEXT_FIELDS for field in fieldnames]
+    sheets = 1
+    sheet = _xlsx_sheet(workbook, sheets, fieldnames, header_format)
+    row = 0
+    total = 0
+    for doc in docs:
+        if row == max_rows:
+            sheets += 1
+            sheet = _xlsx_sheet(workbook, sheets, fieldnames, header_format)
+            row = 0
+        row += 1
+        for col, field in enumerate(fieldnames):
+            _xlsx_write_cell(sheet, row, col, doc.get(field), date_format, text_columns[col])
+        total += 1
+    workbook.close()
+    return total
+
+
+def export_xlsx_to_tempfile(filters=None):
+    """
+    Produit l'export XLSX des équipements filtrés dans un fichier temporaire.
+
+    Returns:
+        file: Fichier binaire positionné au début, supprimé à sa fermeture
+    """
+    output = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        write_xlsx(iter_equipments(filters), output)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    return output
+
+
+# Formats colonnes : type MIME et extension
+COLUMNAR_FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# Types des colonnes exportées en Parquet/Arrow (les autres sont des chaînes)
+COLUMNAR_DATE_FIELDS = ('creation_date', 'updated_at')
+COLUMNAR_NUMBER_FIELDS = ('purchase_value',)
+
+
+def columnar_available():
+    """Indique si pyarrow est installé (sans l'importer)."""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _arrow_schema(pa, fieldnames):
+    """Schéma Arrow des colonnes exportées."""
+    fields = []
+    for name in fieldnames:
+        if name in COLUMNAR_DATE_FIELDS:
+            fields.append(pa.field(name, pa.timestamp('ms', tz='UTC')))
+        elif name in COLUMNAR_NUMBER_FIELDS:
+            fields.append(pa.field(name, pa.float64()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _to_number(value):
+    """Nombre fini ou None (chaînes numériques acceptées)."""
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _to_text(value):
+    """Chaîne ou None ; les entiers stockés en flottant perdent leur partie décimale."""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        if value.is_integer():
+            value = int(value)
+    return str(value)
+
+
+def _to_timestamp(value):
+    """Datetime (UTC) ou None ; les valeurs d'un autre type sont ignorées."""
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def iter_record_batches(docs, fieldnames=EQUIPMENT_EXPORT_FIELDS, batch_rows=EXPORT_BATCH_SIZE):
+    """
+    Regroupe un flux de documents en lots de colonnes typées.
+
+    Yields:
+        pyarrow.RecordBatch: Lot d'au plus batch_rows lignes
+    """
+    import pyarrow as pa
+
+    schema = _arrow_schema(pa, fieldnames)
+    converters = [
+        _to_timestamp if name in COLUMNAR_DATE_FIELDS
+        else _to_number if name in COLUMNAR_NUMBER_FIELDS
+        else _to_text
+        for name in fieldnames
+    ]
+    columns = [[] for _ in fieldnames]
+    for doc in docs:
+        for column, name, convert in zip(columns, fieldnames, converters):
+            column.append(convert(doc.get(name)))
+        if len(columns[0]) >= batch_rows:
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            )
+            columns = [[] for _ in fieldnames]
+    if columns[0]:
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema,
+        )
+
+
+class _ChunkSink:
+    """Fichier en écriture seule dont le contenu est vidé après chaque lot."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_columnar(docs, export_format, fieldnames=EQUIPMENT_EXPORT_FIELDS):
+    """
+    Produit un export Parquet ou Arrow IPC (flux) en fragments d'octets.
+
+    Chaque lot devient un row group Parquet ou un message Arrow, envoyé dès
+    qu'il est écrit ; seul le lot courant est en mémoire.
+
+    Yields:
+        bytes: Fragment du fichier
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(pa, fieldnames)
+    sink = _ChunkSink()
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(
+            sink, schema, options=pa.ipc.IpcWriteOptions(compression='zstd')
+        )
+    for batch in iter_record_batches(docs, fieldnames):
+        writer.write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
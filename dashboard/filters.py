@@ -0,0 +1,210 @@
+"""
+Analyse des paramètres de filtrage de l'API équipements.
+
+Partagée par la liste (/api/equipments/) et les exports afin que tous
+appliquent exactement les mêmes filtres. Les bornes de dates sont converties en
+datetime UTC pour être comparées aux dates stockées (et servies par les index
+composés déclarés dans dashboard/indexes.py).
+
+Formats acceptés pour <champ>_gte / <champ>_lte :
+- date ISO 'YYYY-MM-DD' (une borne haute couvre toute la journée)
+- date-heure ISO 'YYYY-MM-DDTHH:MM[:SS][±HH:MM|Z]'
+
+Plages relatives via <champ>_range : 'today', 'yesterday', 'this_month',
+'this_year', 'last_<N>d', 'last_<N>w', 'last_<N>m', 'last_<N>y'.
+
+Les dates sans fuseau sont interprétées dans le fuseau ?tz= (nom IANA, par
+défaut settings.TIME_ZONE).
+"""
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+
+# Champs texte filtrables
+TEXT_FILTER_FIELDS = ('model', 'serial', 'barcode', 'status', 'location')
+
+# Champs date filtrables par plage
+DATE_FILTER_FIELDS = ('creation_date', 'dms')
+
+_RELATIVE_RANGE = re.compile(r'^last_(\d{1,4})([dwmy])$')
+
+
+class InvalidFilter(ValueError):
+    """Valeur de filtre impossible à interpréter."""
+
+
+def get_timezone(name=None):
+    """Retourne le fuseau demandé (ou celui des settings)."""
+    name = name or getattr(settings, 'TIME_ZONE', 'UTC') or 'UTC'
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise InvalidFilter(f'Fuseau horaire inconnu: {name}')
+
+
+def _start_of_day(day, tz):
+    """Début de journée locale, exprimé en UTC."""
+    return datetime.combine(day, time.min, tzinfo=tz).astimezone(timezone.utc)
+
+
+def _subtract_months(day, months):
+    """Recule une date d'un nombre de mois (jour borné à la fin du mois)."""
+    month_index = day.year * 12 + day.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    next_month = date(year + (month == 12), month % 12 + 1, 1)
+    last_day = (next_month - timedelta(days=1)).day
+    return date(year, month, min(day.day, last_day))
+
+
+def parse_date_bound(value, tz, upper=False):
+    """
+    Convertit une borne de date saisie en datetime UTC.
+
+    Returns:
+        tuple: (opérateur MongoDB, datetime UTC). Une date seule utilisée comme
+        borne haute devient '$lt' le lendemain à minuit pour inclure la journée.
+    """
+    value = value.strip()
+    try:
+        if len(value) == 10:
+            day = date.fromisoformat(value)
+            if upper:
+                return '$lt', _start_of_day(day + timedelta(days=1), tz)
+            return '$gte', _start_of_day(day, tz)
+
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise InvalidFilter(f'Date invalide: {value}')
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=tz)
+    return ('$lte' if upper else '$gte'), parsed.astimezone(timezone.utc)
+
+
+def parse_relative_range(value, tz, now=None):
+    """
+    Convertit une plage relative ('last_30d', 'this_month'…) en bornes UTC.
+
+    Returns:
+        dict: {'$gte': datetime, '$lt': datetime}
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(tz)
+    today = now.date()
+    tomorrow = _start_of_day(today + timedelta(days=1), tz)
+
+    if value == 'today':
+        return {'$gte': _start_of_day(today, tz), '$lt': tomorrow}
+    if value == 'yesterday':
+        return {'$gte': _start_of_day(today - timedelta(days=1), tz), '$lt': _start_of_day(today, tz)}
+    if value == 'this_month':
+        return {'$gte': _start_of_day(today.replace(day=1), tz), '$lt': tomorrow}
+    if value == 'this_year':
+        return {'$gte': _start_of_day(today.replace(month=1, day=1), tz), '$lt': tomorrow}
+
+    match = _RELATIVE_RANGE.match(value)
+    if not match:
+        raise InvalidFilter(f'Plage relative invalide: {value}')
+    amount, unit = int(match.group(1)), match.group(2)
+    if unit == 'd':
+        start = today - timedelta(days=amount)
+    elif unit == 'w':
+        start = today - timedelta(weeks=amount)
+    elif unit == 'm':
+        start = _subtract_months(today, amount)
+    else:
+        start = _subtract_months(today, amount * 12)
+    return {'$gte': _start_of_day(start, tz), '$lt': tomorrow}
+
+
+def parse_date_filters(query_params, tz=None):
+    """
+    Construit les filtres de dates typés à partir des paramètres de requête.
+
+    Returns:
+        dict: {champ: {'$gte': datetime, '$lt'/'$lte': datetime}}
+    """
+    tz = tz or get_timezone(query_params.get('tz'))
+    date_filters = {}
+    for param in DATE_FILTER_FIELDS:
+        bounds = {}
+        relative = query_params.get(f'{param}_range')
+        if relative:
+            bounds.update(parse_relative_range(relative.strip(), tz))
+        gte = query_params.get(f'{param}_gte')
+        if gte:
+            op, value = parse_date_bound(gte, tz)
+            bounds[op] = value
+        lte = query_params.get(f'{param}_lte')
+        if lte:
+            op, value = parse_date_bound(lte, tz, upper=True)
+            bounds.pop('$lt', None)
+            bounds[op] = value
+        if bounds:
+            date_filters[param] = bounds
+    return date_filters
+
+
+def parse_period(query_params, tz, default_months=12, max_months=600):
+    """
+    Fenêtre d'analyse à partir de ?from=, ?to= et ?months= (défaut : les
+    default_months derniers mois calendaires, jusqu'à aujourd'hui inclus).
+
+    from/to acceptent les formats de <champ>_gte/<champ>_lte ; sans from, la
+    fenêtre commence au premier jour du mois situé months - 1 mois avant celui
+    de la fin : elle couvre exactement months périodes mensuelles, le mois de
+    la fin compris.
+
+    Returns:
+        dict: {'$gte': datetime UTC, '$lt'/'$lte': datetime UTC}
+
+    Raises:
+        InvalidFilter: si une date, le nombre de mois ou la fenêtre est invalide
+    """
+    raw_months = query_params.get('months')
+    try:
+        months = int(raw_months) if raw_months else default_months
+    except ValueError:
+        raise InvalidFilter(f'Nombre de mois invalide: {raw_months}')
+    if not 1 <= months <= max_months:
+        raise InvalidFilter(f'Le nombre de mois doit être compris entre 1 et {max_months}')
+
+    to = query_params.get('to')
+    if to:
+        end_op, end = parse_date_bound(to, tz, upper=True)
+    else:
+        today = datetime.now(timezone.utc).astimezone(tz).date()
+        end_op, end = '$lt', _start_of_day(today + timedelta(days=1), tz)
+
+    start_param = query_params.get('from')
+    if start_param:
+        _, start = parse_date_bound(start_param, tz)
+    else:
+        last_day = (end - timedelta(microseconds=1) if end_op == '$lt' else end).astimezone(tz).date()
+        start = _start_of_day(_subtract_months(last_day.replace(day=1), months - 1), tz)
+
+    if start >= end:
+        raise InvalidFilter('La date de début doit précéder la date de fin')
+    return {'$gte': start, end_op: end}
+
+
+def parse_equipment_filters(query_params):
+    """
+    Construit le dictionnaire de filtres attendu par get_equipments() à partir
+    des paramètres de requête.
+
+    Raises:
+        InvalidFilter: si une date, une plage ou un fuseau est invalide
+    """
+    filters = {}
+
+    # Filtres de base
+    for param in TEXT_FILTER_FIELDS:
+        if param in query_params:
+            filters[param] = query_params.get(param)
+
+    # Filtres de date
+    filters.update(parse_date_filters(query_params))
+    return filters
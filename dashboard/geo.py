@@ -0,0 +1,254 @@
+"""
+Position géographique des localisations.
+
+Les coordonnées importées ou saisies existent sous plusieurs schémas
+(coordinates.latitude/longitude, lat/lng, latitude/longitude), parfois sous
+forme de chaînes. La position canonique est calculée une seule fois à
+l'écriture (create/update/import, et scripts/backfill_location_geo.py pour les
+données existantes) et stockée dans le champ ``geo`` : un point GeoJSON
+{'type': 'Point', 'coordinates': [lng, lat]} couvert par un index 2dsphere.
+Les localisations sans coordonnées valides ont ``geo: None`` (ignorées par
+l'index).
+
+La carte ne demande que les sites de sa zone d'affichage (?bbox=) : la requête
+$geoWithin utilise l'index au lieu de parcourir toutes les localisations.
+
+Tant que le backfill n'a pas été exécuté sur les données existantes (marqueur
+GEO_BACKFILL_MARKER absent), les localisations sans champ ``geo`` sont aussi
+lues et leur position calculée à la volée depuis GEO_SOURCE_FIELDS.
+"""
+import logging
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+from pymongo.errors import PyMongoError
+
+from .db import get_mongodb_connection
+from .filters import InvalidFilter
+from .versions import MAINTENANCE_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# Champs d'une localisation dont dépend sa position
+GEO_SOURCE_FIELDS = ('coordinates', 'lat', 'lng', 'latitude', 'longitude')
+
+# Niveaux de zoom acceptés (tuiles web)
+MAX_ZOOM = 22
+
+# Écart maximal entre deux sommets d'un bord de zone (degrés) et marge ajoutée
+# en latitude : les bords d'un polygone $geometry sont des géodésiques, qui
+# s'écartent légèrement des parallèles ; le filtrage exact est fait ensuite
+_EDGE_STEP = 1.0
+_EDGE_MARGIN = 0.01
+# Largeur maximale (degrés) d'un polygone de requête (moins d'un hémisphère)
+_MAX_POLYGON_WIDTH = 90.0
+_MAX_LATITUDE = 89.99
+
+# Marqueur posé par scripts/backfill_location_geo.py (collection de maintenance)
+GEO_BACKFILL_MARKER = 'location_geo_fields'
+# Intervalle (secondes) entre deux vérifications du marqueur tant qu'il est absent
+GEO_BACKFILL_CHECK_INTERVAL = 60
+
+_backfill_done = False
+_backfill_checked_at = None
+
+
+def _number(value):
+    """Convertit une coordonnée en float fini, ou None."""
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def extract_coordinates(doc):
+    """
+    Retourne (lat, lng) d'une localisation, quel que soit son schéma.
+
+    Le premier couple renseigné est retenu, dans l'ordre latitude/longitude,
+    lat/lng puis coordinates.latitude/longitude.
+
+    Returns:
+        tuple: (lat, lng) en degrés, ou None si aucun couple valide
+    """
+    coordinates = doc.get('coordinates')
+    candidates = [
+        (doc.get('latitude'), doc.get('longitude')),
+        (doc.get('lat'), doc.get('lng')),
+    ]
+    if isinstance(coordinates, dict):
+        candidates.append((coordinates.get('latitude'), coordinates.get('longitude')))
+
+    for raw_lat, raw_lng in candidates:
+        lat, lng = _number(raw_lat), _number(raw_lng)
+        if lat is None or lng is None:
+            continue
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+    return None
+
+
+def build_geo_fields(doc):
+    """
+    Calcule le champ geo (point GeoJSON) d'un document localisation.
+
+    Returns:
+        dict: {'geo': {'type': 'Point', 'coordinates': [lng, lat]} ou None}
+    """
+    position = extract_coordinates(doc)
+    if position is None:
+        return {'geo': None}
+    lat, lng = position
+    return {'geo': {'type': 'Point', 'coordinates': [lng, lat]}}
+
+
+def mark_geo_backfill_done(db=None):
+    """Enregistre que toutes les localisations portent leur champ geo."""
+    db = db if db is not None else get_mongodb_connection()
+    db[MAINTENANCE_COLLECTION].update_one(
+        {'_id': GEO_BACKFILL_MARKER},
+        {'$set': {'completed_at': datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+def geo_backfill_done(db=None):
+    """
+    Indique si le champ geo a été calculé pour les localisations existantes.
+
+    Le setting (ou la variable d'environnement) LOCATION_GEO_BACKFILLED force
+    la réponse ; sinon le marqueur est lu en base. Une réponse positive est
+    retenue pour la durée du processus, une réponse négative revérifiée au plus
+    toutes les GEO_BACKFILL_CHECK_INTERVAL secondes.
+    """
+    global _backfill_done, _backfill_checked_at
+
+    configured = None
+    try:
+        from django.conf import settings
+        configured = getattr(settings, 'LOCATION_GEO_BACKFILLED', None)
+    except Exception:
+        configured = None
+    if configured is None and os.getenv('LOCATION_GEO_BACKFILLED'):
+        configured = os.getenv('LOCATION_GEO_BACKFILLED') == 'True'
+    if configured is not None:
+        return bool(configured)
+
+    if _backfill_done:
+        return True
+    now = time.monotonic()
+    if _backfill_checked_at is not None and now - _backfill_checked_at < GEO_BACKFILL_CHECK_INTERVAL:
+        return False
+
+    _backfill_checked_at = now
+    try:
+        db = db if db is not None else get_mongodb_connection()
+        _backfill_done = db[MAINTENANCE_COLLECTION].find_one({'_id': GEO_BACKFILL_MARKER}) is not None
+    except PyMongoError:
+        logger.exception('Marqueur de backfill des positions illisible')
+        return False
+    if not _backfill_done:
+        logger.warning(
+            'Positions des localisations non calculées (scripts/backfill_location_geo.py) : '
+            'coordonnées relues à chaque requête de la carte'
+        )
+    return _backfill_done
+
+
+def parse_viewport(query_params):
+    """
+    Lit la zone d'affichage de la carte (?bbox=ouest,sud,est,nord, en degrés,
+    format de Leaflet toBBoxString()).
+
+    Avec ?zoom=, la zone est élargie aux limites des tuiles de ce niveau : les
+    petits déplacements de la carte produisent la même requête (et la même
+    réponse en cache).
+
+    Returns:
+        tuple: (ouest, sud, est, nord), ou None sans bbox
+
+    Raises:
+        InvalidFilter: si bbox ou zoom est invalide
+    """
+    raw = query_params.get('bbox')
+    if not raw:
+        return None
+    values = [_number(part) for part in raw.split(',')]
+    if len(values) != 4 or any(value is None for value in values):
+        raise InvalidFilter('bbox doit être de la forme ouest,sud,est,nord')
+    west, south, east, north = values
+    if not (-90 <= south < north <= 90):
+        raise InvalidFilter('Latitudes de bbox invalides')
+    if east <= west:
+        raise InvalidFilter("bbox : l'est doit être supérieur à l'ouest")
+
+    zoom = query_params.get('zoom')
+    if zoom not in (None, ''):
+        try:
+            zoom = int(zoom)
+        except ValueError:
+            raise InvalidFilter('zoom invalide')
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise InvalidFilter(f'zoom doit être compris entre 0 et {MAX_ZOOM}')
+        step = 360 / 2 ** zoom
+        west = math.floor(west / step) * step
+        east = math.ceil(east / step) * step
+        south = max(math.floor(south / step) * step, -90)
+        north = min(math.ceil(north / step) * step, 90)
+    return west, south, east, north
+
+
+def _lng_ranges(west, east):
+    """Intervalles de longitude dans [-180, 180] couverts par [west, east]."""
+    if east - west >= 360:
+        return [(-180.0, 180.0)]
+    # Ramener west dans [-180, 180) ; la zone peut alors franchir l'antiméridien
+    offset = math.floor((west + 180) / 360) * 360
+    west, east = west - offset, east - offset
+    if east <= 180:
+        return [(west, east)]
+    return [(west, 180.0), (-180.0, east - 360)]
+
+
+def _polygon(west, south, east, north):
+    """Polygone GeoJSON d'une bande de longitude, bords densifiés."""
+    steps = max(1, math.ceil((east - west) / _EDGE_STEP))
+    lngs = [west + (east - west) * i / steps for i in range(steps + 1)]
+    ring = [[lng, south] for lng in lngs] + [[lng, north] for lng in reversed(lngs)]
+    ring.append(ring[0])
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+def viewport_query(viewport):
+    """
+    Requête $geoWithin (index 2dsphere) des points d'une zone.
+
+    La zone est découpée en polygones de moins d'un hémisphère et élargie
+    d'une petite marge : le résultat peut contenir quelques points proches du
+    bord, à écarter avec viewport_contains().
+    """
+    west, south, east, north = viewport
+    south = max(south - _EDGE_MARGIN, -_MAX_LATITUDE)
+    north = min(north + _EDGE_MARGIN, _MAX_LATITUDE)
+    polygons = []
+    for range_west, range_east in _lng_ranges(west, east):
+        pieces = max(1, math.ceil((range_east - range_west) / _MAX_POLYGON_WIDTH))
+        width = (range_east - range_west) / pieces
+        for i in range(pieces):
+            polygons.append(_polygon(range_west + i * width, south, range_west + (i + 1) * width, north))
+
+    clauses = [{'geo': {'$geoWithin': {'$geometry': polygon}}} for polygon in polygons]
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+def viewport_contains(viewport, lng, lat):
+    """Indique si un point est dans la zone (bornes incluses)."""
+    west, south, east, north = viewport
+    if not south <= lat <= north:
+        return False
+    return any(range_west <= lng <= range_east for range_west, range_east in _lng_ranges(west, east))
@@ -0,0 +1,65 @@
+"""
+Définition centralisée des index MongoDB.
+
+Les scripts d'import et de maintenance appellent ensure_equipment_indexes() /
+ensure_location_indexes() plutôt que de créer leurs index au cas par cas.
+create_index est idempotent : un index déjà présent n'est pas recréé.
+"""
+
+# Champs triables en pagination par curseur : chacun dispose d'un index (champ, _id)
+EQUIPMENT_KEYSET_FIELDS = ('creation_date', 'updated_at', 'model', 'serial', 'barcode', 'status', 'location')
+LOCATION_KEYSET_FIELDS = ('site_name', 'province', 'region', 'category', 'creation_date')
+
+# Index de la collection 'equipment' : (clés, options)
+EQUIPMENT_INDEXES = [
+    # Index non uniques (les doublons de serial/barcode existent dans les données)
+    ([('serial', 1)], {}),
+    ([('barcode', 1)], {}),
+    ([('status', 1)], {}),
+    ([('location', 1)], {}),
+    # Statut normalisé groupé par les analytics (voir dashboard.status)
+    ([('normalized_status', 1)], {}),
+    ([('creation_date', 1), ('normalized_status', 1)], {}),
+    # Recherche textuelle (voir dashboard.search)
+    ([('_search.model', 1)], {}),
+    ([('_search.serial', 1)], {}),
+    ([('_search.barcode', 1)], {}),
+    ([('_search.location', 1)], {}),
+    ([('_search_ngrams', 1)], {}),
+] + [
+    # Pagination par curseur (voir dashboard.keyset)
+    ([(field, 1), ('_id', 1)], {}) for field in EQUIPMENT_KEYSET_FIELDS
+] + [
+    # Plages de dates combinées au statut ou à la localisation (voir dashboard.filters)
+    ([(date_field, 1), (field, 1)], {})
+    for date_field in ('creation_date', 'dms')
+    for field in ('status', 'location')
+]
+
+# Index de la collection 'locations'
+LOCATION_INDEXES = [
+    ([('site_name', 1)], {}),
+    ([('region', 1)], {}),
+    ([('province', 1)], {}),
+    ([('category', 1)], {}),
+    ([('coordinates.latitude', 1), ('coordinates.longitude', 1)], {}),
+    # Position canonique des requêtes de la carte (voir dashboard.geo)
+    ([('geo', '2dsphere')], {}),
+] + [
+    ([(field, 1), ('_id', 1)], {}) for field in LOCATION_KEYSET_FIELDS
+]
+
+
+def _ensure(collection, indexes):
+    for keys, options in indexes:
+        collection.create_index(keys, **options)
+
+
+def ensure_equipment_indexes(db):
+    """Crée les index de la collection 'equipment' s'ils n'existent pas."""
+    _ensure(db['equipment'], EQUIPMENT_INDEXES)
+
+
+def ensure_location_indexes(db):
+    """Crée les index de la collection 'locations' s'ils n'existent pas."""
+    _ensure(db['locations'], LOCATION_INDEXES)
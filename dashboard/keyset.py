@@ -0,0 +1,200 @@
+"""
+Pagination par curseur (keyset) pour les listes MongoDB.
+
+Au lieu de .skip(n), chaque page reprend après la clé de tri du dernier document
+(valeur du champ trié + _id en départage). Le coût d'une page est ainsi constant
+quelle que soit sa profondeur, à condition qu'un index composé (champ, _id)
+existe (voir dashboard/indexes.py).
+
+Les jetons next/prev sont opaques pour le client : JSON étendu (bson.json_util)
+encodé en base64 URL-safe.
+
+Un même champ peut contenir des valeurs de types différents (codes-barres lus
+par pandas en nombre ou en chaîne, dates en datetime ou en chaîne). Le tri
+MongoDB ordonne d'abord par type BSON alors que $gt/$lt ne comparent que des
+valeurs du même type : la condition de reprise ajoute donc les documents des
+types suivants (ou précédents) via $type.
+"""
+import base64
+import binascii
+import datetime
+import json
+import re
+from decimal import InvalidOperation
+
+from bson import Binary, Decimal128, Int64, ObjectId, Regex, Timestamp, json_util
+from bson.errors import BSONError
+from bson.json_util import RELAXED_JSON_OPTIONS
+
+_JSON_OPTIONS = RELAXED_JSON_OPTIONS.with_options(tz_aware=True)
+
+
+# Ordre de tri MongoDB des types BSON (null/absent, traités à part, viennent
+# avant tous les autres) : alias $type de chaque rang
+BSON_TYPE_ORDER = (
+    ('double', 'int', 'long', 'decimal'),
+    ('string', 'symbol'),
+    ('object',),
+    ('array',),
+    ('binData',),
+    ('objectId',),
+    ('bool',),
+    ('date',),
+    ('timestamp',),
+    ('regex',),
+)
+
+
+class InvalidCursor(ValueError):
+    """Jeton de pagination illisible ou incompatible avec le tri demandé."""
+
+
+def bson_type_rank(value):
+    """
+    Rang de tri MongoDB du type d'une valeur (indice dans BSON_TYPE_ORDER).
+
+    Returns:
+        int: Rang, ou None pour null
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 6
+    if isinstance(value, (int, float, Int64, Decimal128)):
+        return 0
+    if isinstance(value, str):
+        return 1
+    if isinstance(value, dict):
+        return 2
+    if isinstance(value, (list, tuple)):
+        return 3
+    if isinstance(value, (bytes, Binary)):
+        return 4
+    if isinstance(value, ObjectId):
+        return 5
+    if isinstance(value, datetime.datetime):
+        return 7
+    if isinstance(value, Timestamp):
+        return 8
+    if isinstance(value, (Regex, re.Pattern)):
+        return 9
+    raise InvalidCursor('Curseur de pagination invalide')
+
+
+def encode_cursor(sort_field, sort_order, doc, direction):
+    """Encode la position d'un document en jeton opaque."""
+    payload = {
+        'f': sort_field,
+        'o': sort_order,
+        'v': doc.get(sort_field) if sort_field != '_id' else None,
+        'id': doc['_id'],
+        'd': direction,
+    }
+    raw = json_util.dumps(payload, json_options=_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort_field, sort_order):
+    """
+    Décode un jeton et vérifie qu'il correspond au tri demandé.
+
+    Returns:
+        dict: {'v': valeur, 'id': _id, 'd': 'next'|'prev'}
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        payload = json_util.loads(raw, json_options=_JSON_OPTIONS)
+    except (binascii.Error, UnicodeError, ValueError, TypeError, json.JSONDecodeError,
+            BSONError, InvalidOperation):
+        raise InvalidCursor('Curseur de pagination invalide')
+
+    if not isinstance(payload, dict) or 'id' not in payload:
+        raise InvalidCursor('Curseur de pagination invalide')
+    if payload.get('f') != sort_field or payload.get('o') != sort_order:
+        raise InvalidCursor('Le curseur ne correspond pas au tri demandé')
+    if payload.get('d') not in ('next', 'prev'):
+        raise InvalidCursor('Curseur de pagination invalide')
+    return payload
+
+
+def build_keyset_query(sort_field, sort_order, value, last_id, forward):
+    """
+    Condition « après (value, last_id) » dans l'ordre de parcours.
+
+    MongoDB trie null/absent avant toute autre valeur, puis par type BSON
+    (BSON_TYPE_ORDER) : les documents null et ceux des autres types sont
+    ajoutés explicitement pour ne pas être perdus entre deux pages.
+    """
+    ascending = (sort_order == 1) == forward
+    op = '$gt' if ascending else '$lt'
+
+    if sort_field == '_id':
+        return {'_id': {op: last_id}}
+
+    if value is None:
+        if ascending:
+            return {'$or': [
+                {sort_field: None, '_id': {op: last_id}},
+                {sort_field: {'$ne': None}},
+            ]}
+        return {sort_field: None, '_id': {op: last_id}}
+
+    # Les tableaux sont triés sur l'un de leurs éléments : pas de reprise fiable
+    rank = bson_type_rank(value)
+    if rank == 3:
+        raise InvalidCursor('Tri par curseur impossible sur un champ de type tableau')
+
+    clauses = [
+        {sort_field: {op: value}},
+        {sort_field: value, '_id': {op: last_id}},
+    ]
+    other_ranks = BSON_TYPE_ORDER[rank + 1:] if ascending else BSON_TYPE_ORDER[:rank]
+    other_types = [alias for aliases in other_ranks for alias in aliases]
+    if other_types:
+        clauses.append({sort_field: {'$type': other_types}})
+    if not ascending:
+        clauses.append({sort_field: None})
+    return {'$or': clauses}
+
+
+def fetch_keyset_page(collection, query, projection, sort_field, sort_order, page_size, cursor=''):
+    """
+    Récupère une page en mode curseur.
+
+    Args:
+        collection: Collection PyMongo
+        query (dict): Filtres déjà construits
+        projection (dict): Projection MongoDB (ou None)
+        sort_field (str): Champ de tri ('_id' par défaut)
+        sort_order (int): 1 ou -1
+        page_size (int): Taille de page
+        cursor (str): Jeton reçu du client ('' pour la première page)
+
+    Returns:
+        tuple: (documents bruts, jeton next ou None, jeton prev ou None)
+    """
+    sort_field = sort_field or '_id'
+    position = decode_cursor(cursor, sort_field, sort_order) if cursor else None
+    forward = position is None or position['d'] == 'next'
+
+    if position is not None:
+        keyset = build_keyset_query(sort_field, sort_order, position['v'], position['id'], forward)
+        query = {'$and': [query, keyset]} if query else keyset
+
+    direction = sort_order if forward else -sort_order
+    sort = [(sort_field, direction)] if sort_field == '_id' else [(sort_field, direction), ('_id', direction)]
+
+    docs = list(collection.find(query, projection).sort(sort).limit(page_size + 1))
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+    if not forward:
+        docs.reverse()
+
+    next_token = prev_token = None
+    if docs:
+        if has_more or not forward:
+            next_token = encode_cursor(sort_field, sort_order, docs[-1], 'next')
+        if (has_more and not forward) or (forward and position is not None):
+            prev_token = encode_cursor(sort_field, sort_order, docs[0], 'prev')
+    return docs, next_token, prev_token
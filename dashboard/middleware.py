@@ -0,0 +1,69 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .monitoring import start_collection, stop_collection
+
+logger = logging.getLogger('dashboard.mongo')
+
+
+class MongoTimingMiddleware:
+    """
+    Collecte les commandes MongoDB exécutées pendant chaque requête et les expose :
+    - dans l'en-tête Server-Timing (visible dans l'onglet Réseau du navigateur)
+    - dans une ligne de log structurée (JSON) sur le logger 'dashboard.mongo'
+
+    Pour les réponses en streaming, seules les commandes exécutées avant le
+    premier octet sont comptabilisées.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'MONGO_TIMING_ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_collection()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = stop_collection(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        if not (stats.count or stats.sections):
+            return response
+
+        response['Server-Timing'] = self._server_timing(stats, total_ms)
+        logger.info(json.dumps({
+            'event': 'mongo_request',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 3),
+            'mongo': stats.as_dict(),
+        }, default=str))
+
+        return response
+
+    @staticmethod
+    def _server_timing(stats, total_ms):
+        """Construit la valeur de l'en-tête Server-Timing."""
+        metrics = [
+            f'mongo;dur={stats.duration_ms:.2f};'
+            f'desc="{stats.count} cmd, {stats.docs_returned} docs"'
+        ]
+        for name, summary in stats.by_command.items():
+            metrics.append(
+                f'mongo-{name};dur={summary["duration_ms"]:.2f};'
+                f'desc="{summary["count"]}x, {summary["docs"]} docs"'
+            )
+        for name, duration_ms in stats.sections.items():
+            metrics.append(f'{name};dur={duration_ms:.2f}')
+        app_ms = max(total_ms - stats.duration_ms, 0.0)
+        metrics.append(f'app;dur={app_ms:.2f}')
+        metrics.append(f'total;dur={total_ms:.2f}')
+        return ', '.join(metrics)
@@ -0,0 +1,149 @@
+"""
+Instrumentation des commandes MongoDB par requête HTTP.
+
+Un CommandListener PyMongo est attaché aux clients créés par dashboard.db. Tant
+qu'une collecte est active pour le contexte courant (voir
+dashboard.middleware.MongoTimingMiddleware), chaque commande terminée est
+enregistrée : nom, durée et nombre de documents renvoyés.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Statistiques de la requête en cours (None hors d'une requête instrumentée)
+_current_stats = contextvars.ContextVar('mongo_command_stats', default=None)
+
+# Nombre maximal de commandes détaillées conservées par requête
+MAX_RECORDED_COMMANDS = 50
+
+
+class MongoCommandStats:
+    """Accumulateur des commandes MongoDB exécutées pendant une requête."""
+
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.duration_ms = 0.0
+        self.docs_returned = 0
+        self.by_command = {}
+        self.commands = []
+        self.sections = {}
+
+    def record(self, command_name, duration_ms, docs, failed=False):
+        self.count += 1
+        self.duration_ms += duration_ms
+        self.docs_returned += docs
+        if failed:
+            self.failed += 1
+
+        summary = self.by_command.setdefault(
+            command_name, {'count': 0, 'duration_ms': 0.0, 'docs': 0}
+        )
+        summary['count'] += 1
+        summary['duration_ms'] += duration_ms
+        summary['docs'] += docs
+
+        if len(self.commands) < MAX_RECORDED_COMMANDS:
+            self.commands.append({
+                'command': command_name,
+                'duration_ms': round(duration_ms, 3),
+                'docs': docs,
+                'failed': failed,
+            })
+
+    def record_section(self, name, duration_ms):
+        self.sections[name] = self.sections.get(name, 0.0) + duration_ms
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'failed': self.failed,
+            'duration_ms': round(self.duration_ms, 3),
+            'docs_returned': self.docs_returned,
+            'by_command': {
+                name: {
+                    'count': s['count'],
+                    'duration_ms': round(s['duration_ms'], 3),
+                    'docs': s['docs'],
+                }
+                for name, s in self.by_command.items()
+            },
+            'sections': {name: round(ms, 3) for name, ms in self.sections.items()},
+            'commands': self.commands,
+        }
+
+
+def start_collection():
+    """Active la collecte pour le contexte courant et retourne le jeton de reset."""
+    return _current_stats.set(MongoCommandStats())
+
+
+def stop_collection(token):
+    """Termine la collecte et retourne les statistiques accumulées."""
+    stats = _current_stats.get()
+    _current_stats.reset(token)
+    return stats
+
+
+def get_current_stats():
+    """Retourne les statistiques de la requête courante (ou None)."""
+    return _current_stats.get()
+
+
+@contextmanager
+def timed_section(name):
+    """
+    Mesure une portion de code applicatif (ex. conversion des documents) afin de
+    l'exposer à côté des commandes MongoDB dans l'en-tête Server-Timing.
+    """
+    stats = _current_stats.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.record_section(name, (time.perf_counter() - start) * 1000)
+
+
+def _count_returned_docs(command_name, reply):
+    """Nombre de documents renvoyés par une réponse de commande."""
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        batch = cursor.get('firstBatch', cursor.get('nextBatch'))
+        return len(batch) if batch is not None else 0
+    if command_name == 'findAndModify':
+        return 1 if reply.get('value') is not None else 0
+    if command_name in ('count', 'distinct'):
+        return 1
+    return 0
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Enregistre les commandes dans les statistiques de la requête courante."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        stats = _current_stats.get()
+        if stats is None:
+            return
+        stats.record(
+            event.command_name,
+            event.duration_micros / 1000.0,
+            _count_returned_docs(event.command_name, event.reply),
+        )
+
+    def failed(self, event):
+        stats = _current_stats.get()
+        if stats is None:
+            return
+        stats.record(event.command_name, event.duration_micros / 1000.0, 0, failed=True)
+
+
+# Instance unique partagée par tous les clients
+command_listener = MongoCommandListener()
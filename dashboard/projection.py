@@ -0,0 +1,92 @@
+"""
+Sélection des champs renvoyés par l'API (paramètre ``fields=``).
+
+Le paramètre est traduit en projection MongoDB : seuls les champs demandés
+quittent le serveur de base de données, ce qui réduit le volume transféré et le
+coût de décodage/encodage JSON. Les champs autorisés sont listés explicitement.
+"""
+
+# Champs exposés par l'API équipements
+EQUIPMENT_FIELDS = (
+    '_id', 'model', 'brand', 'serial', 'barcode', 'price', 'currency', 'purchase_value',
+    'status', 'description', 'config_user', 'creation_date', 'dms', 'photo', 'power',
+    'files', 'location', 'family', 'subfamily', 'inventory_number', 'notes', 'pass_og',
+    'created_at', 'updated_at', 'created_by', 'updated_by',
+)
+
+# Champs exposés par l'API localisations
+LOCATION_FIELDS = (
+    '_id', 'site_id', 'site_name', 'province', 'region', 'category', 'snrt_rs',
+    'coordinates', 'services', 'contact', 'config_user', 'code', 'photo', 'files',
+    'control', 'creation_date', 'imported_at', 'updated_at', 'created_by', 'updated_by',
+)
+
+
+class InvalidFields(ValueError):
+    """Champ demandé absent de la liste autorisée."""
+
+
+def parse_fields(raw, allowed):
+    """
+    Analyse la valeur du paramètre fields (liste séparée par des virgules).
+
+    Les sous-champs sont acceptés si leur racine est autorisée
+    (ex. 'services.tnt').
+
+    Returns:
+        list: Champs demandés, ou None si le paramètre est absent/vide
+    """
+    if not raw:
+        return None
+    fields = []
+    for field in raw.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        if field.split('.', 1)[0] not in allowed:
+            raise InvalidFields(f'Champ non autorisé: {field}')
+        if field not in fields:
+            fields.append(field)
+    # Un sous-champ est inutile (et refusé par MongoDB) si sa racine est déjà demandée
+    fields = [f for f in fields if not any(f.startswith(g + '.') for g in fields)]
+    return fields or None
+
+
+def build_projection(fields, extra=()):
+    """
+    Construit une projection d'inclusion MongoDB.
+
+    Args:
+        fields (list): Champs demandés (None = pas de projection)
+        extra (iterable): Champs ajoutés d'office (ex. clé de tri du curseur)
+
+    Returns:
+        dict: Projection ou None
+    """
+    if not fields:
+        return None
+    projection = {'_id': 1}
+    for field in list(fields) + [f for f in extra if f]:
+        projection[field] = 1
+    return projection
+
+
+def strip_unrequested(docs, fields, extra=()):
+    """
+    Retire des documents les champs ajoutés d'office par build_projection(extra=)
+    que le client n'a pas demandés. Sans fields (document complet), rien n'est retiré.
+
+    Returns:
+        list: Les documents, modifiés sur place
+    """
+    if not fields:
+        return docs
+    unrequested = [
+        field for field in extra
+        if field and field != '_id' and not any(field == f or field.startswith(f + '.') for f in fields)
+    ]
+    if unrequested:
+        for doc in docs:
+            for field in unrequested:
+                doc.pop(field, None)
+    return docs
@@ -0,0 +1,86 @@
+"""
+Relations des équipements (désignations, familles, sous-familles, localisations).
+
+scripts/import_data.py (import_relation_data) écrit une collection
+'equipment_<type>' par relation, dont les documents référencent l'équipement
+par 'equipment_id' sous forme de chaîne (indexé). Les relations demandées via
+include= sont jointes par $lookup sur l'_id de l'équipement converti en chaîne :
+un seul aller-retour quel que soit le nombre de relations ou d'équipements.
+"""
+
+# Nom exposé par l'API -> collection écrite par l'import
+RELATION_COLLECTIONS = {
+    'designations': 'equipment_designation',
+    'families': 'equipment_family',
+    'subfamilies': 'equipment_subfamily',
+    'locations': 'equipment_location',
+}
+
+
+class InvalidInclude(ValueError):
+    """Relation demandée inconnue."""
+
+
+def parse_include(raw):
+    """
+    Analyse la valeur du paramètre include (liste séparée par des virgules,
+    ou 'all' pour toutes les relations).
+
+    Returns:
+        list: Relations demandées, ou None si le paramètre est absent/vide
+    """
+    if not raw:
+        return None
+    if raw.strip() == 'all':
+        return list(RELATION_COLLECTIONS)
+    include = []
+    for name in raw.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in RELATION_COLLECTIONS:
+            raise InvalidInclude(f'Relation inconnue: {name}')
+        if name not in include:
+            include.append(name)
+    return include or None
+
+
+def relation_stages(include):
+    """
+    Étapes d'agrégation ajoutant à chaque équipement un tableau par relation
+    demandée (ex. doc['families'] = [{...}, ...]).
+    """
+    stages = [{'$addFields': {'_relation_key': {'$toString': '$_id'}}}]
+    for name in include:
+        stages.append({'$lookup': {
+            'from': RELATION_COLLECTIONS[name],
+            'localField': '_relation_key',
+            'foreignField': 'equipment_id',
+            'as': name,
+        }})
+    stages.append({'$project': {'_relation_key': 0}})
+    return stages
+
+
+def hydrate_relations(collection, docs, include):
+    """
+    Ajoute les relations demandées à une page de documents déjà lus, en une
+    seule agrégation pour toute la page. Les documents sont modifiés sur place.
+
+    Args:
+        collection: Collection PyMongo des équipements
+        docs (list): Documents bruts (avant sérialisation)
+        include (list): Relations demandées
+    """
+    if not docs or not include:
+        return docs
+    pipeline = [
+        {'$match': {'_id': {'$in': [doc['_id'] for doc in docs]}}},
+        {'$project': {'_id': 1}},
+    ] + relation_stages(include)
+    relations = {item['_id']: item for item in collection.aggregate(pipeline)}
+    for doc in docs:
+        related = relations.get(doc['_id'], {})
+        for name in include:
+            doc[name] = related.get(name, [])
+    return docs
@@ -0,0 +1,109 @@
+"""
+Rendu JSON des réponses de l'API.
+
+MongoJSONRenderer encode directement les types BSON (ObjectId, datetime,
+Decimal128) en un seul parcours : les fonctions d'accès aux données peuvent
+renvoyer les documents tels que lus par PyMongo (serialize=False) sans boucle
+de conversion champ par champ. Les flottants non finis (NaN/Infinity, fréquents
+dans les données importées avec pandas) deviennent null au lieu de produire un
+JSON invalide.
+
+orjson est utilisé s'il est installé ; sinon l'encodeur de la bibliothèque
+standard prend le relais (plus lent, même résultat).
+"""
+import json
+import math
+from datetime import date, datetime
+
+from bson import Decimal128, ObjectId
+from bson.raw_bson import RawBSONDocument
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """Types non gérés nativement par l'encodeur."""
+    # Par fréquence décroissante dans les documents équipements/localisations
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        value = float(obj.to_decimal())
+        return value if math.isfinite(value) else None
+    if isinstance(obj, RawBSONDocument):
+        return dict(obj.items())
+    if isinstance(obj, date):
+        return obj.isoformat()
+    # Types Django/DRF (Decimal, chaînes paresseuses, timedelta...)
+    return _fallback_encoder.default(obj)
+
+
+def _floatstr(value, _repr=float.__repr__):
+    if math.isfinite(value):
+        return _repr(value)
+    return 'null'
+
+
+class _MongoJSONEncoder(json.JSONEncoder):
+    """Encodeur de repli : NaN/Infinity rendus null, types BSON convertis."""
+
+    def default(self, obj):
+        return _default(obj)
+
+    def iterencode(self, o, _one_shot=False):
+        # L'encodeur C ignore floatstr : on utilise l'implémentation Python
+        markers = {} if self.check_circular else None
+        _iterencode = json.encoder._make_iterencode(
+            markers, self.default, json.encoder.encode_basestring_ascii if self.ensure_ascii
+            else json.encoder.encode_basestring, self.indent, _floatstr,
+            self.key_separator, self.item_separator, self.sort_keys,
+            self.skipkeys, _one_shot,
+        )
+        return _iterencode(o, 0)
+
+
+def dumps(data, indent=None):
+    """
+    Encode data en JSON (bytes UTF-8).
+
+    Args:
+        data: Structure à encoder (peut contenir des types BSON)
+        indent (int): Indentation (orjson n'accepte que 2)
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=option)
+    separators = (',', ':') if indent is None else None
+    try:
+        # Encodeur C : rapide, mais refuse NaN/Infinity
+        return json.dumps(
+            data, default=_default, indent=indent, ensure_ascii=False,
+            separators=separators, allow_nan=False,
+        ).encode('utf-8')
+    except ValueError:
+        return json.dumps(
+            data, cls=_MongoJSONEncoder, indent=indent, ensure_ascii=False,
+            separators=separators,
+        ).encode('utf-8')
+
+
+class MongoJSONRenderer(JSONRenderer):
+    """
+    Renderer DRF pour les documents MongoDB (voir le docstring du module).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        return dumps(data, indent=self.get_indent(accepted_media_type, renderer_context))
@@ -0,0 +1,209 @@
+"""
+Cache des réponses des endpoints de lecture agrégée (analytics, statistiques
+et carte des localisations).
+
+La clé d'une réponse contient le nom de l'endpoint, son chemin, ses paramètres et la
+version (dashboard.versions) de chaque collection dont elle dépend : toute
+écriture applicative incrémente cette version, les réponses antérieures ne sont
+donc plus jamais servies, sans invalidation explicite. Comme pour l'ETag
+(dashboard.conditional), la clé d'une réponse dépendant de la date du jour
+(time_relative, ou plage relative <champ>_range) change aussi à minuit dans le
+fuseau de la requête.
+
+En dehors des écritures, une réponse est fraîche pendant RESPONSE_CACHE_TTL
+secondes, puis servie périmée pendant RESPONSE_CACHE_STALE secondes
+supplémentaires pendant qu'elle est recalculée en arrière-plan
+(stale-while-revalidate). Au-delà, elle est recalculée pendant la requête.
+
+Le stockage est le cache Django configuré par RESPONSE_CACHE_ALIAS (voir
+CACHES dans settings.py). Les compteurs (hits, stale, misses) sont propres à
+chaque processus et exposés par /api/cache/stats/.
+"""
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+
+from .conditional import time_components
+from .filters import InvalidFilter
+from .versions import get_versions
+
+logger = logging.getLogger(__name__)
+
+# Durée pendant laquelle un recalcul en arrière-plan est réservé à un seul processus
+REVALIDATE_LOCK_TIMEOUT = 60
+
+_executor = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _get_executor():
+    """Pool des recalculs en arrière-plan, créé au premier usage."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='response-cache')
+        return _executor
+
+
+def _cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _count(name, outcome):
+    with _stats_lock:
+        counters = _stats.setdefault(name, {'hits': 0, 'stale': 0, 'misses': 0})
+        counters[outcome] += 1
+
+
+def get_stats():
+    """
+    Compteurs du processus courant par endpoint.
+
+    Returns:
+        dict: {endpoint: {'hits', 'stale', 'misses', 'hit_ratio'}}
+    """
+    with _stats_lock:
+        stats = {name: dict(counters) for name, counters in _stats.items()}
+    for counters in stats.values():
+        total = counters['hits'] + counters['stale'] + counters['misses']
+        counters['hit_ratio'] = round((counters['hits'] + counters['stale']) / total, 3) if total else None
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def cache_key(name, collections, request, time_relative=False):
+    """
+    Clé d'une réponse : endpoint, chemin, paramètres triés, versions des
+    collections et date du jour si la réponse en dépend (voir
+    conditional.time_components).
+    """
+    versions = get_versions(collections)
+    params = sorted(request.GET.lists())
+    day, _ = time_components(request, time_relative)
+    payload = repr((name, request.path, params, sorted(versions.items()), day))
+    return f'response:{name}:{hashlib.sha256(payload.encode("utf-8")).hexdigest()}'
+
+
+def _render(view, request, *args, **kwargs):
+    """
+    Exécute la vue et retourne l'entrée à mettre en cache, ou None si la
+    réponse n'est pas cachable (erreur, contenu non JSON).
+    """
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+        response.render()
+    content_type = response.get('Content-Type', '')
+    if response.status_code != 200 or not content_type.startswith('application/json'):
+        return response, None
+    entry = {
+        'content': response.content,
+        'content_type': content_type,
+        'created_at': time.time(),
+    }
+    return response, entry
+
+
+def _detached_request(request):
+    """
+    Copie de la requête pour un recalcul en arrière-plan : méthode, chemin,
+    paramètres et en-têtes seulement. La requête d'origine est terminée
+    pendant le recalcul (flux d'entrée fermé, session et utilisateur liés à
+    son cycle) ; une réponse mise en cache ne dépend que de ces éléments.
+    """
+    detached = HttpRequest()
+    detached.method = 'GET'
+    detached.path = request.path
+    detached.path_info = request.path_info
+    detached.resolver_match = request.resolver_match
+    detached.GET = request.GET.copy()
+    detached.META = {key: value for key, value in request.META.items() if isinstance(value, str)}
+    return detached
+
+
+def _revalidate(view, key, lock_key, timeout, request, args, kwargs):
+    """Recalcule une réponse périmée (dans le pool)."""
+    try:
+        _, entry = _render(view, request, *args, **kwargs)
+        if entry is not None:
+            _cache().set(key, entry, timeout)
+    except Exception:
+        logger.exception('Échec du recalcul de %s', key)
+    finally:
+        _cache().delete(lock_key)
+
+
+def _from_entry(entry, status):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['X-Cache'] = status
+    response['Age'] = str(int(time.time() - entry['created_at']))
+    return response
+
+
+def cached_response(name, collections, ttl=None, stale=None, time_relative=False):
+    """
+    Décorateur de vue (fonction) mettant en cache ses réponses JSON.
+
+    Args:
+        name (str): Nom de l'endpoint (clé et statistiques)
+        collections (tuple): Collections dont dépend la réponse
+        ttl (int): Durée de fraîcheur (défaut RESPONSE_CACHE_TTL)
+        stale (int): Durée de service périmé (défaut RESPONSE_CACHE_STALE)
+        time_relative (bool): La réponse dépend de la date du jour (comme
+            pour conditional_response)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            fresh_for = ttl if ttl is not None else settings.RESPONSE_CACHE_TTL
+            stale_for = stale if stale is not None else settings.RESPONSE_CACHE_STALE
+            timeout = fresh_for + stale_for
+            cache = _cache()
+            try:
+                key = cache_key(name, collections, request, time_relative)
+            except InvalidFilter:
+                # Fuseau ?tz= invalide : la vue renvoie l'erreur de validation
+                return view(request, *args, **kwargs)
+            except Exception:
+                # Versions illisibles (MongoDB indisponible) : la vue gère l'erreur
+                logger.exception('Cache des réponses indisponible pour %s', name)
+                return view(request, *args, **kwargs)
+
+            entry = cache.get(key)
+            if entry is not None:
+                age = time.time() - entry['created_at']
+                if age < fresh_for:
+                    _count(name, 'hits')
+                    return _from_entry(entry, 'HIT')
+                # Périmée : servie telle quelle, un seul recalcul lancé
+                lock_key = f'{key}:revalidate'
+                if cache.add(lock_key, 1, REVALIDATE_LOCK_TIMEOUT):
+                    _get_executor().submit(
+                        _revalidate, view, key, lock_key, timeout, _detached_request(request), args, kwargs
+                    )
+                _count(name, 'stale')
+                return _from_entry(entry, 'STALE')
+
+            _count(name, 'misses')
+            response, entry = _render(view, request, *args, **kwargs)
+            if entry is not None:
+                cache.set(key, entry, timeout)
+                response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
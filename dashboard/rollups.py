@@ -0,0 +1,381 @@
+"""
+Agrégats pré-calculés des équipements pour les analytics.
+
+La collection 'equipment_rollup' contient une ligne par combinaison
+(jour de création, statut normalisé, localisation) avec le nombre
+d'équipements et la somme de leurs valeurs d'achat. Les vues d'analytics lisent
+ces quelques centaines de lignes au lieu de parcourir toute la collection
+'equipment'.
+
+Les lignes sont maintenues par deltas :
+- mode 'inline' (défaut) : create/update/delete_equipment appliquent le delta
+  après chaque écriture ;
+- mode 'change_stream' : les écritures applicatives n'y touchent pas, les deltas
+  sont appliqués par scripts/tail_rollup_changes.py à partir du change stream
+  de 'equipment' (nécessite un replica set).
+
+Les imports en masse reconstruisent la collection (rebuild_rollup) et
+scripts/rollup.py permet de la reconstruire ou d'en vérifier la cohérence.
+Une seule reconstruction s'exécute à la fois (verrou dans la collection de
+maintenance). Tant que les agrégats n'ont jamais été construits, les totaux
+sont calculés directement sur 'equipment' et la construction est lancée en
+arrière-plan, hors de la requête.
+"""
+import logging
+import math
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta, timezone
+
+from bson import Decimal128
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .db import get_mongodb_connection
+from .status import STATUS_UNSPECIFIED
+from .versions import MAINTENANCE_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = 'equipment_rollup'
+
+# 'inline' ou 'change_stream'
+ROLLUP_MODE = os.getenv('ROLLUP_MODE', 'inline')
+
+# Champs d'un équipement dont dépend sa ligne d'agrégat
+ROLLUP_SOURCE_FIELDS = ('creation_date', 'normalized_status', 'location', 'purchase_value')
+
+# Clé d'une ligne d'agrégat
+ROLLUP_KEY_FIELDS = ('day', 'status', 'location')
+
+# Documents de la collection de maintenance : état (date de la dernière
+# construction) et verrou de reconstruction
+ROLLUP_STATE_ID = 'equipment_rollup'
+ROLLUP_LOCK_ID = 'equipment_rollup_rebuild'
+# Durée (secondes) au-delà de laquelle un verrou abandonné est repris
+ROLLUP_LOCK_TTL = int(os.getenv('ROLLUP_LOCK_TTL', 3600))
+
+_indexes_ready = False
+_built = False
+_build_lock = threading.Lock()
+_build_pending = False
+_executor = None
+
+
+class RollupRebuildInProgress(RuntimeError):
+    """Une reconstruction des agrégats est déjà en cours."""
+
+
+def _ensure_indexes(collection):
+    collection.create_index([(field, 1) for field in ROLLUP_KEY_FIELDS], unique=True)
+    collection.create_index([('status', 1)])
+    collection.create_index([('location', 1)])
+
+
+def _rollup(db=None):
+    """Collection des agrégats, avec ses index créés au premier usage."""
+    global _indexes_ready
+    db = db if db is not None else get_mongodb_connection()
+    collection = db[ROLLUP_COLLECTION]
+    if not _indexes_ready:
+        _ensure_indexes(collection)
+        _indexes_ready = True
+    return collection
+
+
+def _day(value):
+    """Jour (minuit UTC) d'une date de création, ou None."""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return datetime.combine(value.date(), time.min)
+
+
+def positive_value(value):
+    """Valeur d'achat comptée dans les sommes : nombre fini et positif, sinon 0."""
+    if isinstance(value, Decimal128):
+        value = float(value.to_decimal())
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0
+    return value if math.isfinite(value) and value > 0 else 0
+
+
+def rollup_key(doc):
+    """
+    Clé de la ligne d'agrégat d'un équipement.
+
+    Returns:
+        dict: {'day': ..., 'status': ..., 'location': ...}
+    """
+    return {
+        'day': _day(doc.get('creation_date')),
+        'status': doc.get('normalized_status') or STATUS_UNSPECIFIED,
+        'location': doc.get('location') or None,
+    }
+
+
+def rollup_changed(old_doc, new_doc):
+    """Indique si une modification change la contribution d'un équipement."""
+    return (rollup_key(old_doc) != rollup_key(new_doc)
+            or positive_value(old_doc.get('purchase_value')) != positive_value(new_doc.get('purchase_value')))
+
+
+def _delta_operations(doc, sign):
+    key = rollup_key(doc)
+    return [
+        UpdateOne(key, {'$inc': {'count': sign, 'purchase_value': sign * positive_value(doc.get('purchase_value'))}},
+                  upsert=True),
+        # Une ligne retombée à zéro est supprimée
+        DeleteOne({**key, 'count': {'$lte': 0}}),
+    ]
+
+
+def apply_rollup_delta(old_doc=None, new_doc=None, db=None):
+    """
+    Reporte une écriture dans les agrégats : retire la contribution de
+    l'ancien document et ajoute celle du nouveau.
+
+    Args:
+        old_doc (dict): Document avant l'écriture (None pour une création)
+        new_doc (dict): Document après l'écriture (None pour une suppression)
+    """
+    operations = []
+    if old_doc is not None:
+        operations += _delta_operations(old_doc, -1)
+    if new_doc is not None:
+        operations += _delta_operations(new_doc, 1)
+    if not operations:
+        return
+    collection = _rollup(db)
+    try:
+        collection.bulk_write(operations, ordered=True)
+    except BulkWriteError as e:
+        # Deux upserts simultanés sur une ligne absente : l'un échoue sur l'index
+        # unique, rejouer les opérations restantes (la ligne existe désormais)
+        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+            raise
+        collection.bulk_write(operations[e.details['writeErrors'][0]['index']:], ordered=True)
+
+
+def record_write(old_doc=None, new_doc=None, db=None):
+    """
+    Point d'appel des écritures applicatives : applique le delta en mode
+    'inline', ne fait rien en mode 'change_stream'.
+
+    L'écriture de l'équipement a déjà réussi : un échec est journalisé sans
+    être propagé (scripts/rollup.py --check le détecte, --rebuild le corrige).
+    """
+    if ROLLUP_MODE != 'inline':
+        return
+    if old_doc is not None and new_doc is not None and not rollup_changed(old_doc, new_doc):
+        return
+    try:
+        apply_rollup_delta(old_doc, new_doc, db)
+    except Exception:
+        logger.exception("Échec de la mise à jour des agrégats d'équipements")
+
+
+def rollup_pipeline():
+    """Pipeline d'agrégation recalculant les agrégats depuis 'equipment'."""
+    return [
+        {'$project': {
+            '_id': 0,
+            'day': {'$cond': [
+                {'$eq': [{'$type': '$creation_date'}, 'date']},
+                {'$dateTrunc': {'date': '$creation_date', 'unit': 'day'}},
+                None,
+            ]},
+            'status': {'$ifNull': ['$normalized_status', STATUS_UNSPECIFIED]},
+            'location': {'$cond': [
+                {'$in': [{'$ifNull': ['$location', '']}, ['', None]]}, None, '$location',
+            ]},
+            'purchase_value': {'$cond': [
+                {'$and': [
+                    {'$isNumber': '$purchase_value'},
+                    {'$gt': ['$purchase_value', 0]},
+                    {'$lt': ['$purchase_value', float('inf')]},
+                ]},
+                '$purchase_value',
+                0,
+            ]},
+        }},
+        {'$group': {
+            '_id': {'day': '$day', 'status': '$status', 'location': '$location'},
+            'count': {'$sum': 1},
+            'purchase_value': {'$sum': '$purchase_value'},
+        }},
+        {'$project': {
+            '_id': 0,
+            'day': '$_id.day',
+            'status': '$_id.status',
+            'location': '$_id.location',
+            'count': 1,
+            'purchase_value': 1,
+        }},
+    ]
+
+
+def _acquire_rebuild_lock(db, owner):
+    """Prend le verrou de reconstruction (False s'il est détenu et non expiré)."""
+    now = datetime.now(timezone.utc)
+    try:
+        db[MAINTENANCE_COLLECTION].update_one(
+            {'_id': ROLLUP_LOCK_ID, 'locked_until': {'$lt': now}},
+            {'$set': {'owner': owner, 'locked_until': now + timedelta(seconds=ROLLUP_LOCK_TTL)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def rebuild_rollup(db=None):
+    """
+    Recalcule entièrement les agrégats depuis 'equipment'.
+
+    Le résultat est écrit dans une collection temporaire propre à cette
+    reconstruction (dont $out conserve les index) puis renommé : les lecteurs
+    voient l'ancienne ou la nouvelle version, jamais un état partiel. Les
+    deltas appliqués pendant le recalcul sont perdus : à lancer hors des
+    périodes d'écriture (fin d'import).
+
+    Returns:
+        int: Nombre de lignes d'agrégat
+
+    Raises:
+        RollupRebuildInProgress: si une autre reconstruction détient le verrou
+    """
+    global _built
+    db = db if db is not None else get_mongodb_connection()
+    owner = uuid.uuid4().hex
+    if not _acquire_rebuild_lock(db, owner):
+        raise RollupRebuildInProgress("Reconstruction des agrégats d'équipements déjà en cours")
+
+    tmp = db[f'{ROLLUP_COLLECTION}_rebuild_{owner}']
+    try:
+        _ensure_indexes(tmp)
+        db['equipment'].aggregate(rollup_pipeline() + [{'$out': tmp.name}], allowDiskUse=True)
+        tmp.rename(ROLLUP_COLLECTION, dropTarget=True)
+        db[MAINTENANCE_COLLECTION].update_one(
+            {'_id': ROLLUP_STATE_ID},
+            {'$set': {'built_at': datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    except Exception:
+        tmp.drop()
+        raise
+    finally:
+        db[MAINTENANCE_COLLECTION].delete_one({'_id': ROLLUP_LOCK_ID, 'owner': owner})
+    _built = True
+    return db[ROLLUP_COLLECTION].estimated_document_count()
+
+
+def check_rollup(db=None):
+    """
+    Compare les agrégats stockés à un recalcul depuis 'equipment'.
+
+    Returns:
+        list: Écarts [{'key': {...}, 'expected': (count, value), 'stored': (count, value)}]
+    """
+    db = db if db is not None else get_mongodb_connection()
+
+    def _index(rows):
+        return {
+            tuple(row.get(field) for field in ROLLUP_KEY_FIELDS):
+                (row.get('count', 0), round(row.get('purchase_value', 0), 2))
+            for row in rows
+        }
+
+    expected = _index(db['equipment'].aggregate(rollup_pipeline(), allowDiskUse=True))
+    stored = _index(_rollup(db).find({}, {'_id': 0}))
+    differences = []
+    for key in expected.keys() | stored.keys():
+        if expected.get(key) != stored.get(key):
+            differences.append({
+                'key': dict(zip(ROLLUP_KEY_FIELDS, key)),
+                'expected': expected.get(key),
+                'stored': stored.get(key),
+            })
+    return differences
+
+
+def _get_executor():
+    global _executor
+    with _build_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='equipment-rollup')
+        return _executor
+
+
+def _build():
+    global _build_pending
+    try:
+        logger.info("Agrégats d'équipements absents, construction initiale")
+        rebuild_rollup()
+    except RollupRebuildInProgress:
+        logger.info("Construction des agrégats d'équipements déjà lancée par un autre processus")
+    except Exception:
+        logger.exception("Échec de la construction des agrégats d'équipements")
+    finally:
+        with _build_lock:
+            _build_pending = False
+
+
+def _schedule_build():
+    """Lance la construction initiale en arrière-plan (une seule à la fois)."""
+    global _build_pending
+    with _build_lock:
+        if _build_pending:
+            return
+        _build_pending = True
+    _get_executor().submit(_build)
+
+
+def _is_built(db):
+    """
+    Indique si les agrégats sont construits (première mise en service :
+    construction lancée en arrière-plan et False).
+    """
+    global _built
+    if _built:
+        return True
+    if (db[MAINTENANCE_COLLECTION].find_one({'_id': ROLLUP_STATE_ID}, {'_id': 1})
+            or db[ROLLUP_COLLECTION].estimated_document_count()
+            or not db['equipment'].estimated_document_count()):
+        _built = True
+        return True
+    _schedule_build()
+    return False
+
+
+def rollup_totals(group_field, match=None, limit=None, db=None):
+    """
+    Totaux (count, purchase_value) des agrégats regroupés sur un champ.
+
+    Args:
+        group_field (str): 'status', 'location' ou 'day'
+        match (dict): Filtre sur les lignes d'agrégat
+        limit (int): Nombre maximal de groupes (les plus nombreux d'abord)
+
+    Returns:
+        list: [{'_id': valeur, 'count': n, 'total_value': somme}] triés par count décroissant
+    """
+    db = db if db is not None else get_mongodb_connection()
+    pipeline = [
+        {'$match': match or {}},
+        {'$group': {
+            '_id': f'${group_field}',
+            'count': {'$sum': '$count'},
+            'total_value': {'$sum': '$purchase_value'},
+        }},
+        {'$sort': {'count': -1, '_id': 1}},
+    ]
+    if limit:
+        pipeline.append({'$limit': limit})
+    if not _is_built(db):
+        # Agrégats en construction : même calcul sur les lignes produites à la volée
+        return list(db['equipment'].aggregate(rollup_pipeline() + pipeline, allowDiskUse=True))
+    return list(_rollup(db).aggregate(pipeline))
@@ -0,0 +1,241 @@
+"""
+Recherche textuelle indexée sur les équipements.
+
+Chaque document équipement porte deux champs techniques, maintenus à l'écriture
+(create/update/import) et par scripts/backfill_search_fields.py :
+
+- ``_search.<champ>`` : valeur normalisée (minuscules, sans accents ni espaces
+  superflus), indexée pour les recherches exactes et par préfixe ;
+- ``_search_ngrams`` : trigrammes ``"<champ>:<trigramme>"`` (index multikey)
+  pour les recherches de sous-chaîne.
+
+Le mode de recherche est configurable champ par champ via le setting
+EQUIPMENT_SEARCH_MODES (ou la variable d'environnement du même nom, au format
+``serial=prefix,barcode=exact``).
+
+Les modes indexés ne voient que les documents qui portent ces champs : tant que
+le backfill n'a pas été exécuté sur les données existantes (marqueur
+SEARCH_BACKFILL_MARKER absent), tous les champs sont recherchés en mode
+'regex'.
+
+Seuls les MAX_NGRAM_SOURCE_LENGTH premiers caractères d'une valeur sont
+découpés en trigrammes : en mode 'ngram', une sous-chaîne qui commence au-delà
+n'est pas trouvée (choisir 'regex' pour un champ aux valeurs plus longues).
+"""
+import logging
+import os
+import re
+import time
+import unicodedata
+from datetime import datetime, timezone
+
+from pymongo.errors import PyMongoError
+
+from .db import get_mongodb_connection
+from .versions import MAINTENANCE_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# Champs disposant d'un champ normalisé et de trigrammes
+SEARCH_FIELDS = ('model', 'serial', 'barcode', 'location')
+
+# Taille des n-grammes et longueur maximale indexée par valeur
+NGRAM_SIZE = 3
+MAX_NGRAM_SOURCE_LENGTH = 64
+
+# Modes disponibles :
+# - 'regex'  : ancien comportement (regex insensible à la casse, échappée) -> scan complet
+# - 'exact'  : égalité sur la valeur normalisée
+# - 'prefix' : regex ancrée sur la valeur normalisée -> parcours d'intervalle d'index
+# - 'ngram'  : sous-chaîne via les trigrammes, vérifiée sur la valeur normalisée
+SEARCH_MODES = ('regex', 'exact', 'prefix', 'ngram')
+
+DEFAULT_SEARCH_MODES = {
+    'model': 'ngram',
+    'serial': 'ngram',
+    'barcode': 'ngram',
+    'location': 'ngram',
+    'status': 'regex',
+}
+
+# Marqueur posé par scripts/backfill_search_fields.py (collection de maintenance)
+SEARCH_BACKFILL_MARKER = 'equipment_search_fields'
+# Intervalle (secondes) entre deux vérifications du marqueur tant qu'il est absent
+SEARCH_BACKFILL_CHECK_INTERVAL = 60
+
+_backfill_done = False
+_backfill_checked_at = None
+
+# Champs techniques à ne jamais renvoyer dans les réponses de l'API
+INTERNAL_FIELDS_PROJECTION = {'_search': 0, '_search_ngrams': 0}
+
+
+def normalize_text(value):
+    """
+    Normalise une valeur pour la recherche : minuscules, accents retirés,
+    espaces multiples réduits. Les nombres entiers stockés en flottant
+    (ex. codes-barres lus par pandas) sont rendus sans partie décimale.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = unicodedata.normalize('NFKD', str(value))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+
+def ngrams(text, size=NGRAM_SIZE):
+    """Retourne l'ensemble des n-grammes d'une chaîne déjà normalisée."""
+    text = text[:MAX_NGRAM_SOURCE_LENGTH]
+    if len(text) < size:
+        return set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def build_search_fields(doc):
+    """
+    Calcule les champs techniques de recherche pour un document équipement complet.
+
+    Returns:
+        dict: {'_search': {...}, '_search_ngrams': [...]} à fusionner dans le document
+    """
+    normalized = {}
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        text = normalize_text(doc.get(field))
+        if not text:
+            continue
+        normalized[field] = text
+        tokens.update(f'{field}:{gram}' for gram in ngrams(text))
+    return {'_search': normalized, '_search_ngrams': sorted(tokens)}
+
+
+def mark_search_backfill_done(db=None):
+    """Enregistre que tous les équipements portent leurs champs de recherche."""
+    db = db if db is not None else get_mongodb_connection()
+    db[MAINTENANCE_COLLECTION].update_one(
+        {'_id': SEARCH_BACKFILL_MARKER},
+        {'$set': {'completed_at': datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+def search_backfill_done(db=None):
+    """
+    Indique si les champs de recherche ont été calculés pour les données
+    existantes.
+
+    Le setting (ou la variable d'environnement) EQUIPMENT_SEARCH_BACKFILLED
+    force la réponse ; sinon le marqueur est lu en base. Une réponse positive
+    est retenue pour la durée du processus, une réponse négative revérifiée au
+    plus toutes les SEARCH_BACKFILL_CHECK_INTERVAL secondes.
+    """
+    global _backfill_done, _backfill_checked_at
+
+    configured = None
+    try:
+        from django.conf import settings
+        configured = getattr(settings, 'EQUIPMENT_SEARCH_BACKFILLED', None)
+    except Exception:
+        configured = None
+    if configured is None and os.getenv('EQUIPMENT_SEARCH_BACKFILLED'):
+        configured = os.getenv('EQUIPMENT_SEARCH_BACKFILLED') == 'True'
+    if configured is not None:
+        return bool(configured)
+
+    if _backfill_done:
+        return True
+    now = time.monotonic()
+    if _backfill_checked_at is not None and now - _backfill_checked_at < SEARCH_BACKFILL_CHECK_INTERVAL:
+        return False
+
+    _backfill_checked_at = now
+    try:
+        db = db if db is not None else get_mongodb_connection()
+        _backfill_done = db[MAINTENANCE_COLLECTION].find_one({'_id': SEARCH_BACKFILL_MARKER}) is not None
+    except PyMongoError:
+        logger.exception('Marqueur de backfill de la recherche illisible')
+        return False
+    if not _backfill_done:
+        logger.warning(
+            'Champs de recherche non calculés (scripts/backfill_search_fields.py) : '
+            'filtres texte en mode regex'
+        )
+    return _backfill_done
+
+
+def get_search_modes():
+    """
+    Retourne les modes de recherche effectifs par champ ('regex' pour tous
+    tant que le backfill des champs de recherche n'a pas été exécuté).
+    """
+    modes = dict(DEFAULT_SEARCH_MODES)
+
+    configured = None
+    try:
+        from django.conf import settings
+        configured = getattr(settings, 'EQUIPMENT_SEARCH_MODES', None)
+    except Exception:
+        configured = None
+
+    if configured is None:
+        raw = os.getenv('EQUIPMENT_SEARCH_MODES', '')
+        configured = dict(
+            item.split('=', 1) for item in raw.split(',') if '=' in item
+        )
+
+    for field, mode in configured.items():
+        field, mode = field.strip(), mode.strip()
+        if mode in SEARCH_MODES:
+            modes[field] = mode
+
+    if any(mode != 'regex' for mode in modes.values()) and not search_backfill_done():
+        return {field: 'regex' for field in modes}
+    return modes
+
+
+def build_text_clause(field, value, mode=None):
+    """
+    Construit la clause MongoDB d'un filtre texte selon le mode du champ.
+
+    Args:
+        field (str): Champ filtré (ex. 'serial')
+        value: Valeur saisie par l'utilisateur
+        mode (str): Mode forcé (sinon lu dans la configuration)
+
+    Returns:
+        dict: Clause de requête MongoDB (ou None si la valeur est vide)
+    """
+    if mode is None:
+        mode = get_search_modes().get(field, 'regex')
+    if field not in SEARCH_FIELDS and mode != 'regex':
+        mode = 'regex'
+
+    if mode == 'regex':
+        text = str(value).strip()
+        if not text:
+            return None
+        return {field: {'$regex': re.escape(text), '$options': 'i'}}
+
+    text = normalize_text(value)
+    if not text:
+        return None
+    shadow = f'_search.{field}'
+
+    if mode == 'exact':
+        return {shadow: text}
+
+    if mode == 'prefix':
+        return {shadow: {'$regex': f'^{re.escape(text)}'}}
+
+    # Mode 'ngram'
+    grams = ngrams(text)
+    if not grams:
+        # Terme trop court pour les trigrammes : regex sur le champ normalisé,
+        # résolue par un parcours de l'index _search.<champ> et non de la collection
+        return {shadow: {'$regex': re.escape(text)}}
+    return {
+        '_search_ngrams': {'$all': sorted(f'{field}:{gram}' for gram in grams)},
+        shadow: {'$regex': re.escape(text)},
+    }
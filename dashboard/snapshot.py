@@ -0,0 +1,405 @@
+"""
+Instantané en mémoire, par colonnes (NumPy), de la collection 'equipment' pour
+les analytics.
+
+Seuls les champs agrégés sont chargés : statut, statut normalisé,
+localisation et famille (codes entiers d'une table de catégories), valeur
+d'achat (float64) et date de création (int64, millisecondes UTC). Les
+répartitions, séries et évolutions sont alors calculées par np.bincount et
+np.searchsorted, sans requête d'agrégation.
+
+Fraîcheur :
+- l'instantané porte la version de 'equipment' (dashboard.versions) au moment
+  de son chargement ; il n'est utilisé que si cette version est la version
+  courante (une lecture de 'collection_versions' par requête) ;
+- après une écriture, il est complété par les documents dont updated_at
+  dépasse le filigrane du chargement précédent (moins SNAPSHOT_WATERMARK_LAG
+  secondes, pour les horloges décalées des serveurs d'application) ;
+- une suppression (nombre estimé de documents différent, lu dans les
+  métadonnées de la collection), une réécriture en masse
+  (bump_version(reset=True)) ou un instantané chargé depuis plus de
+  SNAPSHOT_MAX_AGE secondes (rafraîchissements incrémentaux compris)
+  déclenchent un rechargement complet en arrière-plan.
+
+Tant que l'instantané n'est pas à jour, get_snapshot() renvoie None et les
+appelants interrogent MongoDB comme avant. L'instantané est propre à chaque
+processus ; un instantané publié n'est jamais modifié (copie à chaque
+rafraîchissement), les requêtes concurrentes peuvent donc le lire sans verrou.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from .db import get_mongodb_connection
+from .rollups import positive_value
+from .status import STATUS_UNSPECIFIED
+from .versions import get_version_state
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ENABLED = os.getenv('ANALYTICS_SNAPSHOT', 'true').lower() in ('1', 'true', 'yes')
+# Au-delà, l'instantané n'est pas construit (analytics servies par MongoDB)
+SNAPSHOT_MAX_DOCS = int(os.getenv('ANALYTICS_SNAPSHOT_MAX_DOCS', 2_000_000))
+# Âge maximal avant rechargement complet (secondes)
+SNAPSHOT_MAX_AGE = int(os.getenv('ANALYTICS_SNAPSHOT_MAX_AGE', 3600))
+# Recouvrement du filigrane updated_at (secondes)
+SNAPSHOT_WATERMARK_LAG = int(os.getenv('ANALYTICS_SNAPSHOT_WATERMARK_LAG', 60))
+
+# Champs catégoriels (codes entiers) de l'instantané
+CATEGORICAL_FIELDS = ('status', 'normalized_status', 'location', 'family')
+SNAPSHOT_PROJECTION = {field: 1 for field in (*CATEGORICAL_FIELDS, 'purchase_value', 'creation_date')}
+
+# Date de création absente ou non datée
+NO_DATE = np.iinfo(np.int64).min
+
+_snapshot = None
+_refresh_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_reload_pending = False
+_executor = None
+
+
+class _Column:
+    """
+    Colonne catégorielle : codes int32 (-1 = absent) et table des valeurs.
+
+    strings_only est faux si une valeur n'est pas une chaîne : la colonne
+    n'est alors pas utilisée pour les regroupements (ordre et égalité BSON).
+    """
+
+    def __init__(self, codes, categories, index, strings_only):
+        self.codes = codes
+        self.categories = categories
+        self.index = index
+        self.strings_only = strings_only
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int32), [], {}, True)
+
+    def encoder(self):
+        """Copie modifiable (table et index) pour encoder de nouvelles valeurs."""
+        categories, index = list(self.categories), dict(self.index)
+        state = {'strings_only': self.strings_only}
+
+        def encode(value):
+            if value is None:
+                return -1
+            if not isinstance(value, str):
+                state['strings_only'] = False
+                return -1
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(categories)
+                categories.append(value)
+            return code
+        return encode, categories, index, state
+
+
+class Snapshot:
+    """Instantané immuable des colonnes analysées de 'equipment'."""
+
+    def __init__(self, version, watermark, ids, columns, values, created, loaded_at=None):
+        self.version = version
+        self.watermark = watermark
+        # Instant du chargement complet dont l'instantané est issu
+        self.loaded_at = loaded_at if loaded_at is not None else time.monotonic()
+        self.ids = ids
+        self.columns = columns
+        self.values = values
+        self.created = created
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, version, watermark, docs, base=None):
+        """
+        Construit un instantané à partir de documents, en complétant base
+        (documents existants remplacés, nouveaux ajoutés à la fin). Un
+        instantané complété conserve la date de chargement de base.
+        """
+        loaded_at = base.loaded_at if base is not None else None
+        if base is None:
+            base = cls(version, watermark, {}, {field: _Column.empty() for field in CATEGORICAL_FIELDS},
+                       np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64))
+        ids = dict(base.ids)
+        encoders = {field: base.columns[field].encoder() for field in CATEGORICAL_FIELDS}
+
+        rows, codes = [], {field: [] for field in CATEGORICAL_FIELDS}
+        values, created = [], []
+        for doc in docs:
+            row = ids.get(doc['_id'])
+            if row is None:
+                row = ids[doc['_id']] = len(ids)
+            rows.append(row)
+            for field in CATEGORICAL_FIELDS:
+                codes[field].append(encoders[field][0](doc.get(field)))
+            values.append(positive_value(doc.get('purchase_value')))
+            created.append(_timestamp(doc.get('creation_date')))
+
+        size = len(ids)
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = {}
+        for field in CATEGORICAL_FIELDS:
+            encode, categories, index, state = encoders[field]
+            column_codes = _extend(base.columns[field].codes, size, -1)
+            column_codes[rows] = codes[field]
+            columns[field] = _Column(column_codes, categories, index, state['strings_only'])
+        value_array = _extend(base.values, size, 0)
+        value_array[rows] = values
+        created_array = _extend(base.created, size, NO_DATE)
+        created_array[rows] = created
+        return cls(version, watermark, ids, columns, value_array, created_array, loaded_at)
+
+    # --- Regroupements ----------------------------------------------------
+
+    def _group(self, field, mask=None):
+        """Nombre et somme des valeurs par code de field ({valeur: (n, somme)})."""
+        column = self.columns[field]
+        codes = column.codes if mask is None else column.codes[mask]
+        values = self.values if mask is None else self.values[mask]
+        length = len(column.categories) + 1
+        counts = np.bincount(codes + 1, minlength=length)
+        sums = np.bincount(codes + 1, weights=values, minlength=length)
+        groups = {}
+        for position in np.flatnonzero(counts):
+            key = column.categories[position - 1] if position else None
+            groups[key] = (int(counts[position]), float(sums[position]))
+        return groups
+
+    def total(self):
+        """Nombre d'équipements et somme des valeurs d'achat."""
+        return self.size, float(self.values.sum())
+
+    def totals(self, group_field, limit=None):
+        """
+        Équivalent de rollups.rollup_totals() pour 'status' (statut normalisé)
+        et 'location' (localisations renseignées uniquement).
+
+        Returns:
+            list: [{'_id', 'count', 'total_value'}] triés par count décroissant,
+            ou None si la colonne ne peut pas être regroupée ici
+        """
+        field = 'normalized_status' if group_field == 'status' else group_field
+        if not self.columns[field].strings_only:
+            return None
+        merged = {}
+        for key, (count, total_value) in self._group(field).items():
+            if group_field == 'status':
+                key = key or STATUS_UNSPECIFIED
+            elif not key:
+                continue
+            previous = merged.get(key, (0, 0.0))
+            merged[key] = (previous[0] + count, previous[1] + total_value)
+        results = [
+            {'_id': key, 'count': count, 'total_value': total_value}
+            for key, (count, total_value) in merged.items()
+        ]
+        results.sort(key=lambda item: (-item['count'], item['_id']))
+        return results[:limit] if limit else results
+
+    def group_counts(self, field):
+        """
+        Équivalent du group_by de get_equipments() sans filtre.
+
+        Returns:
+            list: [{'_id', 'count'}] triés par valeur (valeurs vides exclues),
+            ou None si le champ n'est pas dans l'instantané
+        """
+        if field not in self.columns or not self.columns[field].strings_only:
+            return None
+        return [
+            {'_id': key, 'count': count}
+            for key, (count, _) in sorted(self._group(field).items(), key=lambda item: item[0] or '')
+            if key
+        ]
+
+    def daily_counts(self, tz):
+        """Créations par jour local ({date: n}), comme le $facet 'timeline' du résumé."""
+        created = self.created[self.created != NO_DATE]
+        if not len(created):
+            return {}
+        days = pd.to_datetime(created, unit='ms', utc=True).tz_convert(tz).normalize()
+        counts = pd.Series(1, index=days).groupby(level=0).sum()
+        return {day.date(): int(count) for day, count in counts.items()}
+
+    def evolution(self, window_start, end, periods, tz):
+        """
+        Ajouts par période et stock cumulé par statut normalisé, comme
+        api._evolution_stages() suivi de api._evolution_series().
+
+        Returns:
+            tuple: ({statut: [n]}, {statut: [n]})
+        """
+        end_op, end_bound = end
+        end_ms = _timestamp(end_bound)
+        created = self.created
+        mask = created != NO_DATE
+        mask &= created < end_ms if end_op == '$lt' else created <= end_ms
+
+        column = self.columns['normalized_status']
+        codes = column.codes[mask]
+        created = created[mask]
+        labels = [category or STATUS_UNSPECIFIED for category in column.categories]
+
+        # Période de chaque création (-1 : antérieure à la fenêtre)
+        bounds = np.array([
+            _timestamp(datetime.combine(day, datetime.min.time(), tzinfo=tz)) for day in periods
+        ], dtype=np.int64)
+        positions = np.searchsorted(bounds, created, side='right') - 1
+        positions[created < _timestamp(window_start)] = -1
+
+        added, stock = {}, {}
+        for code in np.unique(codes):
+            status = labels[code] if code >= 0 else STATUS_UNSPECIFIED
+            status_positions = positions[codes == code]
+            in_window = status_positions[status_positions >= 0]
+            counts = np.bincount(in_window, minlength=len(periods))[:len(periods)]
+            baseline = int((status_positions < 0).sum())
+            if status in added:
+                counts = counts + np.asarray(added[status])
+                baseline += stock[status][0] - added[status][0]
+            added[status] = [int(n) for n in counts]
+            stock[status] = [int(n) for n in baseline + np.cumsum(counts)]
+        return added, stock
+
+
+def _timestamp(value):
+    """Millisecondes UTC d'une date, ou NO_DATE."""
+    if not isinstance(value, datetime):
+        return NO_DATE
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def _extend(array, size, fill):
+    """Copie de array agrandie à size éléments (complétée par fill)."""
+    result = np.full(size, fill, dtype=array.dtype)
+    result[:len(array)] = array
+    return result
+
+
+def _get_executor():
+    global _executor
+    with _reload_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='analytics-snapshot')
+        return _executor
+
+
+def load_snapshot(db=None):
+    """
+    Charge un instantané complet et le publie.
+
+    Returns:
+        Snapshot: L'instantané, ou None si la collection dépasse SNAPSHOT_MAX_DOCS
+    """
+    global _snapshot
+    db = db if db is not None else get_mongodb_connection()
+    collection = db['equipment']
+    if collection.estimated_document_count() > SNAPSHOT_MAX_DOCS:
+        logger.warning("Instantané des analytics désactivé : plus de %s équipements", SNAPSHOT_MAX_DOCS)
+        _snapshot = None
+        return None
+    version = get_version_state('equipment', db)['version']
+    started = datetime.now(timezone.utc)
+    snapshot = Snapshot.build(version, started, collection.find({}, SNAPSHOT_PROJECTION, batch_size=10000))
+    _snapshot = snapshot
+    logger.info("Instantané des analytics chargé : %s équipements (version %s)", snapshot.size, version)
+    return snapshot
+
+
+def _reload():
+    global _reload_pending
+    try:
+        load_snapshot()
+    except Exception:
+        logger.exception("Échec du chargement de l'instantané des analytics")
+    finally:
+        with _reload_lock:
+            _reload_pending = False
+
+
+def _schedule_reload():
+    """Lance un rechargement complet en arrière-plan (un seul à la fois)."""
+    global _reload_pending
+    with _reload_lock:
+        if _reload_pending:
+            return
+        _reload_pending = True
+    _get_executor().submit(_reload)
+
+
+def _refresh(snapshot, version, db):
+    """
+    Complète snapshot avec les documents modifiés depuis son filigrane.
+
+    Returns:
+        Snapshot: Instantané à jour, ou None si un rechargement complet est
+        nécessaire (suppression) ou si une écriture concurrente est survenue
+    """
+    collection = db['equipment']
+    started = datetime.now(timezone.utc)
+    since = snapshot.watermark - timedelta(seconds=SNAPSHOT_WATERMARK_LAG)
+    docs = collection.find({'updated_at': {'$gte': since}}, SNAPSHOT_PROJECTION)
+    refreshed = Snapshot.build(version, started, docs, base=snapshot)
+    # Nombre lu dans les métadonnées (pas de parcours) ; un écart éventuel de
+    # l'estimation est corrigé par le rechargement complet périodique
+    if refreshed.size != collection.estimated_document_count():
+        # Des équipements ont été supprimés : non visibles par le filigrane
+        _schedule_reload()
+        return None
+    if get_version_state('equipment', db)['version'] != version:
+        return None
+    return refreshed
+
+
+def get_snapshot(db=None):
+    """
+    Retourne l'instantané s'il correspond à la version courante de
+    'equipment', après un rafraîchissement incrémental si nécessaire.
+
+    Returns:
+        Snapshot: Instantané à jour, ou None (interroger MongoDB)
+    """
+    global _snapshot
+    if not SNAPSHOT_ENABLED:
+        return None
+    db = db if db is not None else get_mongodb_connection()
+    try:
+        state = get_version_state('equipment', db)
+    except Exception:
+        logger.exception("Version de 'equipment' illisible")
+        return None
+
+    snapshot = _snapshot
+    if snapshot is None or state['reset_version'] > snapshot.version:
+        _schedule_reload()
+        return None
+    if time.monotonic() - snapshot.loaded_at > SNAPSHOT_MAX_AGE:
+        _schedule_reload()
+    if snapshot.version == state['version']:
+        return snapshot
+
+    # Un seul rafraîchissement à la fois : les autres requêtes passent par MongoDB
+    if not _refresh_lock.acquire(blocking=False):
+        return None
+    try:
+        refreshed = _refresh(snapshot, state['version'], db)
+        if refreshed is not None and _snapshot is snapshot:
+            _snapshot = refreshed
+        return refreshed
+    except Exception:
+        logger.exception("Échec du rafraîchissement de l'instantané des analytics")
+        return None
+    finally:
+        _refresh_lock.release()
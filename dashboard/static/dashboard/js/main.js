@@ -618,96 +618,64 @@ function groupDataByMonth(data) {
 }
 
 // Fonction pour mettre à jour les graphiques avec les filtres
+// Un seul appel à /api/analytics/summary/ alimente les deux graphiques
 async function updateCharts(filters = {}) {
     const queryString = buildQueryParams(filters);
+    // Périodes calculées côté serveur, dans le fuseau du navigateur
+    const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone || '';
     
+    let summary;
     try {
         console.log('Mise à jour des graphiques avec les filtres:', filters);
-        
-        // 1. Mettre à jour le graphique de répartition par statut
-        try {
-            console.log('Récupération des données de statut...');
-            const statusResponse = await fetch(`${API_BASE_URL}/equipments/?group_by=status&${queryString}`);
-            if (!statusResponse.ok) {
-                throw new Error(`Erreur HTTP: ${statusResponse.status}`);
-            }
-            const statusData = await statusResponse.json();
-            console.log('Données de statut reçues:', statusData);
-            
-            if (window.statusChart) {
-                // Normaliser et regrouper les statuts
-                const normalizedStatuses = {};
-                
-                statusData.forEach(item => {
-                    if (item && item._id) {
-                        const normalized = normalizeStatus(item._id);
-                        normalizedStatuses[normalized] = (normalizedStatuses[normalized] || 0) + (item.count || 0);
-                    }
-                });
-                
-                // Convertir en tableaux pour le graphique
-                const labels = Object.keys(normalizedStatuses);
-                const counts = Object.values(normalizedStatuses);
-                
-                // Vérifier qu'on a des données
-                if (labels.length > 0 && counts.length > 0) {
-                    window.statusChart.data.labels = labels;
-                    window.statusChart.data.datasets[0].data = counts;
-                    window.statusChart.update();
-                    console.log('Graphique de statut mis à jour avec succès');
-                } else {
-                    console.warn('Aucune donnée de statut valide pour mettre à jour le graphique');
-                }
-            } else {
-                console.warn('Le graphique de statut n\'est pas initialisé');
-            }
-        } catch (statusError) {
-            console.error('Erreur lors de la mise à jour du graphique de statut:', statusError);
-            showError('Erreur lors du chargement des statistiques par statut');
+        const response = await fetch(`/api/analytics/summary/?granularity=month&tz=${encodeURIComponent(timezone)}&${queryString}`);
+        if (!response.ok) {
+            throw new Error(`Erreur HTTP: ${response.status}`);
         }
-        
-        // 2. Mettre à jour le graphique d'évolution temporelle
-        try {
-            console.log('Récupération des données d\'évolution temporelle...');
-            const timelineResponse = await fetch(`${API_BASE_URL}/equipments/?group_by=creation_date&${queryString}`);
-            if (!timelineResponse.ok) {
-                throw new Error(`Erreur HTTP: ${timelineResponse.status}`);
-            }
-            const timelineData = await timelineResponse.json();
-            console.log('Données d\'évolution temporelle reçues:', timelineData);
-            
-            if (window.timelineChart) {
-                // Vérifier si nous avons des données
-                if (!Array.isArray(timelineData) || timelineData.length === 0) {
-                    console.warn('Aucune donnée d\'évolution temporelle disponible');
-                    return;
-                }
-                
-                // Grouper les données par mois
-                const monthlyData = groupDataByMonth(timelineData);
-                
-                if (monthlyData.length > 0) {
-                    const labels = monthlyData.map(item => item.label);
-                    const counts = monthlyData.map(item => item.count);
-                    
-                    window.timelineChart.data.labels = labels;
-                    window.timelineChart.data.datasets[0].data = counts;
-                    window.timelineChart.update();
-                    console.log('Graphique d\'évolution temporelle mis à jour avec succès');
-                } else {
-                    console.warn('Aucune donnée valide pour le graphique d\'évolution temporelle après regroupement par mois');
-                }
-            } else {
-                console.warn('Le graphique d\'évolution temporelle n\'est pas initialisé');
-            }
-        } catch (timelineError) {
-            console.error('Erreur lors de la mise à jour du graphique d\'évolution temporelle:', timelineError);
-            // Ne pas afficher d'erreur à l'utilisateur pour éviter les messages redondants
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.error || 'réponse invalide');
         }
-        
+        summary = result.data;
+        console.log('Résumé reçu:', summary);
     } catch (error) {
         console.error('Erreur critique lors de la mise à jour des graphiques:', error);
         showError('Erreur lors de la mise à jour des graphiques');
+        return;
+    }
+    
+    // 1. Graphique de répartition par statut (statuts déjà normalisés côté serveur)
+    if (window.statusChart) {
+        const { labels, counts } = summary.statuses;
+        if (labels.length > 0) {
+            window.statusChart.data.labels = labels;
+            window.statusChart.data.datasets[0].data = counts;
+            window.statusChart.update();
+            console.log('Graphique de statut mis à jour avec succès');
+        } else {
+            console.warn('Aucune donnée de statut valide pour mettre à jour le graphique');
+        }
+    } else {
+        console.warn('Le graphique de statut n\'est pas initialisé');
+    }
+    
+    // Sans filtre, le résumé couvre tout le parc : inutile de recharger les indicateurs
+    if (!queryString) {
+        updateKeyMetrics(summary.statuses);
+    }
+    
+    // 2. Graphique d'évolution temporelle
+    if (window.timelineChart) {
+        const monthlyData = groupDataByMonth(summary.timeline.buckets);
+        if (monthlyData.length > 0) {
+            window.timelineChart.data.labels = monthlyData.map(item => item.label);
+            window.timelineChart.data.datasets[0].data = monthlyData.map(item => item.count);
+            window.timelineChart.update();
+            console.log('Graphique d\'évolution temporelle mis à jour avec succès');
+        } else {
+            console.warn('Aucune donnée d\'évolution temporelle disponible');
+        }
+    } else {
+        console.warn('Le graphique d\'évolution temporelle n\'est pas initialisé');
     }
 }
 
@@ -739,8 +707,12 @@ document.addEventListener('DOMContentLoaded', function() {
         initCharts();
     }
     
-    // Charger d'abord les indicateurs clés
-    loadKeyMetrics();
+    // Charger d'abord les indicateurs clés (fournis par le résumé des graphiques
+    // quand la page en affiche sans filtre)
+    const hasCharts = document.getElementById('statusChart') || document.getElementById('timelineChart');
+    if (!hasCharts || buildQueryParams(filters)) {
+        loadKeyMetrics();
+    }
     
     // Puis charger les autres données avec les filtres initiaux
     // Charger KPI / tableau / graphes uniquement sur les pages équipements
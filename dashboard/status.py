@@ -0,0 +1,65 @@
+"""
+Normalisation des statuts d'équipement.
+
+Les statuts saisis ou importés comportent de nombreuses variantes ('EN SERVICE',
+'en service.', 'HS'...). Le statut normalisé est calculé une seule fois à
+l'écriture (create/update/import, et scripts/backfill_normalized_status.py pour
+les données existantes) et stocké dans le champ indexé ``normalized_status`` :
+les analytics groupent directement sur ce champ au lieu de réévaluer la
+correspondance pour chaque document à chaque requête.
+"""
+from .search import normalize_text
+
+# Statut normalisé attribué aux valeurs absentes ou vides
+STATUS_UNSPECIFIED = 'Non spécifié'
+
+# Statut normalisé attribué aux valeurs non reconnues
+STATUS_OTHER = 'Autre'
+
+# Table de correspondance unique : variante normalisée (minuscules, sans
+# accents ni ponctuation finale) -> statut normalisé
+STATUS_MAPPING = {
+    'en service': 'En service',
+    'service': 'En service',
+    'en stock': 'En stock',
+    'stock': 'En stock',
+    'en panne': 'Hors service',
+    'panne': 'Hors service',
+    'hors service': 'Hors service',
+    'hs': 'Hors service',
+    'h.s': 'Hors service',
+    'maintenance': 'Maintenance',
+    'en maintenance': 'Maintenance',
+    'en reparation': 'Maintenance',
+    'en instance': 'En instance',
+    'instance': 'En instance',
+}
+
+# Statuts normalisés possibles
+NORMALIZED_STATUSES = tuple(dict.fromkeys(STATUS_MAPPING.values())) + (STATUS_OTHER, STATUS_UNSPECIFIED)
+
+
+def normalize_status(value):
+    """
+    Retourne le statut normalisé d'une valeur brute.
+
+    Args:
+        value: Statut tel que saisi ou importé
+
+    Returns:
+        str: Un des NORMALIZED_STATUSES
+    """
+    text = normalize_text(value).rstrip(' .')
+    if not text:
+        return STATUS_UNSPECIFIED
+    return STATUS_MAPPING.get(text, STATUS_OTHER)
+
+
+def build_status_fields(doc):
+    """
+    Calcule le champ normalized_status d'un document équipement.
+
+    Returns:
+        dict: {'normalized_status': ...} à fusionner dans le document
+    """
+    return {'normalized_status': normalize_status(doc.get('status'))}
@@ -1,2 +1,1758 @@
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import unittest
+import zipfile
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from bson import Decimal128, ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from . import db as mongodb
+
+from . import (
+    api, api_locations, bucketing, clustering, conditional, counting, export_jobs, exports, geo, projection,
+    relations, renderers, response_cache, rollups, search, snapshot, status, versions, views,
+)
+from .filters import InvalidFilter, get_timezone, parse_period
+from .keyset import BSON_TYPE_ORDER, InvalidCursor, bson_type_rank, decode_cursor, fetch_keyset_page
+
+_TYPE_RANKS = {alias: rank for rank, aliases in enumerate(BSON_TYPE_ORDER) for alias in aliases}
+
+
+_COMPARISONS = {
+    '$gt': lambda value, arg: value > arg,
+    '$lt': lambda value, arg: value < arg,
+    '$gte': lambda value, arg: value >= arg,
+    '$lte': lambda value, arg: value <= arg,
+}
+
+
+def _sort_key(value):
+    """Clé de tri reproduisant l'ordre MongoDB (null/absent, puis par type BSON)."""
+    rank = bson_type_rank(value)
+    return (-1, 0) if rank is None else (rank, value)
+
+
+def _get_path(doc, path):
+    """Valeur d'un champ en notation pointée (None si absent)."""
+    value = doc
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _has_path(doc, path):
+    """Indique si un champ (notation pointée) est présent."""
+    value = doc
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return False
+        value = value[part]
+    return True
+
+
+def _within(point, polygon):
+    """Point GeoJSON dans un polygone de requête (bande rectangulaire lng/lat)."""
+    if not isinstance(point, dict):
+        return False
+    lng, lat = point['coordinates']
+    ring = polygon['coordinates'][0]
+    lngs, lats = [vertex[0] for vertex in ring], [vertex[1] for vertex in ring]
+    return min(lngs) <= lng <= max(lngs) and min(lats) <= lat <= max(lats)
+
+
+def _matches(doc, query):
+    """Évalue le sous-ensemble des opérateurs de requête MongoDB utilisés par l'API."""
+    for key, condition in query.items():
+        if key == '$or':
+            if not any(_matches(doc, clause) for clause in condition):
+                return False
+            continue
+        if key == '$and':
+            if not all(_matches(doc, clause) for clause in condition):
+                return False
+            continue
+        value = _get_path(doc, key)
+        if isinstance(condition, dict):
+            for op, arg in condition.items():
+                if op == '$type':
+                    ok = value is not None and bson_type_rank(value) in {_TYPE_RANKS[alias] for alias in arg}
+                elif op in ('$gt', '$lt', '$gte', '$lte'):
+                    # Comparaison restreinte aux valeurs du même type BSON
+                    ok = (value is not None and bson_type_rank(value) == bson_type_rank(arg)
+                          and _COMPARISONS[op](value, arg))
+                elif op == '$ne':
+                    ok = value != arg
+                elif op == '$in':
+                    ok = value in arg
+                elif op == '$regex':
+                    flags = re.IGNORECASE if 'i' in condition.get('$options', '') else 0
+                    ok = isinstance(value, str) and re.search(arg, value, flags) is not None
+                elif op == '$options':
+                    ok = True
+                elif op == '$exists':
+                    ok = _has_path(doc, key) == bool(arg)
+                elif op == '$all':
+                    ok = isinstance(value, list) and all(item in value for item in arg)
+                elif op == '$geoWithin':
+                    ok = _within(value, arg['$geometry'])
+                else:
+                    raise AssertionError(f'Opérateur non géré : {op}')
+                if not ok:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(doc, projection):
+    """Copie d'un document restreinte par une projection (champs racine)."""
+    if not projection:
+        return dict(doc)
+    roots = {field.split('.', 1)[0]: flag for field, flag in projection.items()}
+    if any(flag for field, flag in roots.items() if field != '_id'):
+        return {field: value for field, value in doc.items() if field == '_id' or roots.get(field)}
+    return {field: value for field, value in doc.items() if roots.get(field, 1)}
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, spec, direction=None):
+        if direction is not None:
+            spec = [(spec, direction)]
+        for field, direction in reversed(spec):
+            self.docs.sort(key=lambda doc: _sort_key(doc.get(field)), reverse=direction == -1)
+        return self
+
+    def skip(self, count):
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class _Collection:
+    full_name = 'test.collection'
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def count_documents(self, query):
+        return sum(1 for doc in self.docs if _matches(doc, query))
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+    def find(self, query=None, projection=None, **kwargs):
+        return _Cursor([_project(doc, projection) for doc in self.docs if _matches(doc, query or {})])
+
+    def find_one(self, query=None, projection=None, sort=None):
+        cursor = self.find(query, projection)
+        if sort:
+            cursor.sort(sort)
+        return next(iter(cursor), None)
+
+    def insert_one(self, doc):
+        doc.setdefault('_id', ObjectId())
+        self.docs.append(dict(doc))
+
+    def create_index(self, keys, **kwargs):
+        pass
+
+    def delete_one(self, query):
+        doc = next((doc for doc in self.docs if _matches(doc, query)), None)
+        if doc is not None:
+            self.docs.remove(doc)
+
+    def bulk_write(self, operations, ordered=True):
+        # Opérations UpdateOne/DeleteOne de pymongo (attributs privés)
+        for operation in operations:
+            if isinstance(operation, UpdateOne):
+                self.update_one(operation._filter, operation._doc, upsert=operation._upsert)
+            else:
+                self.delete_one(operation._filter)
+
+    def update_one(self, query, update, upsert=False):
+        doc = next((doc for doc in self.docs if _matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return
+            doc = {field: value for field, value in query.items() if not field.startswith('$')}
+            doc.setdefault('_id', ObjectId())
+            self.docs.append(doc)
+        for field, value in update.get('$set', {}).items():
+            doc[field] = value
+        for field, value in update.get('$inc', {}).items():
+            doc[field] = doc.get(field, 0) + value
+
+
+def _database(**collections):
+    """Base en mémoire : collections nommées, vides si non fournies."""
+    db = defaultdict(lambda: _Collection([]))
+    for name, docs in collections.items():
+        db[name] = _Collection(docs)
+    return db
+
+
+_mongodb_available = None
+
+
+def _mongodb_reachable():
+    """Serveur MongoDB de DB_HOST joignable (vérifié une fois par exécution)."""
+    global _mongodb_available
+    if _mongodb_available is None:
+        _mongodb_available = mongodb.check_mongodb_health()[0]
+    return _mongodb_available
+
+
+class MongoTestCase(SimpleTestCase):
+    """
+    Tests exécutés sur un vrai serveur MongoDB (DB_HOST/DB_PORT), dans la base
+    '<DB_NAME>_test' vidée avant chaque test. Ignorés si le serveur est
+    injoignable.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if not _mongodb_reachable():
+            raise unittest.SkipTest('Serveur MongoDB injoignable')
+        config = mongodb.MONGODB_CONFIG['default']
+        cls._config_patcher = mock.patch.dict(config, name=f"{config['name']}_test")
+        cls._config_patcher.start()
+        cls.db = mongodb.get_mongodb_connection()
+
+    @classmethod
+    def tearDownClass(cls):
+        if hasattr(cls, '_config_patcher'):
+            cls.db.client.drop_database(cls.db.name)
+            cls._config_patcher.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        for name in self.db.list_collection_names():
+            self.db.drop_collection(name)
+
+
+class KeysetMixedTypesTests(SimpleTestCase):
+    """Pagination par curseur sur un champ aux valeurs de types différents."""
+
+    def setUp(self):
+        values = [None, 5, 12345.0, 2, 'abc', '100', 'xyz', 7.5,
+                  datetime(2024, 1, 1, tzinfo=timezone.utc), '12345', 3, None]
+        self.docs = [{'_id': ObjectId(), 'barcode': value} for value in values]
+        self.docs.append({'_id': ObjectId()})
+        self.collection = _Collection(self.docs)
+
+    def _expected(self, sort_order):
+        docs = sorted(self.docs, key=lambda doc: doc['_id'], reverse=sort_order == -1)
+        docs.sort(key=lambda doc: _sort_key(doc.get('barcode')), reverse=sort_order == -1)
+        return [doc['_id'] for doc in docs]
+
+    def _walk(self, sort_order):
+        pages = []
+        token = ''
+        while True:
+            docs, next_token, prev_token = fetch_keyset_page(
+                self.collection, {}, None, 'barcode', sort_order, 3, token
+            )
+            pages.append((docs, prev_token))
+            if not next_token:
+                return pages
+            token = next_token
+
+    def test_forward_pages_cover_every_type(self):
+        for sort_order in (1, -1):
+            with self.subTest(sort_order=sort_order):
+                pages = self._walk(sort_order)
+                seen = [doc['_id'] for docs, _ in pages for doc in docs]
+                self.assertEqual(seen, self._expected(sort_order))
+
+    def test_backward_pages_cover_every_type(self):
+        for sort_order in (1, -1):
+            with self.subTest(sort_order=sort_order):
+                pages = self._walk(sort_order)
+                docs, token = pages[-1]
+                seen = [doc['_id'] for doc in docs]
+                while token:
+                    docs, _, token = fetch_keyset_page(
+                        self.collection, {}, None, 'barcode', sort_order, 3, token
+                    )
+                    seen = [doc['_id'] for doc in docs] + seen
+                self.assertEqual(seen, self._expected(sort_order))
+
+
+class DecodeCursorTests(SimpleTestCase):
+
+    def _token(self, raw):
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def test_invalid_object_id_is_rejected(self):
+        token = self._token('{"f": "_id", "o": 1, "v": null, "id": {"$oid": "zz"}, "d": "next"}')
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(token, '_id', 1)
+
+    def test_invalid_decimal_is_rejected(self):
+        token = self._token('{"f": "_id", "o": 1, "v": null, "id": {"$numberDecimal": "x"}, "d": "next"}')
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(token, '_id', 1)
+
+
+class LookupNumericBarcodeTests(SimpleTestCase):
+    """Recherche exacte d'un code-barres numérique importé en flottant par pandas."""
+
+    def setUp(self):
+        api._lookup_cache.clear()
+        self.original = {'_id': ObjectId(), 'barcode': 12345.0}
+        self.duplicates = [
+            {'_id': ObjectId(), 'barcode': '12345.0_dup_2'},
+            {'_id': ObjectId(), 'barcode': '12345.0_dup_1'},
+        ]
+        other = {'_id': ObjectId(), 'barcode': '123456'}
+        db = {'equipment': _Collection([*self.duplicates, other, self.original])}
+        patcher = mock.patch.object(api, 'get_mongodb_connection', return_value=db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(api._lookup_cache.clear)
+
+    def test_float_barcode_duplicates_are_surfaced(self):
+        result = api.lookup_equipment('barcode', '12345')
+        self.assertEqual(result['result']['_id'], str(self.original['_id']))
+        self.assertEqual(
+            [doc['barcode'] for doc in result['duplicates']],
+            ['12345.0_dup_1', '12345.0_dup_2'],
+        )
+        self.assertTrue(result['ambiguous'])
+
+    def test_writing_a_float_barcode_invalidates_the_scanned_key(self):
+        api.lookup_equipment('barcode', '12345')
+        self.assertIsNotNone(api._lookup_cache.get(('barcode', '12345')))
+        api.invalidate_lookup_cache(doc={'barcode': '12345.0_dup_1'})
+        self.assertIsNone(api._lookup_cache.get(('barcode', '12345')))
+
+
+class EquipmentBatchTests(SimpleTestCase):
+    """Récupération groupée par code-barres."""
+
+    def setUp(self):
+        self.numeric = {'_id': ObjectId(), 'barcode': 12345.0}
+        self.text = {'_id': ObjectId(), 'barcode': 'AB-1'}
+        db = {'equipment': _Collection([self.numeric, self.text])}
+        patcher = mock.patch.object(api, 'get_mongodb_connection', return_value=db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_float_barcode_is_found_under_the_requested_key(self):
+        results = api.get_equipments_batch(['12345', 'AB-1', '999'], key_field='barcode')
+        self.assertEqual([result['key'] for result in results], ['12345', 'AB-1', '999'])
+        self.assertEqual([result['found'] for result in results], [True, True, False])
+        self.assertEqual(results[0]['equipment']['_id'], str(self.numeric['_id']))
+        self.assertEqual(results[1]['equipment']['_id'], str(self.text['_id']))
+
+
+class EvolutionWindowTests(SimpleTestCase):
+    """Nombre de périodes de la fenêtre d'évolution."""
+
+    def test_months_yield_as_many_monthly_periods(self):
+        tz = get_timezone('Africa/Casablanca')
+        for months in (1, 6, 12, 24):
+            for params in ({'months': str(months)}, {'months': str(months), 'to': '2026-10-17'},
+                           {'months': str(months), 'to': '2024-03-31'}):
+                with self.subTest(**params):
+                    period = parse_period(params, tz)
+                    periods, granularity, _, _ = api._evolution_window(period, 'month', tz)
+                    self.assertEqual(granularity, 'month')
+                    self.assertEqual(len(periods), months)
+
+    def test_default_window_ends_with_the_month_of_the_end_date(self):
+        tz = get_timezone('UTC')
+        periods, _, window_start, _ = api._evolution_window(parse_period({'to': '2026-10-17'}, tz), 'month', tz)
+        self.assertEqual((periods[0].year, periods[0].month), (2025, 11))
+        self.assertEqual((periods[-1].year, periods[-1].month), (2026, 10))
+        self.assertEqual(window_start, datetime(2025, 11, 1, tzinfo=timezone.utc))
+
+
+class _FrozenDatetime(datetime):
+    """datetime dont now() renvoie l'instant fixé par la classe de test."""
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current.astimezone(tz) if tz else cls.current
+
+
+class ConditionalRelativeRangeTests(SimpleTestCase):
+    """ETag des listes filtrées par une plage relative (<champ>_range=today...)."""
+
+    def setUp(self):
+        patchers = [
+            mock.patch.object(conditional, 'get_versions_info', return_value=({'equipment': 3}, None)),
+            mock.patch.object(conditional, 'datetime', _FrozenDatetime),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.view = conditional.conditional_response('equipment-list', ('equipment',))(
+            lambda request: HttpResponse('[]', content_type='application/json')
+        )
+        self.factory = RequestFactory()
+
+    def _get(self, params, now, etag=None):
+        _FrozenDatetime.current = now
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.view(self.factory.get('/api/equipments/', params, **headers))
+
+    def test_relative_range_is_revalidated_after_midnight(self):
+        params = {'creation_date_range': 'today', 'tz': 'Africa/Casablanca'}
+        tz = get_timezone('Africa/Casablanca')
+        evening = datetime(2026, 10, 17, 23, 30, tzinfo=tz)
+        etag = self._get(params, evening)['ETag']
+
+        self.assertEqual(self._get(params, evening + timedelta(minutes=20), etag).status_code, 304)
+        response = self._get(params, evening + timedelta(minutes=40), etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_absolute_filters_keep_their_etag_across_midnight(self):
+        params = {'creation_date_gte': '2026-01-01'}
+        evening = datetime(2026, 10, 17, 23, 30, tzinfo=timezone.utc)
+        etag = self._get(params, evening)['ETag']
+        self.assertEqual(self._get(params, evening + timedelta(hours=1), etag).status_code, 304)
+
+
+class SearchClauseTests(SimpleTestCase):
+    """Clauses des filtres texte selon le mode de recherche."""
+
+    def setUp(self):
+        self.docs = []
+        for serial in ('SN-Élan 0042', 'XYZ-0001', 'ab'):
+            doc = {'_id': ObjectId(), 'serial': serial}
+            doc.update(search.build_search_fields(doc))
+            self.docs.append(doc)
+
+    def _found(self, clause):
+        return [doc['serial'] for doc in self.docs if _matches(doc, clause)]
+
+    def test_normalize_text(self):
+        self.assertEqual(search.normalize_text('  Élan   ÉTÉ '), 'elan ete')
+        self.assertEqual(search.normalize_text(12345.0), '12345')
+        self.assertEqual(search.normalize_text(None), '')
+
+    def test_regex_mode_escapes_the_value(self):
+        clause = search.build_text_clause('serial', 'sn-élan 0042', mode='regex')
+        self.assertEqual(clause, {'serial': {'$regex': re.escape('sn-élan 0042'), '$options': 'i'}})
+        self.assertEqual(self._found(search.build_text_clause('serial', 'a.', mode='regex')), [])
+
+    def test_indexed_modes(self):
+        self.assertEqual(self._found(search.build_text_clause('serial', 'sn-elan 0042', mode='exact')),
+                         ['SN-Élan 0042'])
+        self.assertEqual(self._found(search.build_text_clause('serial', 'XYZ', mode='prefix')), ['XYZ-0001'])
+        self.assertEqual(self._found(search.build_text_clause('serial', 'élan 00', mode='ngram')),
+                         ['SN-Élan 0042'])
+        # Terme plus court qu'un trigramme : regex sur le champ normalisé
+        self.assertEqual(search.build_text_clause('serial', 'AB', mode='ngram'), {'_search.serial': {'$regex': 'ab'}})
+        self.assertEqual(self._found(search.build_text_clause('serial', '0', mode='ngram')),
+                         ['SN-Élan 0042', 'XYZ-0001'])
+
+    def test_empty_value_and_unindexed_field(self):
+        self.assertIsNone(search.build_text_clause('serial', '   ', mode='ngram'))
+        self.assertEqual(search.build_text_clause('status', 'HS', mode='ngram'),
+                         {'status': {'$regex': 'HS', '$options': 'i'}})
+
+
+@mock.patch.dict(os.environ, {'EQUIPMENT_SEARCH_BACKFILLED': ''})
+class SearchBackfillFallbackTests(SimpleTestCase):
+    """Repli sur le mode regex tant que le backfill n'a pas été exécuté."""
+
+    def setUp(self):
+        patchers = [
+            mock.patch.object(search, '_backfill_done', False),
+            mock.patch.object(search, '_backfill_checked_at', None),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.db = _database()
+        patcher = mock.patch.object(search, 'get_mongodb_connection', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_regex_until_the_marker_exists(self):
+        with self.assertLogs('dashboard.search', 'WARNING'):
+            self.assertEqual(set(search.get_search_modes().values()), {'regex'})
+        clause = search.build_text_clause('serial', 'XYZ')
+        self.assertEqual(clause, {'serial': {'$regex': 'XYZ', '$options': 'i'}})
+        # Document sans champs de recherche (données antérieures) : trouvé
+        self.assertTrue(_matches({'serial': 'xyz-0001'}, clause))
+
+    def test_indexed_modes_once_the_backfill_ran(self):
+        search.mark_search_backfill_done(self.db)
+        with mock.patch.object(search, 'SEARCH_BACKFILL_CHECK_INTERVAL', 0):
+            self.assertEqual(search.get_search_modes()['serial'], 'ngram')
+        self.assertIn('_search_ngrams', search.build_text_clause('serial', 'XYZ'))
+
+    def test_negative_answer_is_rechecked_after_the_interval(self):
+        with self.assertLogs('dashboard.search', 'WARNING'):
+            self.assertFalse(search.search_backfill_done())
+        search.mark_search_backfill_done(self.db)
+        self.assertFalse(search.search_backfill_done())
+        with mock.patch.object(search, 'SEARCH_BACKFILL_CHECK_INTERVAL', 0):
+            self.assertTrue(search.search_backfill_done())
+
+    def test_environment_override(self):
+        with mock.patch.dict(os.environ, {'EQUIPMENT_SEARCH_BACKFILLED': 'True'}):
+            self.assertEqual(search.get_search_modes()['model'], 'ngram')
+
+
+class CountModeTests(SimpleTestCase):
+    """Calcul du total des listes selon le paramètre count."""
+
+    def setUp(self):
+        counting._count_cache.clear()
+        self.addCleanup(counting._count_cache.clear)
+        self.collection = _Collection([{'_id': i, 'status': 'HS' if i % 3 else 'OK'} for i in range(9)])
+
+    def test_exact(self):
+        with mock.patch.object(self.collection, 'count_documents', wraps=self.collection.count_documents) as count:
+            self.assertEqual(counting.get_total(self.collection, {'status': 'OK'}), (3, False))
+            self.assertEqual(counting.get_total(self.collection, {'status': 'OK'}), (3, False))
+        self.assertEqual(count.call_count, 2)
+
+    def test_estimated_without_filter_reads_the_metadata(self):
+        with mock.patch.object(self.collection, 'count_documents') as count:
+            total = counting.get_total(self.collection, {}, 'estimated', unfiltered=True)
+        self.assertEqual(total, (9, True))
+        count.assert_not_called()
+
+    def test_cached_total_is_reused_until_it_expires(self):
+        query = {'status': 'HS', '_id': {'$ne': 0}}
+        with mock.patch.object(self.collection, 'count_documents', wraps=self.collection.count_documents) as count:
+            self.assertEqual(counting.get_total(self.collection, query, 'cached'), (6, False))
+            # Même filtre, clés dans un autre ordre : même entrée de cache
+            reordered = {'_id': {'$ne': 0}, 'status': 'HS'}
+            self.assertEqual(counting.get_total(self.collection, reordered, 'estimated'), (6, True))
+            self.assertEqual(count.call_count, 1)
+            counting._count_cache.clear()
+            self.assertEqual(counting.get_total(self.collection, query, 'cached'), (6, False))
+            self.assertEqual(count.call_count, 2)
+
+    def test_facet_returns_the_page_and_the_total(self):
+        collection = mock.Mock()
+        collection.aggregate.return_value = iter([{'results': [{'_id': 3}], 'total': [{'n': 7}]}])
+        docs, total = counting.fetch_page_with_total(collection, {'status': 'HS'}, {'status': 1},
+                                                     [('_id', 1)], 2, 1)
+        self.assertEqual((docs, total), ([{'_id': 3}], 7))
+        pipeline = collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0], {'$match': {'status': 'HS'}})
+        self.assertEqual(pipeline[1]['$facet']['results'],
+                         [{'$sort': {'_id': 1}}, {'$skip': 2}, {'$limit': 1}, {'$project': {'status': 1}}])
+
+    def test_facet_without_match(self):
+        collection = mock.Mock()
+        collection.aggregate.return_value = iter([{'results': [], 'total': []}])
+        self.assertEqual(counting.fetch_page_with_total(collection, {}, None, [('_id', 1)], 0, 10), ([], 0))
+
+    def test_location_totals_respect_the_base_filter(self):
+        docs = [{'_id': ObjectId(), 'site_name': f'Site {i}', 'province': 'P', 'region': 'R'} for i in range(3)]
+        docs.append({'_id': ObjectId(), 'name': 'hors CSV'})
+        db = _database(locations=docs)
+        with mock.patch.object(api_locations, 'get_mongodb_connection', return_value=db):
+            result = api_locations.get_locations(count_mode='estimated')
+        self.assertEqual(result['total'], 3)
+        self.assertEqual(len(result['results']), 3)
+
+
+class ProjectionTests(SimpleTestCase):
+    """Sélection des champs renvoyés (fields=)."""
+
+    def test_fields_outside_the_allowlist_are_rejected(self):
+        for raw in ('model,password', '_search', '_search_ngrams.x', 'normalized_status'):
+            with self.subTest(raw=raw), self.assertRaises(projection.InvalidFields):
+                projection.parse_fields(raw, projection.EQUIPMENT_FIELDS)
+
+    def test_fields_are_deduplicated(self):
+        self.assertEqual(
+            projection.parse_fields(' services.tnt, site_name,services,site_name,', projection.LOCATION_FIELDS),
+            ['site_name', 'services'],
+        )
+        self.assertIsNone(projection.parse_fields('', projection.LOCATION_FIELDS))
+        self.assertIsNone(projection.parse_fields(' , ', projection.LOCATION_FIELDS))
+
+    def test_build_projection(self):
+        self.assertIsNone(projection.build_projection(None, extra=('model',)))
+        self.assertEqual(projection.build_projection(['serial'], extra=('model', None)),
+                         {'_id': 1, 'serial': 1, 'model': 1})
+
+    def test_list_view_rejects_unknown_fields(self):
+        request = RequestFactory().get('/api/equipments/', {'fields': 'model,password'})
+        with mock.patch.object(conditional, 'get_versions_info', return_value=({}, None)), \
+                mock.patch.object(views, 'get_equipments') as get_equipments:
+            response = views.EquipmentListView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.data['error'])
+        get_equipments.assert_not_called()
+
+    def test_cursor_sort_key_is_not_returned_unless_requested(self):
+        docs = [{'_id': ObjectId(), 'site_name': f'Site {i}', 'province': f'P{i % 2}', 'region': 'R'}
+                for i in range(5)]
+        db = _database(locations=docs)
+        with mock.patch.object(api_locations, 'get_mongodb_connection', return_value=db):
+            first = api_locations.get_locations(page_size=2, cursor='', fields=['province'])
+            second = api_locations.get_locations(page_size=2, cursor=first['next'], fields=['province'])
+            requested = api_locations.get_locations(page_size=2, cursor='', fields=['province', 'site_name'])
+        self.assertEqual([set(doc) for doc in first['results']], [{'_id', 'province'}] * 2)
+        self.assertEqual([doc['_id'] for doc in first['results'] + second['results']],
+                         [str(doc['_id']) for doc in docs[:4]])
+        self.assertEqual(requested['results'][0]['site_name'], 'Site 0')
+
+
+class ViewportTests(SimpleTestCase):
+    """Zone d'affichage de la carte (?bbox=, ?zoom=) et requêtes $geoWithin."""
+
+    def test_invalid_bbox_or_zoom(self):
+        for params in ({'bbox': '1,2,3'}, {'bbox': '1,2,x,4'}, {'bbox': '0,10,5,5'}, {'bbox': '0,-95,5,5'},
+                       {'bbox': '5,0,1,1'}, {'bbox': '0,0,1,1', 'zoom': 'x'},
+                       {'bbox': '0,0,1,1', 'zoom': str(geo.MAX_ZOOM + 1)}):
+            with self.subTest(params=params), self.assertRaises(InvalidFilter):
+                geo.parse_viewport(params)
+        self.assertIsNone(geo.parse_viewport({}))
+
+    def test_zoom_snaps_to_tile_bounds(self):
+        # Niveau 4 : tuiles de 22,5° ; deux zones voisines donnent la même requête
+        self.assertEqual(geo.parse_viewport({'bbox': '-1.3,5.1,2.2,6.9', 'zoom': '4'}), (-22.5, 0, 22.5, 22.5))
+        self.assertEqual(geo.parse_viewport({'bbox': '-1.1,5.4,2.5,7.2', 'zoom': '4'}), (-22.5, 0, 22.5, 22.5))
+        self.assertEqual(geo.parse_viewport({'bbox': '-1.3,5.1,2.2,6.9'}), (-1.3, 5.1, 2.2, 6.9))
+        self.assertEqual(geo.parse_viewport({'bbox': '-179,-89,179,89', 'zoom': '0'}), (-360, -90, 360, 90))
+
+    def test_longitude_ranges_split_at_the_antimeridian(self):
+        self.assertEqual(geo._lng_ranges(-10, 20), [(-10, 20)])
+        self.assertEqual(geo._lng_ranges(170, 190), [(170, 180.0), (-180.0, -170)])
+        self.assertEqual(geo._lng_ranges(-200, -170), [(160, 180.0), (-180.0, -170)])
+        self.assertEqual(geo._lng_ranges(190, 200), [(-170, -160)])
+        self.assertEqual(geo._lng_ranges(-360, 360), [(-180.0, 180.0)])
+
+    def test_query_polygons_stay_under_a_hemisphere(self):
+        clauses = geo.viewport_query((170, -10, 190, 10))['$or']
+        self.assertEqual(len(clauses), 2)
+        clauses = geo.viewport_query((-360, -90, 360, 90))['$or']
+        self.assertEqual(len(clauses), 4)
+        for clause in clauses:
+            ring = clause['geo']['$geoWithin']['$geometry']['coordinates'][0]
+            lngs, lats = [vertex[0] for vertex in ring], [vertex[1] for vertex in ring]
+            self.assertLessEqual(max(lngs) - min(lngs), geo._MAX_POLYGON_WIDTH)
+            self.assertLessEqual(max(abs(lat) for lat in lats), geo._MAX_LATITUDE)
+        self.assertIn('$geoWithin', geo.viewport_query((0, 0, 10, 10))['geo'])
+
+    def test_contains(self):
+        viewport = (170, -10, 190, 10)
+        self.assertTrue(geo.viewport_contains(viewport, 175, 0))
+        self.assertTrue(geo.viewport_contains(viewport, -175, 10))
+        self.assertFalse(geo.viewport_contains(viewport, -165, 0))
+        self.assertFalse(geo.viewport_contains(viewport, 0, 0))
+        self.assertFalse(geo.viewport_contains(viewport, 175, 10.5))
+
+
+@mock.patch.dict(os.environ, {'LOCATION_GEO_BACKFILLED': ''})
+class MapDataTests(SimpleTestCase):
+    """Sites de la carte, avec repli sur les anciens champs tant que le backfill n'a pas été exécuté."""
+
+    def setUp(self):
+        patchers = [
+            mock.patch.object(geo, '_backfill_done', False),
+            mock.patch.object(geo, '_backfill_checked_at', None),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.db = _database(locations=[
+            {'_id': ObjectId(), 'site_name': 'Migré', 'geo': {'type': 'Point', 'coordinates': [2.0, 6.0]},
+             'coordinates': {'latitude': 6.0, 'longitude': 2.0, 'altitude': 12}},
+            {'_id': ObjectId(), 'site_name': 'Ancien lat/lng', 'lat': '6.5', 'lng': '179.5'},
+            {'_id': ObjectId(), 'site_name': 'Ancien coordinates',
+             'coordinates': {'latitude': 5.0, 'longitude': -179.0, 'altitude': 3}},
+            {'_id': ObjectId(), 'site_name': 'Migré sans position', 'geo': None},
+            {'_id': ObjectId(), 'site_name': 'Ancien sans position', 'latitude': 'n/a'},
+        ])
+        patcher = mock.patch.object(api_locations, 'get_mongodb_connection', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _names(self, viewport=None):
+        return sorted(site['name'] for site in api_locations.get_locations_for_map(viewport))
+
+    def test_legacy_coordinates_until_the_marker_exists(self):
+        with self.assertLogs('dashboard.geo', 'WARNING'):
+            sites = api_locations.get_locations_for_map()
+        self.assertEqual(sorted(site['name'] for site in sites), ['Ancien coordinates', 'Ancien lat/lng', 'Migré'])
+        legacy = next(site for site in sites if site['name'] == 'Ancien coordinates')
+        self.assertEqual((legacy['lat'], legacy['lng'], legacy['altitude']), (5.0, -179.0, 3))
+        # Zone à cheval sur l'antiméridien : positions calculées filtrées par la zone
+        self.assertEqual(self._names((170, 0, 190, 10)), ['Ancien coordinates', 'Ancien lat/lng'])
+        self.assertEqual(self._names((0, 0, 10, 10)), ['Migré'])
+
+    def test_geo_field_only_once_the_backfill_ran(self):
+        geo.mark_geo_backfill_done(self.db)
+        with mock.patch.object(geo, 'GEO_BACKFILL_CHECK_INTERVAL', 0):
+            sites = api_locations.get_locations_for_map()
+        self.assertEqual([(site['name'], site['altitude']) for site in sites], [('Migré', 12)])
+        self.assertEqual(self._names((170, 0, 190, 10)), [])
+
+    def test_negative_answer_is_rechecked_after_the_interval(self):
+        with self.assertLogs('dashboard.geo', 'WARNING'):
+            self.assertFalse(geo.geo_backfill_done(self.db))
+        geo.mark_geo_backfill_done(self.db)
+        self.assertFalse(geo.geo_backfill_done(self.db))
+        with mock.patch.object(geo, 'GEO_BACKFILL_CHECK_INTERVAL', 0):
+            self.assertTrue(geo.geo_backfill_done(self.db))
+
+    def test_environment_override(self):
+        with mock.patch.dict(os.environ, {'LOCATION_GEO_BACKFILLED': 'True'}):
+            self.assertEqual(self._names(), ['Migré'])
+
+
+def _site(lng, lat, **fields):
+    """Localisation positionnée (champ geo) pour les tests de la carte."""
+    return {'_id': ObjectId(), 'site_name': f'Site {lng},{lat}', 'geo': {'type': 'Point', 'coordinates': [lng, lat]},
+            **fields}
+
+
+class TileClusteringTests(SimpleTestCase):
+    """Groupes de sites par tuile de la carte."""
+
+    def setUp(self):
+        patcher = mock.patch.object(clustering, '_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sites = [_site(-179.5 + (i * 37) % 359, -80 + (i * 53) % 160) for i in range(80)]
+        # Bords de la grille : antiméridien et latitudes hors projection
+        sites += [_site(180.0, 0.0), _site(-180.0, 0.0), _site(0.0, 89.0), _site(0.0, -89.0)]
+        self.positioned = len(sites)
+        self.db = _database(locations=sites + [{'_id': ObjectId(), 'site_name': 'Sans position', 'geo': None}])
+
+    def _tiles(self, z):
+        for x in range(2 ** z):
+            for y in range(2 ** z):
+                yield clustering.get_tile_clusters(z, x, y, db=self.db)
+
+    def test_invalid_tiles(self):
+        for z, x, y in ((-1, 0, 0), (geo.MAX_ZOOM + 1, 0, 0), (0, 1, 0), (2, 4, 0), (2, 0, 4), (2, -1, 0)):
+            with self.subTest(tile=(z, x, y)), self.assertRaises(clustering.InvalidTile):
+                clustering.get_tile_clusters(z, x, y, db=self.db)
+
+    def test_each_site_is_counted_once_across_tiles(self):
+        for z in range(4):
+            with self.subTest(z=z):
+                total = 0
+                for tile in self._tiles(z):
+                    total += len(tile['sites']) + sum(cluster['count'] for cluster in tile['clusters'])
+                self.assertEqual(total, self.positioned)
+
+    def test_sites_are_returned_individually_from_the_max_zoom(self):
+        with mock.patch.object(clustering, 'CLUSTER_MAX_ZOOM', 3):
+            tiles = list(self._tiles(3))
+        ids = [site['_id'] for tile in tiles for site in tile['sites']]
+        self.assertEqual(len(ids), self.positioned)
+        self.assertEqual(len(set(ids)), self.positioned)
+        self.assertFalse(any(tile['clusters'] for tile in tiles))
+
+    def test_cluster_aggregates(self):
+        db = _database(locations=[
+            _site(2.0, 6.0, services={'tnt': True, 'fm': True}),
+            _site(2.01, 6.01, services={'tnt': True}),
+            _site(10.0, 10.0),
+        ])
+        tile = clustering.get_tile_clusters(5, 16, 15, db=db)
+        # Site seul dans sa cellule : renvoyé tel quel
+        self.assertEqual([site['name'] for site in tile['sites']], ['Site 10.0,10.0'])
+        cluster, = tile['clusters']
+        self.assertEqual(cluster['count'], 2)
+        self.assertEqual(cluster['services'], {'tnt': 2, 'fm': 1, 'am': 0})
+        self.assertEqual(cluster['bounds'], [2.0, 6.0, 2.01, 6.01])
+        self.assertAlmostEqual(cluster['lat'], 6.005)
+        self.assertAlmostEqual(cluster['lng'], 2.005)
+
+    def test_index_is_rebuilt_on_a_new_version(self):
+        locations = self.db['locations']
+        with mock.patch.object(locations, 'find', wraps=locations.find) as find:
+            clustering.get_tile_clusters(0, 0, 0, db=self.db)
+            clustering.get_tile_clusters(1, 0, 0, db=self.db)
+            self.assertEqual(find.call_count, 1)
+            locations.insert_one(_site(1.0, 1.0))
+            self.db[versions.VERSIONS_COLLECTION].update_one(
+                {'_id': 'locations'}, {'$inc': {'version': 1}}, upsert=True)
+            tile = clustering.get_tile_clusters(0, 0, 0, db=self.db)
+        self.assertEqual(find.call_count, 2)
+        self.assertEqual(sum(cluster['count'] for cluster in tile['clusters']) + len(tile['sites']),
+                         self.positioned + 1)
+
+
+class BucketingTests(SimpleTestCase):
+    """Périodes des regroupements par date (group_by=creation_date)."""
+
+    def test_truncate_and_next_period(self):
+        day = date(2024, 11, 14)  # jeudi
+        self.assertEqual(bucketing.truncate_date(day, 'week'), date(2024, 11, 11))
+        self.assertEqual(bucketing.truncate_date(day, 'quarter'), date(2024, 10, 1))
+        self.assertEqual(bucketing.next_period(date(2024, 12, 1), 'month'), date(2025, 1, 1))
+        self.assertEqual(bucketing.next_period(date(2024, 10, 1), 'quarter'), date(2025, 1, 1))
+        self.assertEqual(bucketing.next_period(date(2024, 12, 30), 'week'), date(2025, 1, 6))
+
+    def test_granularity_is_widened_above_the_cap(self):
+        start = date(2020, 1, 1)
+        self.assertEqual(bucketing.choose_granularity(start, date(2020, 1, 10), 'day', max_buckets=10), 'day')
+        self.assertEqual(bucketing.choose_granularity(start, date(2020, 1, 11), 'day', max_buckets=10), 'week')
+        self.assertEqual(bucketing.choose_granularity(start, date(2020, 12, 31), 'day', max_buckets=12), 'month')
+        self.assertEqual(bucketing.choose_granularity(start, date(2100, 1, 1), 'month', max_buckets=10), 'year')
+        # Jamais plus fin que la granularité demandée
+        self.assertEqual(bucketing.choose_granularity(start, date(2020, 1, 2), 'quarter'), 'quarter')
+
+    def test_fill_gaps_completes_and_caps_the_series(self):
+        counts = {date(2024, 1, 1): 3, date(2024, 3, 1): 1}
+        series = bucketing.fill_gaps(counts, date(2024, 1, 15), date(2024, 4, 2), 'month')
+        self.assertEqual(series, [
+            {'_id': '2024-01-01', 'count': 3},
+            {'_id': '2024-02-01', 'count': 0},
+            {'_id': '2024-03-01', 'count': 1},
+            {'_id': '2024-04-01', 'count': 0},
+        ])
+        capped = bucketing.fill_gaps({}, date(2024, 1, 1), date(2024, 12, 31), 'day', max_buckets=5)
+        self.assertEqual([item['_id'] for item in capped],
+                         ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05'])
+
+    def test_labels_and_expression(self):
+        day = date(2024, 5, 1)
+        self.assertEqual([bucketing.period_label(day, g) for g in bucketing.GRANULARITIES],
+                         ['2024-05-01', '2024-05-01', '2024-05', '2024-T2', '2024'])
+        tz = get_timezone('Africa/Casablanca')
+        self.assertEqual(bucketing.bucket_expression('dms', 'week', tz), {'$dateTrunc': {
+            'date': '$dms', 'unit': 'week', 'timezone': 'Africa/Casablanca', 'startOfWeek': 'monday',
+        }})
+        # Date naïve renvoyée par MongoDB : UTC
+        self.assertEqual(bucketing.local_date(datetime(2024, 5, 31, 23, 30), get_timezone('Asia/Tokyo')),
+                         date(2024, 6, 1))
+
+
+class RelationTests(MongoTestCase):
+    """Relations jointes par $lookup (include=)."""
+
+    def setUp(self):
+        super().setUp()
+        self.created = ObjectId()
+        self.imported = 'EQ-0001'
+        self.db['equipment'].insert_many([
+            {'_id': self.created, 'model': 'A'},
+            {'_id': self.imported, 'model': 'B'},
+            {'_id': ObjectId(), 'model': 'C'},
+        ])
+        self.db['equipment_family'].insert_many([
+            {'equipment_id': str(self.created), 'name': 'Émetteurs'},
+            {'equipment_id': self.imported, 'name': 'Antennes'},
+            {'equipment_id': self.imported, 'name': 'Pylônes'},
+        ])
+        self.db['equipment_designation'].insert_one({'equipment_id': self.imported, 'name': 'Relais'})
+
+    def test_parse_include(self):
+        self.assertEqual(relations.parse_include('all'), list(relations.RELATION_COLLECTIONS))
+        self.assertEqual(relations.parse_include('families, families,designations'), ['families', 'designations'])
+        self.assertIsNone(relations.parse_include(''))
+        with self.assertRaises(relations.InvalidInclude):
+            relations.parse_include('families,owners')
+
+    def test_hydrate_a_page(self):
+        docs = list(self.db['equipment'].find({}, {'model': 1}).sort('model', 1))
+        relations.hydrate_relations(self.db['equipment'], docs, ['families', 'designations'])
+        self.assertEqual([sorted(item['name'] for item in doc['families']) for doc in docs],
+                         [['Émetteurs'], ['Antennes', 'Pylônes'], []])
+        self.assertEqual([len(doc['designations']) for doc in docs], [0, 1, 0])
+        self.assertNotIn('_relation_key', docs[0]['families'][0])
+
+    def test_equipment_detail_with_include(self):
+        doc = api.get_equipment(self.imported, include=['families'], serialize=False)
+        self.assertEqual(sorted(item['name'] for item in doc['families']), ['Antennes', 'Pylônes'])
+        self.assertNotIn('_relation_key', doc)
+        self.assertEqual(api.get_equipment_relations(str(self.created), 'families')[0]['name'], 'Émetteurs')
+        self.assertIsNone(api.get_equipment_relations(str(self.created), 'owners'))
+
+
+class RendererTests(SimpleTestCase):
+    """Encodage des types BSON et des flottants non finis, avec et sans orjson."""
+
+    def setUp(self):
+        self.oid = ObjectId()
+        self.doc = {
+            '_id': self.oid,
+            'price': float('nan'),
+            'ratio': float('inf'),
+            'value': Decimal128('1234.50'),
+            'missing': Decimal128('NaN'),
+            'created': datetime(2024, 3, 1, 8, 30, tzinfo=timezone.utc),
+            'day': date(2024, 3, 1),
+            'nested': [{'score': float('-inf')}],
+        }
+        self.expected = {
+            '_id': str(self.oid),
+            'price': None,
+            'ratio': None,
+            'value': 1234.5,
+            'missing': None,
+            'created': '2024-03-01T08:30:00+00:00',
+            'day': '2024-03-01',
+            'nested': [{'score': None}],
+        }
+
+    def test_orjson(self):
+        if renderers.orjson is None:
+            raise unittest.SkipTest('orjson non installé')
+        self.assertEqual(json.loads(renderers.dumps(self.doc)), self.expected)
+
+    def test_stdlib_fallback(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            body = renderers.dumps(self.doc)
+            self.assertEqual(json.loads(body), self.expected)
+            # Sans valeur non finie, l'encodeur C produit le même résultat
+            self.assertEqual(json.loads(renderers.dumps({'_id': self.oid, 'price': 1.5})),
+                             {'_id': str(self.oid), 'price': 1.5})
+        self.assertNotIn(b'NaN', body)
+
+    def test_renderer(self):
+        renderer = renderers.MongoJSONRenderer()
+        self.assertEqual(renderer.render(None), b'')
+        self.assertEqual(json.loads(renderer.render({'results': [self.doc]})), {'results': [self.expected]})
+
+
+class CsvExportTests(SimpleTestCase):
+    """Export CSV en flux : fragments, négociation et compression gzip."""
+
+    def setUp(self):
+        self.docs = [
+            {'_id': ObjectId(), 'model': f'M-{i}', 'serial': f'SN{i}', 'purchase_value': float('nan') if i == 1 else i,
+             'creation_date': datetime(2024, 1, 1, i, tzinfo=timezone.utc)}
+            for i in range(5)
+        ]
+        patcher = mock.patch.object(views, 'iter_equipments', side_effect=lambda filters: iter(self.docs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _rows(self, body):
+        return list(csv.reader(io.StringIO(body.decode('utf-8'))))
+
+    def test_chunks_and_values(self):
+        chunks = list(exports.iter_csv(self.docs, rows_per_chunk=2))
+        self.assertEqual(len(chunks), 3)
+        rows = self._rows(''.join(chunks).encode('utf-8'))
+        self.assertEqual(rows[0], exports.EQUIPMENT_EXPORT_FIELDS)
+        self.assertEqual(len(rows), 6)
+        row = dict(zip(rows[0], rows[2]))
+        self.assertEqual(row['_id'], str(self.docs[1]['_id']))
+        self.assertEqual(row['purchase_value'], '')
+        self.assertEqual(row['creation_date'], '2024-01-01T01:00:00+00:00')
+
+    def test_gzip_chunks_round_trip(self):
+        data = b''.join(exports.gzip_chunks(iter([b'abc', b'', b'def' * 1000])))
+        self.assertEqual(gzip.decompress(data), b'abc' + b'def' * 1000)
+
+    def test_accepts_gzip(self):
+        cases = {
+            'gzip': True,
+            'deflate, gzip;q=0.5': True,
+            'GZIP': True,
+            'x-gzip': True,
+            '*': True,
+            'br, *;q=0.1': True,
+            'gzip;q=0': False,
+            'gzip; q=0.0, *': False,
+            '*;q=0': False,
+            'identity': False,
+            'gzip;q=abc': False,
+            '': False,
+            None: False,
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertIs(exports.accepts_gzip(header), expected)
+
+    def _export(self, query='', **extra):
+        request = RequestFactory().get(f'/api/equipments/export/csv/{query}', **extra)
+        response = views.export_equipments_csv(request)
+        return response, b''.join(response.streaming_content)
+
+    def test_view_compresses_when_accepted(self):
+        response, body = self._export(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(self._rows(gzip.decompress(body))), 6)
+
+    def test_view_does_not_compress_when_refused(self):
+        for query, header in (('', 'gzip;q=0, identity'), ('', ''), ('?gzip=0', 'gzip')):
+            with self.subTest(query=query, header=header):
+                response, body = self._export(query, HTTP_ACCEPT_ENCODING=header)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(len(self._rows(body)), 6)
+
+
+_XLSX_NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+def _read_xlsx(data):
+    """
+    Feuilles d'un classeur XlsxWriter (chaînes en ligne) : {nom: [ligne, ...]},
+    chaque ligne étant {colonne: (type, valeur)} avec le type 'text', 'date' ou 'number'.
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        names = [sheet.get('name') for sheet in
+                 ElementTree.fromstring(archive.read('xl/workbook.xml')).iter(f'{{{_XLSX_NS["x"]}}}sheet')]
+        sheets = {}
+        for index, name in enumerate(names, start=1):
+            root = ElementTree.fromstring(archive.read(f'xl/worksheets/sheet{index}.xml'))
+            rows = []
+            for row in root.iterfind('.//x:sheetData/x:row', _XLSX_NS):
+                cells = {}
+                for cell in row.iterfind('x:c', _XLSX_NS):
+                    column = cell.get('r').rstrip('0123456789')
+                    if cell.get('t') == 'inlineStr':
+                        cells[column] = ('text', cell.find('x:is/x:t', _XLSX_NS).text)
+                    else:
+                        kind = 'number' if cell.get('s') in (None, '0') else 'date'
+                        cells[column] = (kind, float(cell.find('x:v', _XLSX_NS).text))
+                rows.append(cells)
+            sheets[name] = rows
+    return sheets
+
+
+class XlsxExportTests(SimpleTestCase):
+    """Export XLSX : cellules typées et découpage en feuilles."""
+
+    def setUp(self):
+        self.docs = [
+            {'_id': ObjectId(), 'serial': '00123', 'barcode': 1e15 + i, 'purchase_value': Decimal128('10.5'),
+             'creation_date': datetime(2024, 1, 1, 12, tzinfo=timezone.utc), 'status': 'En service'}
+            for i in range(7)
+        ]
+
+    def _write(self, max_rows):
+        output = io.BytesIO()
+        total = exports.write_xlsx(iter(self.docs), output, max_rows=max_rows)
+        return total, _read_xlsx(output.getvalue())
+
+    def test_rows_are_split_across_sheets_with_headers(self):
+        total, sheets = self._write(max_rows=3)
+        self.assertEqual(total, 7)
+        self.assertEqual(list(sheets), ['Equipements', 'Equipements 2', 'Equipements 3'])
+        self.assertEqual([len(rows) - 1 for rows in sheets.values()], [3, 3, 1])
+        for rows in sheets.values():
+            self.assertEqual(rows[0]['A'], ('text', '_id'))
+        ids = [row['A'][1] for rows in sheets.values() for row in rows[1:]]
+        self.assertEqual(ids, [str(doc['_id']) for doc in self.docs])
+
+    def test_exact_multiple_does_not_add_an_empty_sheet(self):
+        self.docs = self.docs[:6]
+        _, sheets = self._write(max_rows=3)
+        self.assertEqual(list(sheets), ['Equipements', 'Equipements 2'])
+
+    def test_cell_types(self):
+        _, sheets = self._write(max_rows=exports.XLSX_MAX_ROWS)
+        header, row = sheets['Equipements'][:2]
+        columns = {cell[1]: column for column, cell in header.items()}
+        self.assertEqual(row[columns['serial']], ('text', '00123'))
+        self.assertEqual(row[columns['barcode']], ('text', '1000000000000000'))
+        self.assertEqual(row[columns['purchase_value']], ('number', 10.5))
+        # 2024-01-01 12:00 UTC en numéro de série Excel
+        self.assertEqual(row[columns['creation_date']], ('date', 45292.5))
+        self.assertNotIn(columns['model'], row)
+
+
+class _InlineExecutor:
+    """Exécute les tâches soumises immédiatement (ou jamais si run=False)."""
+
+    def __init__(self, run=True):
+        self.run = run
+        self.submitted = []
+
+    def submit(self, func, *args):
+        self.submitted.append(args)
+        if self.run:
+            func(*args)
+
+
+class ExportJobTests(SimpleTestCase):
+    """Cycle de vie des exports asynchrones et cache disque."""
+
+    def setUp(self):
+        self.docs = [{'_id': ObjectId(), 'model': f'M-{i}'} for i in range(3)]
+        self.db = _database()
+        self.version = 1
+        self.executor = _InlineExecutor()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        for patcher in (
+            mock.patch.object(export_jobs, 'get_mongodb_connection', return_value=self.db),
+            mock.patch.object(export_jobs, 'get_version', side_effect=lambda name: self.version),
+            mock.patch.object(export_jobs, 'iter_equipments', side_effect=lambda filters: iter(self.docs)),
+            mock.patch.object(export_jobs, '_get_executor', side_effect=lambda: self.executor),
+            mock.patch.object(export_jobs, 'EXPORT_CACHE_DIR', self.cache_dir),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_job_runs_and_its_file_is_served(self):
+        job = export_jobs.submit_export('csv', {'status': 'En service'})
+        self.assertEqual((job['status'], job['cached']), ('pending', False))
+        job = export_jobs.get_job(job['id'])
+        self.assertEqual((job['status'], job['rows']), ('done', 3))
+        self.assertIsNotNone(job['finished_at'])
+        path, content_type, extension = export_jobs.get_job_file(job['id'])
+        self.assertEqual((content_type, extension), ('text/csv; charset=utf-8', 'csv'))
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(len(f.read().splitlines()), 4)
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(path)])
+
+    def test_identical_export_is_a_cache_hit(self):
+        first = export_jobs.submit_export('csv', {'status': 'En service'})
+        second = export_jobs.submit_export('csv', {'status': 'En service'})
+        self.assertNotEqual(second['id'], first['id'])
+        self.assertEqual((second['status'], second['cached'], second['rows']), ('done', True, 3))
+        self.assertEqual(len(self.executor.submitted), 1)
+        self.assertEqual(export_jobs.get_job_file(second['id'])[0], export_jobs.get_job_file(first['id'])[0])
+
+    def test_cache_key_depends_on_format_filters_and_version(self):
+        export_jobs.submit_export('csv', {'status': 'En service'})
+        export_jobs.submit_export('xlsx', {'status': 'En service'})
+        export_jobs.submit_export('csv', {'status': 'En stock'})
+        self.version = 2
+        job = export_jobs.submit_export('csv', {'status': 'En service'})
+        self.assertFalse(job['cached'])
+        self.assertEqual(len(self.executor.submitted), 4)
+
+    def test_running_job_is_shared(self):
+        self.executor.run = False
+        first = export_jobs.submit_export('csv')
+        second = export_jobs.submit_export('csv')
+        self.assertEqual(second['id'], first['id'])
+        self.assertEqual(second['status'], 'pending')
+        self.assertIsNone(export_jobs.get_job_file(first['id']))
+
+    def test_failure_is_recorded_and_partial_file_removed(self):
+        def broken(filters):
+            yield self.docs[0]
+            raise RuntimeError('curseur perdu')
+
+        with mock.patch.object(export_jobs, 'iter_equipments', side_effect=broken), \
+                self.assertLogs(export_jobs.logger, 'ERROR'):
+            job = export_jobs.submit_export('csv')
+        job = export_jobs.get_job(job['id'])
+        self.assertEqual((job['status'], job['error']), ('failed', 'curseur perdu'))
+        self.assertIsNone(export_jobs.get_job_file(job['id']))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_expired_file_is_regenerated(self):
+        job = export_jobs.submit_export('csv')
+        path = export_jobs.get_job_file(job['id'])[0]
+        expired = time.time() - export_jobs.EXPORT_CACHE_TTL - 1
+        os.utime(path, (expired, expired))
+        self.assertIsNone(export_jobs.get_job_file(job['id']))
+        self.assertFalse(export_jobs.submit_export('csv')['cached'])
+        self.assertEqual(len(self.executor.submitted), 2)
+
+    def test_prune_removes_least_recently_served_files(self):
+        now = time.time()
+        for index, name in enumerate(('old.csv', 'recent.csv', 'newest.csv')):
+            path = os.path.join(self.cache_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(path, (now - 30 + index * 10, now))
+        with mock.patch.object(export_jobs, 'EXPORT_CACHE_MAX_BYTES', 250):
+            export_jobs.prune_cache()
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['newest.csv', 'recent.csv'])
+
+
+class ColumnarExportTests(SimpleTestCase):
+    """Exports Parquet/Arrow : types conservés et import paresseux de pyarrow."""
+
+    def setUp(self):
+        self.docs = [
+            {'_id': ObjectId(), 'barcode': 123456.0, 'purchase_value': Decimal128('10.5'),
+             'creation_date': datetime(2024, 1, 1, 12)},
+            {'_id': ObjectId(), 'barcode': 'AB-1', 'purchase_value': float('nan'), 'creation_date': 'inconnue'},
+            {'_id': ObjectId(), 'purchase_value': '7'},
+        ]
+
+    def _read(self, export_format):
+        if not exports.columnar_available():
+            raise unittest.SkipTest('pyarrow non installé')
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        data = io.BytesIO(b''.join(exports.iter_columnar(iter(self.docs), export_format)))
+        if export_format == 'parquet':
+            return pq.read_table(data)
+        return pa.ipc.open_stream(data).read_all()
+
+    def test_types_are_preserved(self):
+        for export_format in ('parquet', 'arrow'):
+            with self.subTest(export_format=export_format):
+                table = self._read(export_format)
+                self.assertEqual(table.column_names, exports.EQUIPMENT_EXPORT_FIELDS)
+                self.assertEqual(str(table.schema.field('creation_date').type), 'timestamp[ms, tz=UTC]')
+                columns = table.to_pydict()
+                self.assertEqual(columns['_id'], [str(doc['_id']) for doc in self.docs])
+                self.assertEqual(columns['barcode'], ['123456', 'AB-1', None])
+                self.assertEqual(columns['purchase_value'], [10.5, None, 7.0])
+                self.assertEqual(columns['creation_date'],
+                                 [datetime(2024, 1, 1, 12, tzinfo=timezone.utc), None, None])
+
+    def test_batches(self):
+        if not exports.columnar_available():
+            raise unittest.SkipTest('pyarrow non installé')
+        batches = list(exports.iter_record_batches(iter(self.docs), batch_rows=2))
+        self.assertEqual([batch.num_rows for batch in batches], [2, 1])
+
+    def test_view_without_pyarrow(self):
+        with mock.patch.object(views, 'columnar_available', return_value=False), \
+                mock.patch.object(views, 'iter_equipments') as iter_equipments:
+            response = views.export_equipments_parquet(RequestFactory().get('/api/equipments/export/parquet/'))
+        self.assertEqual(response.status_code, 501)
+        iter_equipments.assert_not_called()
+
+
+class StatusMappingTests(SimpleTestCase):
+    """Table de correspondance des statuts."""
+
+    def test_variants(self):
+        cases = {
+            'En service': 'En service',
+            'EN SERVICE': 'En service',
+            '  en   service. ': 'En service',
+            'Service': 'En service',
+            'STOCK': 'En stock',
+            'En panne': 'Hors service',
+            'HS': 'Hors service',
+            'H.S.': 'Hors service',
+            'hors-service': status.STATUS_OTHER,
+            'En réparation': 'Maintenance',
+            'EN MAINTENANCE...': 'Maintenance',
+            'Instance': 'En instance',
+            'Réformé': status.STATUS_OTHER,
+            '': status.STATUS_UNSPECIFIED,
+            ' . ': status.STATUS_UNSPECIFIED,
+            None: status.STATUS_UNSPECIFIED,
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(status.normalize_status(value), expected)
+
+    def test_every_mapping_key_is_reachable(self):
+        # Une clé non normalisée (majuscule, accent, point final) ne serait jamais trouvée
+        for key, value in status.STATUS_MAPPING.items():
+            with self.subTest(key=key):
+                self.assertEqual(search.normalize_text(key).rstrip(' .'), key)
+                self.assertEqual(status.normalize_status(key), value)
+                self.assertEqual(status.normalize_status(value), value)
+
+    def test_normalized_statuses(self):
+        self.assertEqual(status.NORMALIZED_STATUSES, (
+            'En service', 'En stock', 'Hors service', 'Maintenance', 'En instance',
+            status.STATUS_OTHER, status.STATUS_UNSPECIFIED,
+        ))
+        self.assertEqual(status.build_status_fields({'status': 'hs'}), {'normalized_status': 'Hors service'})
+        self.assertEqual(status.build_status_fields({}), {'normalized_status': status.STATUS_UNSPECIFIED})
+
+
+class RollupDeltaTests(SimpleTestCase):
+    """Report des écritures d'équipements dans les agrégats."""
+
+    def setUp(self):
+        self.db = _database()
+        self.rows = self.db[rollups.ROLLUP_COLLECTION].docs
+        self.doc = {
+            '_id': ObjectId(), 'creation_date': datetime(2024, 3, 1, 23, 30, tzinfo=timezone(timedelta(hours=-2))),
+            'normalized_status': 'En service', 'location': 'Site A', 'purchase_value': 100.0,
+        }
+
+    def _rows(self):
+        return sorted(
+            (row['day'], row['status'], row['location'], row['count'], row['purchase_value']) for row in self.rows
+        )
+
+    def test_create_update_delete(self):
+        rollups.apply_rollup_delta(None, self.doc, db=self.db)
+        other = dict(self.doc, _id=ObjectId(), purchase_value=Decimal128('50'))
+        rollups.apply_rollup_delta(None, other, db=self.db)
+        # Jour UTC de la date de création (02/03 01:30 UTC)
+        self.assertEqual(self._rows(), [(datetime(2024, 3, 2), 'En service', 'Site A', 2, 150.0)])
+
+        moved = dict(self.doc, normalized_status='Hors service', location='')
+        rollups.apply_rollup_delta(self.doc, moved, db=self.db)
+        self.assertEqual(self._rows(), [
+            (datetime(2024, 3, 2), 'En service', 'Site A', 1, 50.0),
+            (datetime(2024, 3, 2), 'Hors service', None, 1, 100.0),
+        ])
+
+        rollups.apply_rollup_delta(other, None, db=self.db)
+        rollups.apply_rollup_delta(moved, None, db=self.db)
+        # Les lignes retombées à zéro sont supprimées
+        self.assertEqual(self.rows, [])
+
+    def test_values_counted_in_sums(self):
+        for value in (float('nan'), float('inf'), -5, True, '12', None, Decimal128('NaN')):
+            with self.subTest(value=value):
+                self.assertEqual(rollups.positive_value(value), 0)
+        self.assertEqual(rollups.positive_value(Decimal128('12.5')), 12.5)
+        key = rollups.rollup_key({'normalized_status': '', 'creation_date': 'inconnue'})
+        self.assertEqual(key, {'day': None, 'status': 'Non spécifié', 'location': None})
+
+    def test_record_write_skips_unchanged_contributions(self):
+        with mock.patch.object(rollups, 'apply_rollup_delta') as apply:
+            rollups.record_write(self.doc, dict(self.doc, model='X', purchase_value=100), db=self.db)
+            apply.assert_not_called()
+            rollups.record_write(self.doc, dict(self.doc, purchase_value=101.0), db=self.db)
+            apply.assert_called_once()
+
+    def test_record_write_modes_and_errors(self):
+        with mock.patch.object(rollups, 'ROLLUP_MODE', 'change_stream'):
+            rollups.record_write(None, self.doc, db=self.db)
+        self.assertEqual(self.rows, [])
+        with mock.patch.object(rollups, 'apply_rollup_delta', side_effect=RuntimeError('panne')), \
+                self.assertLogs(rollups.logger, 'ERROR'):
+            rollups.record_write(None, self.doc, db=self.db)
+
+    def test_duplicate_upsert_is_replayed(self):
+        collection = self.db[rollups.ROLLUP_COLLECTION]
+        bulk_write = collection.bulk_write
+        calls = []
+
+        def racing_bulk_write(operations, ordered=True):
+            calls.append(len(operations))
+            if len(calls) == 1:
+                # La ligne a été créée par une écriture concurrente
+                bulk_write(operations[:2])
+                raise BulkWriteError({'writeErrors': [{'index': 2, 'code': 11000}]})
+            bulk_write(operations)
+
+        with mock.patch.object(collection, 'bulk_write', side_effect=racing_bulk_write):
+            rollups.apply_rollup_delta(dict(self.doc, location='Site B'), self.doc, db=self.db)
+        self.assertEqual(calls, [4, 2])
+        self.assertEqual(self._rows(), [(datetime(2024, 3, 2), 'En service', 'Site A', 1, 100.0)])
+        with mock.patch.object(collection, 'bulk_write',
+                               side_effect=BulkWriteError({'writeErrors': [{'index': 0, 'code': 121}]})):
+            with self.assertRaises(BulkWriteError):
+                rollups.apply_rollup_delta(None, self.doc, db=self.db)
+
+
+class _Clock:
+    """Remplace le module time : time() renvoie l'instant fixé par le test."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class ResponseCacheTests(SimpleTestCase):
+    """Cache des réponses : HIT, STALE (recalcul en arrière-plan) et MISS."""
+
+    def setUp(self):
+        self.versions = {'equipment': 1}
+        self.clock = _Clock(1_800_000_000)
+        self.executor = _InlineExecutor()
+        self.requests = []
+        for patcher in (
+            mock.patch.object(response_cache, 'get_versions', side_effect=lambda names: dict(self.versions)),
+            mock.patch.object(response_cache, 'time', self.clock),
+            mock.patch.object(response_cache, '_get_executor', side_effect=lambda: self.executor),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        response_cache._cache().clear()
+        response_cache.reset_stats()
+        self.addCleanup(response_cache.reset_stats)
+        self.factory = RequestFactory()
+
+    def _view(self, request):
+        self.requests.append(request)
+        status_code = 500 if request.GET.get('fail') else 200
+        return JsonResponse({'calls': len(self.requests)}, status=status_code)
+
+    def _get(self, params=None, time_relative=False):
+        view = response_cache.cached_response('test', ('equipment',), ttl=60, stale=600,
+                                              time_relative=time_relative)(self._view)
+        response = view(self.factory.get('/api/analytics/test/', params or {}))
+        return response.get('X-Cache'), json.loads(response.content)['calls']
+
+    def test_miss_then_hit(self):
+        self.assertEqual(self._get({'a': '1'}), ('MISS', 1))
+        self.clock.now += 59
+        self.assertEqual(self._get({'a': '1'}), ('HIT', 1))
+        self.assertEqual(self._get({'a': '2'}), ('MISS', 2))
+        self.assertEqual(response_cache.get_stats()['test'],
+                         {'hits': 1, 'stale': 0, 'misses': 2, 'hit_ratio': 0.333})
+
+    def test_stale_is_served_while_revalidating(self):
+        self._get({'a': '1'})
+        self.clock.now += 61
+        self.assertEqual(self._get({'a': '1'}), ('STALE', 1))
+        self.assertEqual(len(self.executor.submitted), 1)
+        # Le recalcul a remplacé l'entrée
+        self.assertEqual(self._get({'a': '1'}), ('HIT', 2))
+
+    def test_revalidation_uses_a_detached_request(self):
+        view = response_cache.cached_response('test', ('equipment',), ttl=60)(self._view)
+        view(self.factory.get('/api/analytics/test/', {'a': '1'}))
+        self.clock.now += 61
+        request = self.factory.get('/api/analytics/test/', {'a': '1'})
+        self.assertEqual(view(request)['X-Cache'], 'STALE')
+        revalidated = self.requests[-1]
+        self.assertEqual(len(self.requests), 2)
+        self.assertIsNot(revalidated, request)
+        self.assertEqual((revalidated.method, revalidated.path), ('GET', '/api/analytics/test/'))
+        self.assertEqual(revalidated.GET.dict(), {'a': '1'})
+        self.assertEqual(revalidated.META['SERVER_NAME'], 'testserver')
+        self.assertNotIn('wsgi.input', revalidated.META)
+
+    def test_one_revalidation_at_a_time(self):
+        self._get()
+        self.clock.now += 61
+        self.executor.run = False
+        self.assertEqual([self._get()[0] for _ in range(3)], ['STALE'] * 3)
+        self.assertEqual(len(self.executor.submitted), 1)
+
+    def test_write_makes_entries_unreachable(self):
+        self._get()
+        self.versions['equipment'] = 2
+        self.assertEqual(self._get(), ('MISS', 2))
+
+    def test_errors_are_not_cached(self):
+        view = response_cache.cached_response('test', ('equipment',))(self._view)
+        for _ in range(2):
+            response = view(self.factory.get('/api/analytics/test/', {'fail': '1'}))
+            self.assertEqual(response.status_code, 500)
+            self.assertFalse(response.has_header('X-Cache'))
+        self.assertEqual(len(self.requests), 2)
+
+    def test_time_relative_key_changes_at_local_midnight(self):
+        params = {'tz': 'Asia/Kolkata'}
+        evening = datetime(2026, 10, 17, 23, 50, tzinfo=get_timezone('Asia/Kolkata'))
+        with mock.patch.object(conditional, 'datetime', _FrozenDatetime):
+            _FrozenDatetime.current = evening
+            self.assertEqual(self._get(params, time_relative=True), ('MISS', 1))
+            _FrozenDatetime.current = evening + timedelta(minutes=9)
+            self.assertEqual(self._get(params, time_relative=True), ('HIT', 1))
+            _FrozenDatetime.current = evening + timedelta(minutes=11)
+            self.assertEqual(self._get(params, time_relative=True), ('MISS', 2))
+            # Sans time_relative ni plage relative, la date n'entre pas dans la clé
+            self.assertEqual(self._get(params), ('MISS', 3))
+            _FrozenDatetime.current = evening
+            self.assertEqual(self._get(params), ('HIT', 3))
+
+    def test_invalid_timezone_bypasses_the_cache(self):
+        with self.assertNoLogs(response_cache.logger):
+            self.assertEqual(self._get({'creation_date_range': 'today', 'tz': 'Mars/Olympus'}), (None, 1))
+
+    def test_relative_range_key_changes_at_local_midnight(self):
+        params = {'creation_date_range': 'today', 'tz': 'Africa/Casablanca'}
+        evening = datetime(2026, 10, 17, 23, 50, tzinfo=get_timezone('Africa/Casablanca'))
+        with mock.patch.object(conditional, 'datetime', _FrozenDatetime):
+            _FrozenDatetime.current = evening
+            self.assertEqual(self._get(params), ('MISS', 1))
+            self.assertEqual(self._get(params), ('HIT', 1))
+            _FrozenDatetime.current = evening + timedelta(minutes=20)
+            self.assertEqual(self._get(params), ('MISS', 2))
+
+
+def _equipment_docs():
+    """Équipements variés (statuts, localisations, valeurs et dates) pour les tests de cohérence."""
+    statuses = ['En service', 'En stock', 'Hors service', None]
+    locations = ['Site A', 'Site B', 'Site C', '', None]
+    values = [100.0, 250, -5, float('nan'), None, 40]
+    docs = []
+    for i in range(60):
+        created = datetime(2025, 1, 3, 22, 30, tzinfo=timezone.utc) + timedelta(days=i * 11, hours=i)
+        docs.append({
+            '_id': ObjectId(),
+            'model': f'M-{i % 4}',
+            'normalized_status': statuses[i % len(statuses)],
+            'location': locations[i % len(locations)],
+            'purchase_value': values[i % len(values)],
+            'creation_date': created if i % 13 else 'inconnue',
+            'updated_at': created if i % 13 else datetime(2026, 1, 1, tzinfo=timezone.utc),
+        })
+    return docs
+
+
+class SummaryParityTests(MongoTestCase):
+    """Le $facet du résumé renvoie les mêmes indicateurs que les endpoints individuels."""
+
+    def setUp(self):
+        super().setUp()
+        self.docs = _equipment_docs()
+        self.db['equipment'].insert_many(self.docs)
+        for patcher in (
+            mock.patch.object(api, 'get_snapshot', return_value=None),
+            mock.patch.object(rollups, '_built', False),
+            mock.patch.object(rollups, '_indexes_ready', False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tz = get_timezone('Africa/Casablanca')
+
+    def test_summary_matches_individual_endpoints(self):
+        rollups.rebuild_rollup(self.db)
+        for granularity in ('day', 'month'):
+            with self.subTest(granularity=granularity):
+                period = parse_period({'from': '2025-01-01', 'to': '2026-06-30'}, self.tz)
+                summary = api.get_dashboard_summary(None, period, granularity, self.tz, top_locations=2)
+
+                self.assertEqual(summary['total'], 60)
+                self.assertEqual(summary['total_value'],
+                                 sum(rollups.positive_value(doc['purchase_value']) for doc in self.docs))
+                self.assertEqual(summary['statuses'], rollups.rollup_totals('status', db=self.db))
+                self.assertEqual(summary['locations'], rollups.rollup_totals(
+                    'location', match={'location': {'$ne': None}}, limit=2, db=self.db))
+
+                buckets, timeline_granularity = api.get_equipment_timeline(None, 'creation_date', granularity, self.tz)
+                self.assertEqual(summary['timeline'], {'granularity': timeline_granularity, 'buckets': buckets})
+
+                evolution = api.get_equipment_evolution(period, granularity, self.tz)
+                self.assertEqual(summary['evolution'], evolution)
+
+    def test_filtered_summary(self):
+        filters = {'creation_date': {'gte': datetime(2025, 6, 1, tzinfo=timezone.utc)}}
+        period = parse_period({'months': '6', 'to': '2026-06-30'}, self.tz)
+        summary = api.get_dashboard_summary(filters, period, 'week', self.tz)
+        query = api.build_equipment_query(filters)
+        self.assertEqual(summary['total'], self.db['equipment'].count_documents(query))
+        self.assertEqual(sum(item['count'] for item in summary['statuses']), summary['total'])
+        buckets, granularity = api.get_equipment_timeline(filters, 'creation_date', 'week', self.tz)
+        self.assertEqual(summary['timeline'], {'granularity': granularity, 'buckets': buckets})
+
+
+class ConditionalTimeRelativeTests(SimpleTestCase):
+    """ETag des vues à fenêtre glissante : renouvelé à minuit dans le fuseau de la requête."""
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(conditional, 'get_versions_info', return_value=({'equipment': 3}, None)),
+            mock.patch.object(conditional, 'datetime', _FrozenDatetime),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.calls = 0
+        self.view = conditional.conditional_response('analytics-evolution', ('equipment',), time_relative=True)(
+            self._view
+        )
+        self.factory = RequestFactory()
+
+    def _view(self, request):
+        self.calls += 1
+        if request.GET.get('tz') == 'Mars/Olympus':
+            return JsonResponse({'success': False}, status=400)
+        return JsonResponse({'success': True})
+
+    def _get(self, params, now, etag=None):
+        _FrozenDatetime.current = now
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.view(self.factory.get('/api/analytics/evolution/', params, **headers))
+
+    def test_half_hour_offset_timezone(self):
+        tz = get_timezone('Asia/Kolkata')
+        evening = datetime(2026, 10, 17, 23, 10, tzinfo=tz)
+        response = self._get({'tz': 'Asia/Kolkata'}, evening)
+        etag = response['ETag']
+        self.assertEqual(response['Last-Modified'], 'Fri, 16 Oct 2026 18:30:00 GMT')
+        # Passage à l'heure UTC suivante (23:30 locale) : même jour local, même ETag
+        self.assertEqual(self._get({'tz': 'Asia/Kolkata'}, evening + timedelta(minutes=40), etag).status_code, 304)
+        # Minuit local (18:30 UTC) : nouvel ETag
+        response = self._get({'tz': 'Asia/Kolkata'}, evening + timedelta(minutes=51), etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['Last-Modified'], 'Sat, 17 Oct 2026 18:30:00 GMT')
+
+    def test_day_is_taken_in_the_request_timezone(self):
+        now = datetime(2026, 10, 17, 20, 0, tzinfo=timezone.utc)
+        self.assertEqual(self._get({'tz': 'Asia/Kolkata'}, now)['Last-Modified'], 'Sat, 17 Oct 2026 18:30:00 GMT')
+        self.assertEqual(self._get({'tz': 'UTC'}, now)['Last-Modified'], 'Sat, 17 Oct 2026 00:00:00 GMT')
+
+    def test_invalid_timezone_skips_validators_without_logging(self):
+        with self.assertNoLogs(conditional.logger):
+            response = self._get({'tz': 'Mars/Olympus'}, datetime(2026, 10, 17, tzinfo=timezone.utc))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.calls, 1)
+
+
+def _reference_totals(docs, field):
+    """Totaux attendus (comme rollup_totals) calculés directement sur les documents."""
+    totals = defaultdict(lambda: [0, 0])
+    for doc in docs:
+        key = doc.get(field)
+        if field == 'normalized_status':
+            key = key or status.STATUS_UNSPECIFIED
+        elif not key:
+            continue
+        totals[key][0] += 1
+        totals[key][1] += rollups.positive_value(doc.get('purchase_value'))
+    results = [{'_id': key, 'count': count, 'total_value': value} for key, (count, value) in totals.items()]
+    return sorted(results, key=lambda item: (-item['count'], item['_id']))
+
+
+def _reference_evolution(docs, period, granularity, tz):
+    """Ajouts et stock attendus (comme get_equipment_evolution) calculés sur les documents."""
+    periods, _, window_start, (end_op, end_bound) = api._evolution_window(period, granularity, tz)
+    starts = [datetime.combine(day, datetime.min.time(), tzinfo=tz) for day in periods]
+    added, baseline = {}, defaultdict(int)
+    for doc in docs:
+        created = doc.get('creation_date')
+        if not isinstance(created, datetime) or not (created < end_bound if end_op == '$lt' else created <= end_bound):
+            continue
+        label = doc.get('normalized_status') or status.STATUS_UNSPECIFIED
+        counts = added.setdefault(label, [0] * len(periods))
+        if created < window_start:
+            baseline[label] += 1
+        else:
+            counts[max(i for i, start in enumerate(starts) if start <= created)] += 1
+    stock = {}
+    for label, counts in added.items():
+        running, stock[label] = baseline[label], []
+        for count in counts:
+            running += count
+            stock[label].append(running)
+    return added, stock
+
+
+class SnapshotTests(SimpleTestCase):
+    """Instantané en mémoire : résultats, rafraîchissement incrémental et rechargements."""
+
+    def setUp(self):
+        self.docs = _equipment_docs()
+        for doc in self.docs:
+            doc['updated_at'] = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        self.versions = [{'_id': 'equipment', 'version': 1, 'reset_version': 0}]
+        self.db = _database(equipment=self.docs, **{versions.VERSIONS_COLLECTION: self.versions})
+        self.executor = _InlineExecutor(run=False)
+        self.clock = _Clock(1000.0)
+        for patcher in (
+            mock.patch.object(snapshot, '_snapshot', None),
+            mock.patch.object(snapshot, '_reload_pending', False),
+            mock.patch.object(snapshot, '_get_executor', side_effect=lambda: self.executor),
+            mock.patch.object(snapshot, 'time', self.clock),
+            mock.patch.object(snapshot, 'SNAPSHOT_ENABLED', True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tz = get_timezone('Africa/Casablanca')
+
+    def _bump(self, reset=False):
+        self.versions[0]['version'] += 1
+        if reset:
+            self.versions[0]['reset_version'] = self.versions[0]['version']
+
+    def assertMatchesDocuments(self, snap):
+        self.assertEqual(snap.total(), (len(self.docs), float(sum(
+            rollups.positive_value(doc.get('purchase_value')) for doc in self.docs))))
+        self.assertEqual(snap.totals('status'), _reference_totals(self.docs, 'normalized_status'))
+        self.assertEqual(snap.totals('location', limit=2), _reference_totals(self.docs, 'location')[:2])
+        daily = defaultdict(int)
+        for doc in self.docs:
+            if isinstance(doc['creation_date'], datetime):
+                daily[doc['creation_date'].astimezone(self.tz).date()] += 1
+        self.assertEqual(snap.daily_counts(self.tz), dict(daily))
+        for granularity in ('week', 'month'):
+            period = parse_period({'from': '2025-03-01', 'to': '2026-06-30'}, self.tz)
+            periods, _, window_start, end = api._evolution_window(period, granularity, self.tz)
+            self.assertEqual(snap.evolution(window_start, end, periods, self.tz),
+                             _reference_evolution(self.docs, period, granularity, self.tz))
+
+    def test_full_load(self):
+        snap = snapshot.load_snapshot(self.db)
+        self.assertEqual((snap.version, snap.size), (1, 60))
+        self.assertIs(snapshot.get_snapshot(self.db), snap)
+        self.assertMatchesDocuments(snap)
+        self.assertEqual(self.executor.submitted, [])
+
+    def test_incremental_refresh(self):
+        loaded = snapshot.load_snapshot(self.db)
+        now = datetime.now(timezone.utc)
+        self.docs[0].update(normalized_status='Maintenance', purchase_value=999, updated_at=now)
+        self.docs.append({'_id': ObjectId(), 'normalized_status': 'En stock', 'location': 'Site D',
+                          'purchase_value': 1, 'creation_date': now, 'updated_at': now})
+        self._bump()
+        with mock.patch.object(self.db['equipment'], 'count_documents', side_effect=AssertionError):
+            refreshed = snapshot.get_snapshot(self.db)
+        self.assertIsNot(refreshed, loaded)
+        self.assertEqual((refreshed.version, refreshed.size), (2, 61))
+        self.assertEqual(refreshed.loaded_at, loaded.loaded_at)
+        self.assertMatchesDocuments(refreshed)
+        self.assertEqual(self.executor.submitted, [])
+
+    def test_deletion_and_reset_trigger_a_full_reload(self):
+        snapshot.load_snapshot(self.db)
+        self.docs.pop()
+        self._bump()
+        self.assertIsNone(snapshot.get_snapshot(self.db))
+        self.assertEqual(len(self.executor.submitted), 1)
+
+        with mock.patch.object(snapshot, '_reload_pending', False):
+            snapshot.load_snapshot(self.db)
+            self._bump(reset=True)
+            self.assertIsNone(snapshot.get_snapshot(self.db))
+            self.assertEqual(len(self.executor.submitted), 2)
+
+    def test_max_age_counts_from_the_full_load(self):
+        snapshot.load_snapshot(self.db)
+        self.clock.now += snapshot.SNAPSHOT_MAX_AGE - 10
+        self.docs[0].update(location='Site Z', updated_at=datetime.now(timezone.utc))
+        self._bump()
+        self.assertIsNotNone(snapshot.get_snapshot(self.db))
+        self.assertEqual(self.executor.submitted, [])
+        self.clock.now += 11
+        # Instantané servi, rechargement complet lancé en arrière-plan
+        self.assertIsNotNone(snapshot.get_snapshot(self.db))
+        self.assertEqual(len(self.executor.submitted), 1)
+
+
+class SnapshotParityTests(MongoTestCase):
+    """Le résumé calculé sur l'instantané est identique au $facet MongoDB."""
+
+    def setUp(self):
+        super().setUp()
+        self.db['equipment'].insert_many(_equipment_docs())
+        self.tz = get_timezone('Africa/Casablanca')
+
+    def test_summary_parity(self):
+        with mock.patch.object(snapshot, '_snapshot', None):
+            snap = snapshot.load_snapshot(self.db)
+        for granularity in ('day', 'week', 'month'):
+            with self.subTest(granularity=granularity):
+                period = parse_period({'from': '2025-01-01', 'to': '2026-06-30'}, self.tz)
+                with mock.patch.object(api, 'get_snapshot', return_value=snap):
+                    from_snapshot = api.get_dashboard_summary(None, period, granularity, self.tz, top_locations=2)
+                with mock.patch.object(api, 'get_snapshot', return_value=None):
+                    from_mongo = api.get_dashboard_summary(None, period, granularity, self.tz, top_locations=2)
+                self.assertEqual(from_snapshot, from_mongo)
@@ -2,6 +2,7 @@ from django.urls import path
 from django.views.generic import TemplateView
 from . import views
 from .views import (
+    EquipmentAPIDetailView,
     EquipmentDetailView, 
     EquipmentEditView,
     EquipmentDeleteView
@@ -9,7 +10,8 @@ from .views import (
 from .views_analytics import (
     EquipmentStatusDistributionView,
     EquipmentEvolutionView,
-    EquipmentLocationView
+    EquipmentLocationView,
+    EquipmentSummaryView
 )
 from .views_locations import (
     LocationTemplateView,
@@ -18,7 +20,8 @@ from .views_locations import (
     LocationEditView,
     LocationDeleteView,
     location_statistics,
-    locations_map_data
+    locations_map_data,
+    location_tile
 )
 
 urlpatterns = [
@@ -41,16 +44,26 @@ urlpatterns = [
     
     # API Endpoints
     path('api/equipments/', views.EquipmentListView.as_view(), name='api-equipment-list'),
-    path('api/equipments/<str:pk>/', views.EquipmentDetailView.as_view(), name='api-equipment-detail'),
-    path('api/equipments/<str:equipment_id>/<str:relation_type>/', 
-         views.equipment_relations, name='api-equipment-relations'),
+    path('api/equipments/lookup/', views.equipment_lookup, name='api-equipment-lookup'),
+    path('api/equipments/batch/', views.equipment_batch, name='api-equipment-batch'),
+    # Exports avant la route générique <equipment_id>/<relation_type>/ qui les masquait
     path('api/equipments/export/csv/', views.export_equipments_csv, name='api-equipment-export-csv'),
     path('api/equipments/export/excel/', views.export_equipments_excel, name='api-equipment-export-excel'),
+    path('api/equipments/export/parquet/', views.export_equipments_parquet, name='api-equipment-export-parquet'),
+    path('api/equipments/export/arrow/', views.export_equipments_arrow, name='api-equipment-export-arrow'),
+    path('api/equipments/export/jobs/', views.export_job_create, name='api-equipment-export-jobs'),
+    path('api/equipments/export/jobs/<str:job_id>/', views.export_job_detail, name='api-equipment-export-job'),
+    path('api/equipments/export/jobs/<str:job_id>/download/', views.export_job_download,
+         name='api-equipment-export-job-download'),
+    path('api/equipments/<str:pk>/', EquipmentAPIDetailView.as_view(), name='api-equipment-detail'),
+    path('api/equipments/<str:equipment_id>/<str:relation_type>/', 
+         views.equipment_relations, name='api-equipment-relations'),
     # path('api/admin/overview/', views.admin_overview, name='api-admin-overview'),
     
     # API Locations (mettre les routes spécifiques AVANT la route générique <pk>)
     path('api/locations/stats/', location_statistics, name='api-location-stats'),
     path('api/locations/map-data/', locations_map_data, name='api-location-map-data'),
+    path('api/locations/tiles/<int:z>/<int:x>/<int:y>/', location_tile, name='api-location-tile'),
     path('api/locations/', LocationListView.as_view(), name='api-location-list'),
     path('api/locations/<str:pk>/', LocationDetailView.as_view(), name='api-location-detail'),
     
@@ -64,6 +77,12 @@ urlpatterns = [
     path('api/analytics/locations/', 
          EquipmentLocationView.as_view(), 
          name='api-locations'),
+    path('api/analytics/summary/', 
+         EquipmentSummaryView.as_view(), 
+         name='api-analytics-summary'),
+    
+    # Statistiques du cache des réponses
+    path('api/cache/stats/', views.response_cache_stats, name='api-cache-stats'),
     
     # Service des fichiers statiques en développement
     path('static/<path:path>', views.serve_static_dev, name='serve-static-dev'),
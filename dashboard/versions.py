@@ -0,0 +1,114 @@
+"""
+Numéros de version des collections MongoDB.
+
+Chaque écriture applicative (create/update/delete) incrémente la version de la
+collection concernée dans 'collection_versions'. Les caches dérivés (exports,
+réponses d'analytics...) incluent cette version dans leur clé : une donnée
+modifiée rend automatiquement les anciens résultats inaccessibles, sans
+invalidation explicite. Les scripts d'import qui écrivent directement dans une
+collection doivent appeler bump_version() à la fin, avec reset=True lorsque
+les documents réécrits ne portent pas de date updated_at à jour (les caches
+incrémentaux, comme dashboard.snapshot, doivent alors se reconstruire).
+"""
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+from .db import get_mongodb_connection
+
+VERSIONS_COLLECTION = 'collection_versions'
+
+# Documents d'état des opérations de maintenance (backfills, reconstructions)
+MAINTENANCE_COLLECTION = 'maintenance'
+
+
+def get_version(name, db=None):
+    """
+    Retourne la version courante d'une collection (0 si jamais modifiée).
+    """
+    db = db if db is not None else get_mongodb_connection()
+    doc = db[VERSIONS_COLLECTION].find_one({'_id': name}, {'version': 1})
+    return doc['version'] if doc else 0
+
+
+def get_versions(names, db=None):
+    """
+    Retourne les versions de plusieurs collections en une seule requête.
+
+    Returns:
+        dict: {nom: version}
+    """
+    return get_versions_info(names, db)[0]
+
+
+def get_versions_info(names, db=None):
+    """
+    Retourne les versions de plusieurs collections et la date de la dernière
+    modification de l'une d'entre elles, en une seule requête.
+
+    Returns:
+        tuple: ({nom: version}, updated_at le plus récent ou None)
+    """
+    db = db if db is not None else get_mongodb_connection()
+    versions = {name: 0 for name in names}
+    last_modified = None
+    for doc in db[VERSIONS_COLLECTION].find({'_id': {'$in': list(names)}}):
+        versions[doc['_id']] = doc['version']
+        updated_at = doc.get('updated_at')
+        if updated_at and (last_modified is None or updated_at > last_modified):
+            last_modified = updated_at
+    return versions, last_modified
+
+
+def get_version_info(name, db=None):
+    """
+    Retourne la version et la date de dernière modification d'une collection.
+
+    Returns:
+        tuple: (version, updated_at ou None)
+    """
+    db = db if db is not None else get_mongodb_connection()
+    doc = db[VERSIONS_COLLECTION].find_one({'_id': name})
+    if not doc:
+        return 0, None
+    return doc['version'], doc.get('updated_at')
+
+
+def get_version_state(name, db=None):
+    """
+    Retourne l'état de version complet d'une collection.
+
+    Returns:
+        dict: {'version', 'reset_version', 'updated_at'} ; reset_version est la
+        dernière version produite par une réécriture en masse (0 si aucune)
+    """
+    db = db if db is not None else get_mongodb_connection()
+    doc = db[VERSIONS_COLLECTION].find_one({'_id': name}) or {}
+    return {
+        'version': doc.get('version', 0),
+        'reset_version': doc.get('reset_version', 0),
+        'updated_at': doc.get('updated_at'),
+    }
+
+
+def bump_version(name, db=None, reset=False):
+    """
+    Incrémente la version d'une collection après une écriture.
+
+    Args:
+        reset (bool): Réécriture en masse (import, backfill) que les caches
+            incrémentaux ne peuvent pas suivre par la date updated_at
+
+    Returns:
+        int: Nouvelle version
+    """
+    db = db if db is not None else get_mongodb_connection()
+    doc = db[VERSIONS_COLLECTION].find_one_and_update(
+        {'_id': name},
+        {'$inc': {'version': 1}, '$set': {'updated_at': datetime.now(timezone.utc)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    if reset:
+        db[VERSIONS_COLLECTION].update_one({'_id': name}, {'$max': {'reset_version': doc['version']}})
+    return doc['version']
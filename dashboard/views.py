@@ -1,10 +1,12 @@
 from django.shortcuts import render, redirect
 from django.views.generic import TemplateView, DeleteView
 from django.views import View
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse, Http404, HttpResponseRedirect
+from django.http import JsonResponse, HttpResponse, Http404, HttpResponseRedirect, StreamingHttpResponse, FileResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
 from django.utils.http import http_date
 from rest_framework import status
 from rest_framework.response import Response
@@ -13,8 +15,22 @@ from rest_framework.decorators import api_view
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny
 from .api import get_equipments, get_equipment, get_equipment_relations, update_equipment, delete_equipment, create_equipment, get_mongodb_connection
-import csv
-import io
+from .api import BATCH_MAX_KEYS, LOOKUP_FIELDS, get_equipment_timeline, get_equipments_batch, lookup_equipment
+from .bucketing import GRANULARITIES
+from .conditional import conditional_response
+from .filters import DATE_FILTER_FIELDS, InvalidFilter, get_timezone, parse_equipment_filters
+from .db import check_mongodb_health
+from .counting import COUNT_MODES
+from .exports import (
+    COLUMNAR_FORMATS, accepts_gzip, columnar_available, export_xlsx_to_tempfile, gzip_chunks, iter_columnar, iter_csv, iter_equipments
+)
+from .export_jobs import EXPORT_FORMATS, get_job, get_job_file, submit_export
+from .keyset import InvalidCursor
+from .relations import RELATION_COLLECTIONS, InvalidInclude, parse_include
+from .response_cache import get_stats as get_response_cache_stats
+from .rollups import rollup_totals
+from .projection import EQUIPMENT_FIELDS, InvalidFields, parse_fields
+import os
 from datetime import datetime
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -22,6 +38,10 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+# Collections lues par les vues équipements (relations jointes par ?include=)
+EQUIPMENT_COLLECTIONS = ('equipment', *RELATION_COLLECTIONS.values())
+
+@method_decorator(conditional_response('equipment-list', EQUIPMENT_COLLECTIONS), name='get')
 class EquipmentListView(APIView):
     """
     Vue pour lister et filtrer les équipements
@@ -30,31 +50,28 @@ class EquipmentListView(APIView):
     pagination_class = StandardResultsSetPagination
     
     def get(self, request):
-        # Récupération des paramètres de requête
-        filters = {}
-        
-        # Filtres de base
-        for param in ['model', 'serial', 'barcode', 'status', 'location']:
-            if param in request.query_params:
-                filters[param] = request.query_params.get(param)
-        
-        # Filtres de date
-        date_filters = {}
-        for param in ['creation_date', 'dms']:
-            if f'{param}_gte' in request.query_params:
-                if 'date' not in date_filters:
-                    date_filters[param] = {}
-                date_filters[param]['gte'] = request.query_params.get(f'{param}_gte')
-            if f'{param}_lte' in request.query_params:
-                if param not in date_filters:
-                    date_filters[param] = {}
-                date_filters[param]['lte'] = request.query_params.get(f'{param}_lte')
-        
-        filters.update(date_filters)
+        # Récupération des filtres (texte et plages de dates typées)
+        try:
+            filters = parse_equipment_filters(request.query_params)
+        except InvalidFilter as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Gestion du groupement
         group_by = request.query_params.get('group_by')
         
+        # Champ date : séries par période (?granularity=day|week|month|quarter|year, ?tz=)
+        if group_by in DATE_FILTER_FIELDS:
+            granularity = request.query_params.get('granularity', 'day')
+            if granularity not in GRANULARITIES:
+                return Response(
+                    {'error': f"granularity doit valoir {', '.join(GRANULARITIES)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            tz = get_timezone(request.query_params.get('tz'))
+            buckets, granularity = get_equipment_timeline(filters, group_by, granularity, tz)
+            # La granularité peut avoir été élargie pour plafonner le nombre de périodes
+            return Response(buckets, headers={'X-Granularity': granularity})
+        
         # Si group_by est spécifié, on ignore la pagination et le tri
         if group_by:
             result = get_equipments(
@@ -74,17 +91,64 @@ class EquipmentListView(APIView):
         sort_field = request.query_params.get('sort', None)
         sort_order = -1 if request.query_params.get('order', 'desc').lower() == 'desc' else 1
         
+        # Pagination par curseur (opt-in) : ?pagination=cursor puis ?cursor=<jeton next/prev>
+        cursor = None
+        if 'cursor' in request.query_params or request.query_params.get('pagination') == 'cursor':
+            cursor = request.query_params.get('cursor', '')
+        
+        # Champs renvoyés (?fields=a,b,c) et relations jointes (?include=families,...)
+        try:
+            fields = parse_fields(request.query_params.get('fields'), EQUIPMENT_FIELDS)
+            include = parse_include(request.query_params.get('include'))
+        except (InvalidFields, InvalidInclude) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Calcul du total : exact (défaut), facet, estimated ou cached
+        count_mode = request.query_params.get('count', 'exact')
+        if count_mode not in COUNT_MODES:
+            count_mode = 'exact'
+        
         # Récupération des données avec pagination
-        result = get_equipments(
-            filters=filters,
-            page=page,
-            page_size=page_size,
-            sort_field=sort_field,
-            sort_order=sort_order
-        )
+        try:
+            result = get_equipments(
+                filters=filters,
+                page=page,
+                page_size=page_size,
+                sort_field=sort_field,
+                sort_order=sort_order,
+                cursor=cursor,
+                count_mode=count_mode,
+                fields=fields,
+                include=include,
+                serialize=False
+            )
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(result)
 
+@method_decorator(conditional_response('equipment-detail', EQUIPMENT_COLLECTIONS), name='get')
+class EquipmentAPIDetailView(APIView):
+    """
+    Vue API pour récupérer un équipement spécifique
+    """
+    permission_classes = [AllowAny]
+    
+    def get(self, request, pk):
+        try:
+            fields = parse_fields(request.query_params.get('fields'), EQUIPMENT_FIELDS)
+            include = parse_include(request.query_params.get('include'))
+        except (InvalidFields, InvalidInclude) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        equipment = get_equipment(pk, fields=fields, include=include, serialize=False)
+        if not equipment:
+            return Response(
+                {'error': 'Équipement non trouvé'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(equipment)
+
 class EquipmentEditView(TemplateView):
     """
     Vue pour ajouter ou modifier un équipement
@@ -287,16 +351,85 @@ def equipment_relations(request, equipment_id, relation_type):
     """
     Vue pour les relations d'un équipement (designations, families, etc.)
     """
-    if relation_type not in ['designations', 'families', 'locations', 'subfamilies']:
+    if relation_type not in RELATION_COLLECTIONS:
         return Response(
             {'error': 'Type de relation non valide'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
     relations = get_equipment_relations(equipment_id, relation_type)
+    if relations is None:
+        return Response(
+            {'error': 'Équipement non trouvé'},
+            status=status.HTTP_404_NOT_FOUND
+        )
     return Response(relations)
 
 
+@api_view(['GET'])
+def equipment_lookup(request):
+    """
+    Recherche exacte d'un équipement par code-barres ou numéro de série
+    (?barcode=... ou ?serial=...), destinée aux scanners.
+    """
+    params = [field for field in LOOKUP_FIELDS if request.query_params.get(field)]
+    if len(params) != 1:
+        return Response(
+            {'error': 'Indiquer exactement un paramètre parmi: barcode, serial'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    field = params[0]
+    result = lookup_equipment(field, request.query_params.get(field))
+    if result is None:
+        return Response(
+            {'error': 'Équipement non trouvé'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(result)
+
+
+@api_view(['POST'])
+def equipment_batch(request):
+    """
+    Récupère plusieurs équipements en un seul appel.
+    
+    Corps JSON : {"ids": [...]} ou {"barcodes": [...]}, et optionnellement
+    "fields" (liste ou chaîne séparée par des virgules). Les résultats suivent
+    l'ordre des clés demandées ; une clé introuvable porte "found": false.
+    """
+    data = request.data if isinstance(request.data, dict) else {}
+    params = [name for name in ('ids', 'barcodes') if name in data]
+    if len(params) != 1 or not isinstance(data[params[0]], list):
+        return Response(
+            {'error': 'Indiquer exactement une liste parmi: ids, barcodes'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    keys = data[params[0]]
+    if len(keys) > BATCH_MAX_KEYS:
+        return Response(
+            {'error': f'{BATCH_MAX_KEYS} clés au maximum par requête'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    raw_fields = data.get('fields')
+    if isinstance(raw_fields, list):
+        raw_fields = ','.join(str(field) for field in raw_fields)
+    try:
+        fields = parse_fields(raw_fields, EQUIPMENT_FIELDS)
+    except InvalidFields as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    key_field = '_id' if params[0] == 'ids' else 'barcode'
+    results = get_equipments_batch(keys, key_field=key_field, fields=fields)
+    return Response({
+        'found': sum(1 for item in results if item['found']),
+        'missing': sum(1 for item in results if not item['found']),
+        'results': results
+    })
+
+
 @api_view(['GET'])
 def admin_overview(request):
     """
@@ -316,12 +449,8 @@ def admin_overview(request):
     }
     try:
         db = get_mongodb_connection()
-        # Ping
-        try:
-            db.client.admin.command('ping')
-            data['mongo']['ok'] = True
-        except Exception as e:
-            data['mongo']['error'] = str(e)
+        # Ping (vérification explicite, hors du chemin des requêtes courantes)
+        data['mongo']['ok'], data['mongo']['error'] = check_mongodb_health()
         # Compteurs
         try:
             data['counters']['equipments'] = db['equipment'].count_documents({})
@@ -337,6 +466,15 @@ def admin_overview(request):
         return JsonResponse({'success': False, 'data': data}, status=500)
 
 
+@api_view(['GET'])
+def response_cache_stats(request):
+    """
+    Compteurs du cache des réponses (processus courant) : hits, réponses
+    périmées servies, misses et taux de succès par endpoint.
+    """
+    return Response({'pid': os.getpid(), 'endpoints': get_response_cache_stats()})
+
+
 class DashboardView(TemplateView):
     """
     Vue principale du tableau de bord
@@ -417,93 +555,165 @@ def export_equipments_csv(request):
     """
     Exporte la liste des équipements filtrés en CSV.
     Les mêmes filtres que l'API /api/equipments/ sont supportés via query params.
+    
+    Le fichier est produit en flux depuis un curseur MongoDB (mémoire constante,
+    pas de plafond de lignes) et compressé en gzip si le client l'accepte
+    (désactivable par ?gzip=0).
     """
-    # Construire les filtres depuis la query string
-    filters = {}
-    for param in ['model', 'serial', 'barcode', 'status', 'location']:
-        if param in request.query_params:
-            filters[param] = request.query_params.get(param)
-
-    # Filtres de date (plages)
-    for param in ['creation_date', 'dms']:
-        gte = request.query_params.get(f'{param}_gte')
-        lte = request.query_params.get(f'{param}_lte')
-        if gte or lte:
-            filters[param] = {}
-            if gte:
-                filters[param]['gte'] = gte
-            if lte:
-                filters[param]['lte'] = lte
-
-    # Récupérer un grand lot (pas de pagination pour export)
-    data = get_equipments(filters=filters, page=1, page_size=100000)
-    rows = data.get('results', [])
-
-    # Champs à exporter
-    fieldnames = ['_id', 'model', 'brand', 'serial', 'barcode', 'status', 'location',
-                  'family', 'subfamily', 'inventory_number', 'purchase_value',
-                  'creation_date', 'updated_at']
-
-    # Générer le CSV en mémoire
-    buffer = io.StringIO()
-    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
-    writer.writeheader()
-    for r in rows:
-        writer.writerow({k: ('' if r.get(k) is None else r.get(k)) for k in fieldnames})
-
-    content = buffer.getvalue()
-    buffer.close()
+    # Construire les filtres depuis la query string (mêmes règles que l'API)
+    try:
+        filters = parse_equipment_filters(request.query_params)
+    except InvalidFilter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    chunks = (chunk.encode('utf-8') for chunk in iter_csv(iter_equipments(filters)))
+    use_gzip = (
+        request.query_params.get('gzip', '1') != '0'
+        and accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING'))
+    )
+    if use_gzip:
+        chunks = gzip_chunks(chunks)
 
     # Réponse HTTP avec attachement
     filename = f"equipements_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
-    response = HttpResponse(content, content_type='text/csv; charset=utf-8')
+    response = StreamingHttpResponse(chunks, content_type='text/csv; charset=utf-8')
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
     return response
 
 @api_view(['GET'])
 def export_equipments_excel(request):
     """
     Exporte la liste des équipements filtrés en Excel (XLSX).
+    
+    Le classeur est écrit ligne par ligne depuis un curseur MongoDB dans un
+    fichier temporaire (mémoire constante), avec des cellules date et nombre
+    typées et une nouvelle feuille au-delà de la limite de lignes d'Excel.
     """
     # Construire les filtres identiques à CSV
-    filters = {}
-    for param in ['model', 'serial', 'barcode', 'status', 'location']:
-        if param in request.query_params:
-            filters[param] = request.query_params.get(param)
-
-    for param in ['creation_date', 'dms']:
-        gte = request.query_params.get(f'{param}_gte')
-        lte = request.query_params.get(f'{param}_lte')
-        if gte or lte:
-            filters[param] = {}
-            if gte:
-                filters[param]['gte'] = gte
-            if lte:
-                filters[param]['lte'] = lte
-
-    data = get_equipments(filters=filters, page=1, page_size=100000)
-    rows = data.get('results', [])
-
-    # Champs à exporter
-    fieldnames = ['_id', 'model', 'brand', 'serial', 'barcode', 'status', 'location',
-                  'family', 'subfamily', 'inventory_number', 'purchase_value',
-                  'creation_date', 'updated_at']
-
-    # Utiliser pandas pour créer un fichier Excel en mémoire
-    import pandas as pd
-    import io as _io
-    df = pd.DataFrame(rows, columns=fieldnames)
-    output = _io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Equipements')
-        writer.close()
-    output.seek(0)
+    try:
+        filters = parse_equipment_filters(request.query_params)
+    except InvalidFilter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    output = export_xlsx_to_tempfile(filters)
 
     filename = f"equipements_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    response = HttpResponse(output.getvalue(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    # FileResponse ferme (et supprime) le fichier temporaire une fois envoyé
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=filename,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+def _columnar_export(request, export_format):
+    """
+    Export Parquet ou Arrow IPC en flux, avec les filtres de /api/equipments/.
+    """
+    try:
+        filters = parse_equipment_filters(request.query_params)
+    except InvalidFilter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if not columnar_available():
+        return Response(
+            {'error': 'Export indisponible : pyarrow n\'est pas installé'},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+
+    content_type, extension = COLUMNAR_FORMATS[export_format]
+    filename = f"equipements_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    response = StreamingHttpResponse(
+        iter_columnar(iter_equipments(filters), export_format), content_type=content_type
+    )
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
+@api_view(['GET'])
+def export_equipments_parquet(request):
+    """
+    Exporte les équipements filtrés en Parquet (colonnes typées, compression zstd).
+    """
+    return _columnar_export(request, 'parquet')
+
+@api_view(['GET'])
+def export_equipments_arrow(request):
+    """
+    Exporte les équipements filtrés au format Arrow IPC (flux).
+    """
+    return _columnar_export(request, 'arrow')
+
+def _export_job_response(request, job, status_code=status.HTTP_200_OK):
+    """Ajoute à l'état d'une tâche les URL de suivi et de téléchargement."""
+    job['progress_url'] = request.build_absolute_uri(
+        reverse('api-equipment-export-job', args=[job['id']])
+    )
+    job['download_url'] = request.build_absolute_uri(
+        reverse('api-equipment-export-job-download', args=[job['id']])
+    ) if job['status'] == 'done' else None
+    return Response(job, status=status_code)
+
+@api_view(['POST'])
+def export_job_create(request):
+    """
+    Soumet un export asynchrone des équipements.
+    
+    Corps JSON : {"format": "csv" | "xlsx", "filters": {...}} où filters reprend
+    les paramètres de /api/equipments/ (status, creation_date_range, tz...).
+    Renvoie l'identifiant de la tâche ; un export identique sur des données
+    inchangées est servi depuis le cache.
+    """
+    data = request.data if isinstance(request.data, dict) else {}
+    export_format = data.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response(
+            {'error': f"format doit valoir {', '.join(EXPORT_FORMATS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    raw_filters = data.get('filters') or {}
+    if not isinstance(raw_filters, dict):
+        return Response({'error': 'filters doit être un objet'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filters = parse_equipment_filters(raw_filters)
+    except InvalidFilter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    job = submit_export(export_format, filters)
+    status_code = status.HTTP_200_OK if job['status'] == 'done' else status.HTTP_202_ACCEPTED
+    return _export_job_response(request, job, status_code)
+
+@api_view(['GET'])
+def export_job_detail(request, job_id):
+    """
+    État et avancement (lignes écrites) d'une tâche d'export.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return Response({'error': 'Tâche inconnue'}, status=status.HTTP_404_NOT_FOUND)
+    return _export_job_response(request, job)
+
+@api_view(['GET'])
+def export_job_download(request, job_id):
+    """
+    Télécharge le fichier d'une tâche d'export terminée.
+    """
+    result = get_job_file(job_id)
+    try:
+        # Le fichier peut avoir été évincé du cache entre-temps
+        handle = open(result[0], 'rb') if result else None
+    except FileNotFoundError:
+        handle = None
+    if handle is None:
+        return Response(
+            {'error': 'Fichier indisponible (tâche inconnue, en cours ou expirée)'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    _, content_type, extension = result
+    filename = f"equipements_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return FileResponse(handle, as_attachment=True, filename=filename, content_type=content_type)
+
 class EquipmentStatsAdminView(View):
     """
     Page d'administration (réservée au staff) affichant des statistiques
@@ -512,27 +722,12 @@ class EquipmentStatsAdminView(View):
     template_name = 'dashboard/admin/equipment_stats.html'
 
     def get(self, request):
-        db = get_mongodb_connection()
-        coll = db['equipment']
-
-        # Compteurs simples
-        total = coll.count_documents({})
-
-        # Répartition par statut
-        pipeline_status = [
-            { '$group': { '_id': '$status', 'count': { '$sum': 1 } } },
-            { '$sort': { 'count': -1 } }
-        ]
-        by_status = list(coll.aggregate(pipeline_status))
+        # Agrégats pré-calculés (voir dashboard.rollups)
+        by_status = rollup_totals('status')
+        total = sum(row['count'] for row in by_status)
 
         # Top localisations
-        pipeline_loc = [
-            { '$match': { 'location': { '$exists': True, '$ne': '' } } },
-            { '$group': { '_id': '$location', 'count': { '$sum': 1 } } },
-            { '$sort': { 'count': -1 } },
-            { '$limit': 10 }
-        ]
-        top_locations = list(coll.aggregate(pipeline_loc))
+        top_locations = rollup_totals('location', match={'location': {'$ne': None}}, limit=10)
 
         context = {
             'total': total,
@@ -1,113 +1,32 @@
 from django.views import View
 from django.http import JsonResponse
-from datetime import datetime, timedelta
-from .api import get_mongodb_connection
+from django.utils.decorators import method_decorator
+from .api import get_dashboard_summary, get_equipment_evolution
+from .bucketing import GRANULARITIES, period_label
+from .conditional import conditional_response
+from .filters import InvalidFilter, get_timezone, parse_equipment_filters, parse_period
+from .response_cache import cached_response
+from .rollups import rollup_totals
+from .snapshot import get_snapshot
+from .versions import get_version
 
+@method_decorator(conditional_response('analytics-status-distribution', ('equipment',)), name='get')
+@method_decorator(cached_response('analytics-status-distribution', ('equipment',)), name='get')
 class EquipmentStatusDistributionView(View):
     """
     Vue pour récupérer la répartition des équipements par statut
     """
     def get(self, request):
         try:
-            db = get_mongodb_connection()
-            collection = db['equipment']
-            
-            # Agrégation pour compter les équipements par statut normalisé
-            pipeline = [
-                # Étape 1: Normaliser les statuts
-                {
-                    '$addFields': {
-                        'normalized_status': {
-                            '$switch': {
-                                'branches': [
-                                    # Gérer les variantes de 'En service'
-                                    {
-                                        'case': { 
-                                            '$or': [
-                                                { '$eq': [{ '$toLower': '$status' }, 'en service'] },
-                                                { '$eq': [{ '$toLower': '$status' }, 'en service.'] },
-                                                { '$eq': ['$status', 'EN SERVICE'] },
-                                                { '$eq': ['$status', 'En Service'] },
-                                                { '$eq': ['$status', 'EN Service'] }
-                                            ]
-                                        },
-                                        'then': 'En service'
-                                    },
-                                    # Gérer les variantes de 'En stock'
-                                    {
-                                        'case': { 
-                                            '$or': [
-                                                { '$eq': [{ '$toLower': '$status' }, 'en stock'] },
-                                                { '$eq': ['$status', 'EN STOCK'] },
-                                                { '$eq': ['$status', 'En Stock'] },
-                                                { '$eq': ['$status', 'EN Stock'] }
-                                            ]
-                                        },
-                                        'then': 'En stock'
-                                    },
-                                    # Gérer les variantes de 'En panne'
-                                    {
-                                        'case': { 
-                                            '$or': [
-                                                { '$eq': [{ '$toLower': '$status' }, 'en panne'] },
-                                                { '$eq': ['$status', 'EN PANNE'] },
-                                                { '$eq': ['$status', 'En Panne'] },
-                                                { '$eq': ['$status', 'hs'] },
-                                                { '$eq': ['$status', 'HS'] },
-                                                { '$eq': ['$status', 'Hs'] }
-                                            ]
-                                        },
-                                        'then': 'Hors service'
-                                    }
-                                ],
-                                'default': '$status'  # Conserver la valeur d'origine si aucune correspondance
-                            }
-                        }
-                    }
-                },
-                # Étape 2: Gérer les valeurs nulles ou vides
-                {
-                    '$addFields': {
-                        'normalized_status': {
-                            '$ifNull': ['$normalized_status', 'Non spécifié']
-                        }
-                    }
-                },
-                # Étape 3: Grouper par statut normalisé avec comptage
-                {
-                    '$group': {
-                        '_id': '$normalized_status',
-                        'count': { '$sum': 1 },
-                        # Ajouter une valeur par défaut pour le calcul de la valeur totale
-                        'total_value': { 
-                            '$sum': { 
-                                '$cond': [
-                                    { '$and': [
-                                        { '$ifNull': ['$purchase_value', False] },
-                                        { '$gt': ['$purchase_value', 0] }
-                                    ]},
-                                    '$purchase_value',
-                                    0
-                                ]
-                            } 
-                        }
-                    }
-                },
-                # Étape 4: Projeter les résultats
-                {
-                    '$project': {
-                        'status': '$_id',
-                        'count': 1,
-                        'total_value': 1,
-                        '_id': 0
-                    }
-                }
-            ]
-            
-            results = list(collection.aggregate(pipeline))
+            # Totaux par statut normalisé : instantané en mémoire (dashboard.snapshot)
+            # s'il est à jour, sinon agrégats (dashboard.rollups)
+            snapshot = get_snapshot()
+            results = snapshot.totals('status') if snapshot is not None else None
+            if results is None:
+                results = rollup_totals('status')
             
             # Formater les résultats pour Chart.js
-            labels = [item['status'] for item in results]
+            labels = [item['_id'] for item in results]
             counts = [item['count'] for item in results]
             values = [float(item.get('total_value', 0)) for item in results]
             
@@ -126,141 +45,54 @@ class EquipmentStatusDistributionView(View):
                 'error': str(e)
             }, status=500)
 
+def _status_datasets(series, statuses):
+    """Séries Chart.js, une par statut."""
+    return [
+        {
+            'label': status,
+            'data': series[status],
+            'borderColor': EquipmentEvolutionView._get_status_color(status),
+            'backgroundColor': EquipmentEvolutionView._get_status_color(status, 0.2),
+            'tension': 0.3
+        }
+        for status in statuses
+    ]
+
+
+@method_decorator(conditional_response('analytics-evolution', ('equipment',), time_relative=True), name='get')
+@method_decorator(cached_response('analytics-evolution', ('equipment',), time_relative=True), name='get')
 class EquipmentEvolutionView(View):
     """
     Vue pour récupérer l'évolution des stocks dans le temps
+
+    Paramètres : months (défaut 12) ou from/to, granularity (défaut month) et
+    tz. Renvoie les ajouts par période (datasets) et le stock cumulé par
+    statut (stock).
     """
     def get(self, request):
         try:
-            db = get_mongodb_connection()
-            collection = db['equipment']
-            
-            # Calculer la date d'il y a 12 mois
-            one_year_ago = datetime.now() - timedelta(days=365)
-            
-            # Agrégation pour compter les équipements par mois et par statut normalisé
-            pipeline = [
-                # Étape 1: Filtrer par date et s'assurer que creation_date existe
-                {
-                    '$match': {
-                        'creation_date': { 
-                            '$exists': True,
-                            '$ne': None,
-                            '$gte': one_year_ago 
-                        },
-                        'status': { '$exists': True, '$ne': None }
-                    }
-                },
-                # Étape 2: Normaliser les statuts
-                {
-                    '$addFields': {
-                        'normalized_status': {
-                            '$switch': {
-                                'branches': [
-                                    # Gérer les variantes de 'En service'
-                                    {
-                                        'case': { 
-                                            '$or': [
-                                                { '$eq': [{ '$toLower': '$status' }, 'en service'] },
-                                                { '$eq': [{ '$toLower': '$status' }, 'en service.'] },
-                                                { '$eq': ['$status', 'EN SERVICE'] },
-                                                { '$eq': ['$status', 'En Service'] },
-                                                { '$eq': ['$status', 'EN Service'] }
-                                            ]
-                                        },
-                                        'then': 'En service'
-                                    },
-                                    # Gérer les variantes de 'En stock'
-                                    {
-                                        'case': { 
-                                            '$or': [
-                                                { '$eq': [{ '$toLower': '$status' }, 'en stock'] },
-                                                { '$eq': ['$status', 'EN STOCK'] },
-                                                { '$eq': ['$status', 'En Stock'] },
-                                                { '$eq': ['$status', 'EN Stock'] }
-                                            ]
-                                        },
-                                        'then': 'En stock'
-                                    },
-                                    # Gérer les variantes de 'En panne' et 'HS'
-                                    {
-                                        'case': { 
-                                            '$or': [
-                                                { '$eq': [{ '$toLower': '$status' }, 'en panne'] },
-                                                { '$eq': ['$status', 'EN PANNE'] },
-                                                { '$eq': ['$status', 'En Panne'] },
-                                                { '$eq': ['$status', 'hs'] },
-                                                { '$eq': ['$status', 'HS'] },
-                                                { '$eq': ['$status', 'Hs'] }
-                                            ]
-                                        },
-                                        'then': 'Hors service'
-                                    }
-                                ],
-                                'default': 'Autre'  # Valeur par défaut pour les statuts non reconnus
-                            }
-                        }
-                    }
-                },
-                # Étape 3: Grouper par mois et statut normalisé
-                {
-                    '$group': {
-                        '_id': {
-                            'year': { '$year': '$creation_date' },
-                            'month': { '$month': '$creation_date' },
-                            'status': '$normalized_status'
-                        },
-                        'count': { '$sum': 1 }
-                    }
-                },
-                # Étape 4: Trier par année et mois
-                {
-                    '$sort': { '_id.year': 1, '_id.month': 1 }
-                }
-            ]
-            
-            results = list(collection.aggregate(pipeline))
-            
-            # Formater les résultats pour Chart.js
-            months = {}
-            statuses = set()
-            
-            for item in results:
-                year = item['_id']['year']
-                month = item['_id']['month']
-                status = item['_id']['status']
-                count = item['count']
-                
-                month_key = f"{year}-{month:02d}"
-                statuses.add(status)
-                
-                if month_key not in months:
-                    months[month_key] = {}
-                
-                months[month_key][status] = count
-            
-            # Créer les séries de données pour chaque statut
-            sorted_months = sorted(months.keys())
-            status_series = {status: [] for status in statuses}
-            
-            for month in sorted_months:
-                for status in statuses:
-                    status_series[status].append(months[month].get(status, 0))
+            tz = get_timezone(request.GET.get('tz'))
+            period = parse_period(request.GET, tz)
+            granularity = request.GET.get('granularity', 'month')
+            if granularity not in GRANULARITIES:
+                raise InvalidFilter(f'Granularité invalide: {granularity}')
+        except InvalidFilter as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+        try:
+            evolution = get_equipment_evolution(period, granularity, tz)
+            granularity = evolution['granularity']
+            statuses = sorted(evolution['stock'])
             
             return JsonResponse({
                 'success': True,
                 'data': {
-                    'labels': sorted_months,
-                    'datasets': [
-                        {
-                            'label': status,
-                            'data': status_series[status],
-                            'borderColor': self._get_status_color(status),
-                            'backgroundColor': self._get_status_color(status, 0.2),
-                            'tension': 0.3
-                        }
-                        for status in statuses
-                    ]
+                    'labels': [period_label(day, granularity) for day in evolution['periods']],
+                    'granularity': granularity,
+                    # Ajouts par période
+                    'datasets': _status_datasets(evolution['added'], statuses),
+                    # Stock cumulé en fin de période
+                    'stock': _status_datasets(evolution['stock'], statuses),
                 }
             })
             
@@ -269,7 +101,7 @@ class EquipmentEvolutionView(View):
                 'success': False,
                 'error': str(e)
             }, status=500)
-    
+
     @staticmethod
     def _get_status_color(status, opacity=1):
         """Retourne une couleur en fonction du statut"""
@@ -283,35 +115,20 @@ class EquipmentEvolutionView(View):
         }
         return colors.get(status, f'rgba(201, 203, 207, {opacity})')
 
+@method_decorator(conditional_response('analytics-locations', ('equipment',)), name='get')
+@method_decorator(cached_response('analytics-locations', ('equipment',)), name='get')
 class EquipmentLocationView(View):
     """
     Vue pour récupérer la répartition géographique des équipements
     """
     def get(self, request):
         try:
-            db = get_mongodb_connection()
-            collection = db['equipment']
-            
-            # Agrégation pour compter les équipements par localisation
-            pipeline = [
-                {
-                    '$match': {
-                        'location': { '$exists': True, '$ne': '' }
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$location',
-                        'count': { '$sum': 1 },
-                        'total_value': { '$sum': '$purchase_value' }
-                    }
-                },
-                {
-                    '$sort': { 'count': -1 }
-                }
-            ]
-            
-            results = list(collection.aggregate(pipeline))
+            # Totaux par localisation : instantané en mémoire (dashboard.snapshot)
+            # s'il est à jour, sinon agrégats (dashboard.rollups)
+            snapshot = get_snapshot()
+            results = snapshot.totals('location') if snapshot is not None else None
+            if results is None:
+                results = rollup_totals('location', match={'location': {'$ne': None}})
             
             # Formater les résultats pour la carte
             locations = []
@@ -334,3 +151,80 @@ class EquipmentLocationView(View):
                 'success': False,
                 'error': str(e)
             }, status=500)
+
+
+# Nombre maximal de localisations renvoyées par le résumé
+SUMMARY_MAX_LOCATIONS = 100
+
+
+@method_decorator(conditional_response('analytics-summary', ('equipment',), time_relative=True), name='get')
+@method_decorator(cached_response('analytics-summary', ('equipment',), time_relative=True), name='get')
+class EquipmentSummaryView(View):
+    """
+    Vue renvoyant tous les indicateurs du tableau de bord en une requête
+
+    Accepte les filtres de /api/equipments/ (model, status, location,
+    creation_date_*...), ainsi que months ou from/to (fenêtre de l'évolution),
+    granularity, tz et top (nombre de localisations).
+    """
+    def get(self, request):
+        try:
+            tz = get_timezone(request.GET.get('tz'))
+            filters = parse_equipment_filters(request.GET)
+            period = parse_period(request.GET, tz)
+            granularity = request.GET.get('granularity', 'month')
+            if granularity not in GRANULARITIES:
+                raise InvalidFilter(f'Granularité invalide: {granularity}')
+            try:
+                top = int(request.GET.get('top', 10))
+            except ValueError:
+                raise InvalidFilter('Paramètre top invalide')
+            if not 1 <= top <= SUMMARY_MAX_LOCATIONS:
+                raise InvalidFilter(f'top doit être compris entre 1 et {SUMMARY_MAX_LOCATIONS}')
+        except InvalidFilter as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+        try:
+            # Version lue avant le calcul : une écriture concurrente rend la
+            # réponse plus ancienne que sa version, jamais l'inverse
+            version = get_version('equipment')
+            summary = get_dashboard_summary(filters, period, granularity, tz, top)
+            evolution = summary['evolution']
+            statuses = sorted(evolution['stock'])
+
+            return JsonResponse({
+                'success': True,
+                'version': version,
+                'data': {
+                    'total': summary['total'],
+                    'total_value': float(summary['total_value']),
+                    # Même format que /api/analytics/status-distribution/
+                    'statuses': {
+                        'labels': [item['_id'] for item in summary['statuses']],
+                        'counts': [item['count'] for item in summary['statuses']],
+                        'values': [float(item['total_value']) for item in summary['statuses']],
+                    },
+                    # Même format que /api/analytics/locations/
+                    'locations': [
+                        {'name': item['_id'], 'count': item['count'],
+                         'total_value': float(item['total_value'])}
+                        for item in summary['locations']
+                    ],
+                    # Même format que /api/equipments/?group_by=creation_date
+                    'timeline': summary['timeline'],
+                    # Même format que /api/analytics/evolution/
+                    'evolution': {
+                        'labels': [period_label(day, evolution['granularity'])
+                                   for day in evolution['periods']],
+                        'granularity': evolution['granularity'],
+                        'datasets': _status_datasets(evolution['added'], statuses),
+                        'stock': _status_datasets(evolution['stock'], statuses),
+                    },
+                }
+            })
+
+        except Exception as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
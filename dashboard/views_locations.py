@@ -4,6 +4,7 @@ from django.urls import reverse_lazy
 from django.contrib import messages
 from django.conf import settings
 from django.http import Http404, HttpResponseRedirect
+from django.utils.decorators import method_decorator
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -14,12 +15,21 @@ from .api_locations import (
     get_locations, get_location, create_location, update_location, delete_location,
     get_locations_statistics, get_locations_for_map
 )
+from .clustering import InvalidTile, get_tile_clusters
+from .conditional import conditional_response
+from .counting import COUNT_MODES
+from .filters import InvalidFilter
+from .geo import parse_viewport
+from .keyset import InvalidCursor
+from .projection import LOCATION_FIELDS, InvalidFields, parse_fields
+from .response_cache import cached_response
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+@method_decorator(conditional_response('location-list', ('locations',)), name='get')
 class LocationListView(APIView):
     """
     Vue API pour lister et filtrer les localisations
@@ -69,17 +79,41 @@ class LocationListView(APIView):
         sort_field = request.query_params.get('sort', None)
         sort_order = -1 if request.query_params.get('order', 'desc').lower() == 'desc' else 1
         
+        # Pagination par curseur (opt-in) : ?pagination=cursor puis ?cursor=<jeton next/prev>
+        cursor = None
+        if 'cursor' in request.query_params or request.query_params.get('pagination') == 'cursor':
+            cursor = request.query_params.get('cursor', '')
+        
+        # Champs renvoyés (?fields=a,b,c)
+        try:
+            fields = parse_fields(request.query_params.get('fields'), LOCATION_FIELDS)
+        except InvalidFields as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Calcul du total : exact (défaut), facet, estimated ou cached
+        count_mode = request.query_params.get('count', 'exact')
+        if count_mode not in COUNT_MODES:
+            count_mode = 'exact'
+        
         # Récupération des données avec pagination
-        result = get_locations(
-            filters=filters,
-            page=page,
-            page_size=page_size,
-            sort_field=sort_field,
-            sort_order=sort_order
-        )
+        try:
+            result = get_locations(
+                filters=filters,
+                page=page,
+                page_size=page_size,
+                sort_field=sort_field,
+                sort_order=sort_order,
+                cursor=cursor,
+                count_mode=count_mode,
+                fields=fields,
+                serialize=False
+            )
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(result)
 
+@method_decorator(conditional_response('location-detail', ('locations',)), name='get')
 class LocationDetailView(APIView):
     """
     Vue API pour récupérer une localisation spécifique
@@ -87,7 +121,12 @@ class LocationDetailView(APIView):
     permission_classes = [AllowAny]
     
     def get(self, request, pk):
-        location = get_location(pk)
+        try:
+            fields = parse_fields(request.query_params.get('fields'), LOCATION_FIELDS)
+        except InvalidFields as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        location = get_location(pk, fields=fields, serialize=False)
         if not location:
             return Response(
                 {'error': 'Localisation non trouvée'}, 
@@ -110,6 +149,8 @@ class LocationTemplateView(TemplateView):
         context['debug'] = settings.DEBUG
         return context
 
+@conditional_response('location-statistics', ('locations',))
+@cached_response('location-statistics', ('locations',))
 @api_view(['GET'])
 def location_statistics(request):
     """
@@ -118,14 +159,38 @@ def location_statistics(request):
     stats = get_locations_statistics()
     return Response(stats)
 
+@conditional_response('locations-map-data', ('locations',))
+@cached_response('locations-map-data', ('locations',))
 @api_view(['GET'])
 def locations_map_data(request):
     """
     Vue API pour récupérer les données des localisations pour la carte
+    
+    ?bbox=ouest,sud,est,nord limite la réponse aux sites de la zone affichée ;
+    ?zoom= aligne cette zone sur les tuiles du niveau de zoom.
     """
-    map_data = get_locations_for_map()
+    try:
+        viewport = parse_viewport(request.query_params)
+    except InvalidFilter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    map_data = get_locations_for_map(viewport)
     return Response(map_data)
 
+@conditional_response('location-tiles', ('locations',))
+@cached_response('location-tiles', ('locations',))
+@api_view(['GET'])
+def location_tile(request, z, x, y):
+    """
+    Vue API renvoyant les groupes de localisations d'une tuile de la carte
+    (voir dashboard.clustering)
+    """
+    try:
+        tile = get_tile_clusters(z, x, y)
+    except InvalidTile as e:
+        return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+    return Response(tile)
+
 class LocationEditView(TemplateView):
     """
     Vue pour ajouter ou modifier une localisation
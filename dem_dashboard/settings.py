@@ -57,6 +57,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'dashboard.middleware.MongoTimingMiddleware',  # Server-Timing + log des commandes MongoDB
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Ajout de WhiteNoise pour la gestion des fichiers statiques
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -108,6 +109,62 @@ MONGODB_DATABASES = {
     }
 }
 
+# Instrumentation MongoDB par requête (en-tête Server-Timing + log structuré)
+MONGO_TIMING_ENABLED = os.getenv('MONGO_TIMING_ENABLED', 'True') == 'True'
+
+# Django REST Framework : rendu JSON direct des types BSON (voir dashboard/renderers.py)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'dashboard.renderers.MongoJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Cache Django, utilisé pour les réponses des analytics (voir dashboard/response_cache.py).
+# Par défaut en mémoire, propre à chaque processus ; CACHE_URL=redis://... pour un
+# cache partagé entre les workers (paquet redis requis).
+CACHE_URL = os.getenv('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'dem-dashboard',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
+    }
+
+# Cache des réponses : durée de fraîcheur, puis durée pendant laquelle une réponse
+# périmée est servie pendant son recalcul (stale-while-revalidate), en secondes
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+RESPONSE_CACHE_STALE = int(os.getenv('RESPONSE_CACHE_STALE', 600))
+
+
+# Journalisation
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'dashboard': {
+            'handlers': ['console'],
+            'level': os.getenv('DASHBOARD_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,67 @@
+"""
+Outils communs aux scripts de mesure (scripts/bench_*.py).
+
+L'import de ce module configure Django (chemin du projet et settings) : il doit
+précéder les imports de modules dashboard dans les scripts.
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+# Ajouter le répertoire parent au chemin Python pour pouvoir importer les modules du projet
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dem_dashboard.settings')
+
+import django
+
+django.setup()
+
+STATUSES = ['En service', 'En stock', 'Hors service', 'Instance']
+
+
+def synthetic_docs(count):
+    """Documents synthétiques de même forme que la collection 'equipment', générés à la demande."""
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    for i in range(count):
+        created = start + timedelta(hours=i)
+        yield {
+            '_id': ObjectId(),
+            'model': f'MODELE-{i % 250}',
+            'brand': f'Marque {i % 40}',
+            'serial': f'SN{i:08d}',
+            'barcode': f'{100000000 + i}',
+            'status': STATUSES[i % len(STATUSES)],
+            'location': f'Site {i % 900}',
+            'family': f'Famille {i % 12}',
+            'subfamily': f'Sous-famille {i % 60}',
+            'inventory_number': f'INV-{i:06d}',
+            'purchase_value': float(i % 5000),
+            'creation_date': created,
+            'updated_at': created,
+        }
+
+
+def timed(func, *args):
+    """Exécute func(*args) et retourne (résultat, durée en secondes)."""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def measure(label, func, docs_factory, rows):
+    """
+    Exécute func(docs_factory()) et affiche durée, débit et pic mémoire
+    (tracemalloc). func retourne la taille produite en octets.
+    """
+    tracemalloc.start()
+    try:
+        size, elapsed = timed(func, docs_factory())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    print(f'{label:<28} {elapsed:7.2f} s  {rows / elapsed:9.0f} lignes/s  '
+          f'pic {peak / 1024 / 1024:8.1f} Mo  {size / 1024 / 1024:8.1f} Mo produits')
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Script pour calculer la position canonique (geo, point GeoJSON) des
+localisations existantes et créer l'index 2dsphere correspondant.
+Ce script doit être exécuté depuis le répertoire racine du projet.
+
+Les coordonnées sont lues dans tous les schémas rencontrés
+(coordinates.latitude/longitude, lat/lng, latitude/longitude) ; les
+localisations sans coordonnées valides reçoivent geo: None.
+
+Usage:
+    python scripts/backfill_location_geo.py [--only-missing]
+"""
+import os
+import sys
+
+from pymongo import UpdateOne
+
+# Ajouter le répertoire parent au chemin Python pour pouvoir importer les modules du projet
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.db import get_mongodb_connection, check_mongodb_health
+from dashboard.geo import GEO_SOURCE_FIELDS, build_geo_fields, mark_geo_backfill_done
+from dashboard.indexes import ensure_location_indexes
+from dashboard.versions import bump_version
+
+BATCH_SIZE = 1000
+
+
+def main():
+    """Fonction principale du script."""
+    only_missing = '--only-missing' in sys.argv[1:]
+    print("Début du calcul des positions des localisations...")
+
+    ok, error = check_mongodb_health()
+    if not ok:
+        print(f"Erreur de connexion à MongoDB: {error}")
+        sys.exit(1)
+
+    db = get_mongodb_connection()
+    collection = db['locations']
+
+    query = {'geo': {'$exists': False}} if only_missing else {}
+    projection = {field: 1 for field in GEO_SOURCE_FIELDS}
+
+    positioned = 0
+    without_position = 0
+    updated_count = 0
+    operations = []
+    for doc in collection.find(query, projection):
+        fields = build_geo_fields(doc)
+        if fields['geo'] is None:
+            without_position += 1
+        else:
+            positioned += 1
+        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': fields}))
+        if len(operations) >= BATCH_SIZE:
+            updated_count += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated_count += collection.bulk_write(operations, ordered=False).modified_count
+
+    print("\nRésumé :")
+    print(f"- Localisations positionnées : {positioned}")
+    print(f"- Localisations sans coordonnées valides : {without_position}")
+    print(f"- Documents mis à jour : {updated_count}")
+
+    print("Création des index...")
+    ensure_location_indexes(db)
+
+    if updated_count:
+        # Invalider les caches dérivés (carte, statistiques...)
+        bump_version('locations', db)
+    # Toutes les localisations portent geo : la carte peut s'y limiter
+    mark_geo_backfill_done(db)
+    print("Terminé.")
+
+
+if __name__ == "__main__":
+    main()
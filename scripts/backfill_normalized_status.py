@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Script pour calculer le statut normalisé (normalized_status) des équipements
+existants et créer les index correspondants.
+Ce script doit être exécuté depuis le répertoire racine du projet.
+
+Le calcul est fait par valeur distincte de 'status' (quelques dizaines) : une
+seule mise à jour groupée par valeur, sans relire les documents.
+
+Usage:
+    python scripts/backfill_normalized_status.py [--only-missing]
+"""
+import os
+import sys
+
+from pymongo import UpdateMany
+
+# Ajouter le répertoire parent au chemin Python pour pouvoir importer les modules du projet
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.db import get_mongodb_connection, check_mongodb_health
+from dashboard.indexes import ensure_equipment_indexes
+from dashboard.rollups import ROLLUP_MODE, rebuild_rollup
+from dashboard.status import normalize_status
+from dashboard.versions import bump_version
+
+
+def main():
+    """Fonction principale du script."""
+    only_missing = '--only-missing' in sys.argv[1:]
+    print("Début du calcul des statuts normalisés...")
+
+    ok, error = check_mongodb_health()
+    if not ok:
+        print(f"Erreur de connexion à MongoDB: {error}")
+        sys.exit(1)
+
+    db = get_mongodb_connection()
+    collection = db['equipment']
+
+    base_query = {'normalized_status': {'$exists': False}} if only_missing else {}
+
+    # Valeurs distinctes de 'status' ($group plutôt que distinct() : pas de limite de 16 Mo)
+    statuses = [doc['_id'] for doc in collection.aggregate([
+        {'$match': base_query},
+        {'$group': {'_id': '$status'}},
+    ])]
+
+    operations = []
+    for status in statuses:
+        normalized = normalize_status(status)
+        print(f"- {status!r} -> {normalized}")
+        # {'status': None} sélectionne aussi les documents sans champ 'status'
+        operations.append(UpdateMany(
+            {**base_query, 'status': status},
+            {'$set': {'normalized_status': normalized}},
+        ))
+
+    updated_count = 0
+    if operations:
+        updated_count = collection.bulk_write(operations, ordered=False).modified_count
+
+    print("\nRésumé :")
+    print(f"- Valeurs de statut distinctes : {len(statuses)}")
+    print(f"- Documents mis à jour : {updated_count}")
+
+    print("Création des index...")
+    ensure_equipment_indexes(db)
+
+    if updated_count:
+        # Les agrégats des analytics sont indexés par statut normalisé
+        if ROLLUP_MODE == 'inline':
+            print("Recalcul des agrégats...")
+            rebuild_rollup(db)
+        # Invalider les caches dérivés (exports, analytics...) ; updated_at
+        # n'est pas modifié : instantanés à reconstruire
+        bump_version('equipment', db, reset=True)
+    print("Terminé.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Script pour calculer les champs de recherche indexée (_search, _search_ngrams)
+des équipements existants et créer les index correspondants.
+Ce script doit être exécuté depuis le répertoire racine du projet.
+
+Usage:
+    python scripts/backfill_search_fields.py [--only-missing]
+"""
+import os
+import sys
+
+from pymongo import UpdateOne
+
+# Ajouter le répertoire parent au chemin Python pour pouvoir importer les modules du projet
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.db import get_mongodb_connection, check_mongodb_health
+from dashboard.indexes import ensure_equipment_indexes
+from dashboard.search import SEARCH_FIELDS, build_search_fields, mark_search_backfill_done
+
+BATCH_SIZE = 1000
+
+
+def main():
+    """Fonction principale du script."""
+    only_missing = '--only-missing' in sys.argv[1:]
+    print("Début du calcul des champs de recherche...")
+
+    ok, error = check_mongodb_health()
+    if not ok:
+        print(f"Erreur de connexion à MongoDB: {error}")
+        sys.exit(1)
+
+    db = get_mongodb_connection()
+    collection = db['equipment']
+
+    query = {'_search': {'$exists': False}} if only_missing else {}
+    projection = {field: 1 for field in SEARCH_FIELDS}
+
+    updated_count = 0
+    operations = []
+    for doc in collection.find(query, projection).batch_size(BATCH_SIZE):
+        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': build_search_fields(doc)}))
+        if len(operations) >= BATCH_SIZE:
+            updated_count += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+            print(f"{updated_count} documents mis à jour...")
+
+    if operations:
+        updated_count += collection.bulk_write(operations, ordered=False).modified_count
+
+    print("\nRésumé :")
+    print(f"- Documents mis à jour : {updated_count}")
+
+    print("Création des index...")
+    ensure_equipment_indexes(db)
+
+    # Les modes de recherche indexés peuvent désormais être utilisés
+    mark_search_backfill_done(db)
+    print("Terminé.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare les exports CSV, Parquet et Arrow IPC : taille produite et temps de
+bout en bout (production du fichier + relecture typée côté analyste).
+
+- CSV     : iter_csv puis pandas.read_csv avec conversion des dates
+- Parquet : iter_columnar puis pyarrow.parquet.read_table().to_pandas()
+- Arrow   : iter_columnar puis pyarrow.ipc.open_stream().read_all().to_pandas()
+
+Par défaut les documents sont synthétiques (aucune connexion MongoDB) ; avec
+--mongo, ils sont lus dans la collection 'equipment'.
+
+Usage:
+    python scripts/bench_columnar_export.py [--rows 200000] [--mongo]
+"""
+import argparse
+import io
+
+from _bench_common import synthetic_docs, timed
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dashboard.exports import COLUMNAR_DATE_FIELDS, iter_columnar, iter_csv, iter_equipments
+
+
+def produce_csv(docs):
+    return b''.join(chunk.encode('utf-8') for chunk in iter_csv(docs))
+
+
+def read_csv(data):
+    return pd.read_csv(io.BytesIO(data), parse_dates=list(COLUMNAR_DATE_FIELDS))
+
+
+def read_parquet(data):
+    return pq.read_table(io.BytesIO(data)).to_pandas()
+
+
+def read_arrow(data):
+    return pa.ipc.open_stream(io.BytesIO(data)).read_all().to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--mongo', action='store_true', help='lire la collection equipment')
+    args = parser.parse_args()
+
+    if args.mongo:
+        docs_factory = iter_equipments
+    else:
+        docs_factory = lambda: synthetic_docs(args.rows)  # noqa: E731
+
+    formats = [
+        ('CSV', produce_csv, read_csv),
+        ('Parquet', lambda docs: b''.join(iter_columnar(docs, 'parquet')), read_parquet),
+        ('Arrow IPC', lambda docs: b''.join(iter_columnar(docs, 'arrow')), read_arrow),
+    ]
+    print(f"{'format':<10} {'taille':>10} {'production':>11} {'relecture':>10} {'total':>8}")
+    for label, produce, read in formats:
+        data, produced = timed(produce, docs_factory())
+        frame, parsed = timed(read, data)
+        print(f'{label:<10} {len(data) / 1024 / 1024:8.1f} Mo {produced:9.2f} s '
+              f'{parsed:8.2f} s {produced + parsed:6.2f} s  '
+              f'({len(frame)} lignes, creation_date: {frame["creation_date"].dtype})')
+
+
+if __name__ == '__main__':
+    main()
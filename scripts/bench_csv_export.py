@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Mesure du débit et de la mémoire de l'export CSV des équipements.
+
+Compare :
+- avant : tous les documents convertis en dicts, CSV complet dans un StringIO
+  puis copié en une chaîne (comportement de l'ancien export_equipments_csv)
+- après : flux de fragments produit par dashboard.exports.iter_csv (avec et
+  sans gzip)
+
+Par défaut les documents sont synthétiques (aucune connexion MongoDB) ; avec
+--mongo, ils sont lus dans la collection 'equipment' (filtres de l'API non
+appliqués).
+
+Usage:
+    python scripts/bench_csv_export.py [--rows 100000] [--mongo]
+"""
+import argparse
+import csv
+import io
+
+from _bench_common import measure, synthetic_docs
+
+from dashboard.api import _serialize_equipment
+from dashboard.exports import EQUIPMENT_EXPORT_FIELDS, gzip_chunks, iter_csv, iter_equipments
+
+
+def export_before(docs):
+    """Ancien export : matérialisation complète puis CSV en mémoire."""
+    rows = [_serialize_equipment(doc) for doc in docs]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EQUIPMENT_EXPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for r in rows:
+        writer.writerow({k: ('' if r.get(k) is None else r.get(k)) for k in EQUIPMENT_EXPORT_FIELDS})
+    content = buffer.getvalue()
+    buffer.close()
+    return len(content.encode('utf-8'))
+
+
+def export_after(docs, use_gzip=False):
+    """Nouvel export : fragments envoyés au fil de l'eau (ici comptés puis jetés)."""
+    chunks = (chunk.encode('utf-8') for chunk in iter_csv(docs))
+    if use_gzip:
+        chunks = gzip_chunks(chunks)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--mongo', action='store_true', help='lire la collection equipment')
+    args = parser.parse_args()
+
+    if args.mongo:
+        from dashboard.db import get_mongodb_connection
+        rows = get_mongodb_connection()['equipment'].estimated_document_count()
+        docs_factory = iter_equipments
+    else:
+        rows = args.rows
+        docs_factory = lambda: synthetic_docs(rows)  # noqa: E731
+
+    print(f'Export CSV de {rows} lignes')
+    measure('avant (StringIO)', export_before, docs_factory, rows)
+    measure('après (flux)', export_after, docs_factory, rows)
+    measure('après (flux + gzip)', lambda docs: export_after(docs, use_gzip=True), docs_factory, rows)
+
+
+if __name__ == '__main__':
+    main()
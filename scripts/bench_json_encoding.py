@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Mesure du coût d'encodage JSON d'une page d'équipements.
+
+Compare, pour des documents synthétiques de même forme que la collection
+'equipment' :
+- avant : conversion champ par champ (_serialize_equipment) puis JSONRenderer de DRF
+- après : MongoJSONRenderer sur les documents bruts (orjson, puis repli stdlib)
+
+Aucune connexion MongoDB n'est nécessaire.
+
+Usage:
+    python scripts/bench_json_encoding.py [--docs 1000] [--repeat 20]
+"""
+import argparse
+import copy
+
+from bson import Decimal128
+
+from _bench_common import synthetic_docs, timed
+
+from rest_framework.renderers import JSONRenderer
+
+from dashboard import renderers
+from dashboard.api import _serialize_equipment
+from dashboard.renderers import MongoJSONRenderer
+
+def bench(label, func, docs, repeat):
+    """Exécute func(copie des documents) repeat fois et affiche le temps par page."""
+    timings = []
+    for _ in range(repeat):
+        payload_docs = copy.deepcopy(docs)  # hors mesure : l'ancien chemin modifie les documents
+        payload, elapsed = timed(func, payload_docs)
+        timings.append(elapsed)
+        size = len(payload)
+    best = min(timings) * 1000
+    median = sorted(timings)[len(timings) // 2] * 1000
+    print(f'{label:<40} min {best:8.2f} ms  médiane {median:8.2f} ms  ({size} octets)')
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    docs = list(synthetic_docs(args.docs))
+    drf_renderer = JSONRenderer()
+    mongo_renderer = MongoJSONRenderer()
+
+    def before(page):
+        results = [_serialize_equipment(doc) for doc in page]
+        return drf_renderer.render({'total': len(results), 'results': results})
+
+    def after(page):
+        return mongo_renderer.render({'total': len(page), 'results': page})
+
+    print(f'Encodage de {args.docs} documents, {args.repeat} répétitions')
+    reference = bench('avant (conversion + DRF JSONRenderer)', before, docs, args.repeat)
+    if renderers.orjson is not None:
+        fast = bench('après (MongoJSONRenderer, orjson)', after, docs, args.repeat)
+        print(f'  gain : x{reference / fast:.1f}')
+    else:
+        print('orjson non installé : mesure du repli stdlib uniquement')
+
+    orjson_module, renderers.orjson = renderers.orjson, None
+    try:
+        fallback = bench('après (MongoJSONRenderer, stdlib)', after, docs, args.repeat)
+        print(f'  gain : x{reference / fallback:.1f}')
+    finally:
+        renderers.orjson = orjson_module
+
+    # Valeurs que l'ancien chemin ne sait pas encoder (NaN, Decimal128)
+    sample = dict(docs[0], purchase_value=float('nan'), price=Decimal128('1234.50'))
+    print('Document avec NaN/Decimal128 :', mongo_renderer.render(sample).decode())
+
+
+if __name__ == '__main__':
+    main()
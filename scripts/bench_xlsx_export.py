@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Mesure du temps et de la mémoire de l'export XLSX des équipements.
+
+Compare :
+- avant : documents convertis en dicts, DataFrame pandas puis ExcelWriter dans
+  un BytesIO (comportement de l'ancien export_equipments_excel)
+- après : dashboard.exports.write_xlsx (XlsxWriter constant_memory) vers un
+  fichier temporaire
+
+Par défaut les documents sont synthétiques (aucune connexion MongoDB) ; avec
+--mongo, ils sont lus dans la collection 'equipment'. La mémoire est le pic
+mesuré par tracemalloc (allocations Python et numpy).
+
+Usage:
+    python scripts/bench_xlsx_export.py [--rows 100000] [--mongo] [--sheet-rows N]
+"""
+import argparse
+import io
+import tempfile
+
+from _bench_common import measure, synthetic_docs
+
+from dashboard.api import _serialize_equipment
+from dashboard.exports import EQUIPMENT_EXPORT_FIELDS, XLSX_MAX_ROWS, iter_equipments, write_xlsx
+
+
+def export_before(docs):
+    """Ancien export : liste complète, DataFrame puis classeur en mémoire."""
+    import pandas as pd
+
+    rows = [_serialize_equipment(doc) for doc in docs]
+    df = pd.DataFrame(rows, columns=EQUIPMENT_EXPORT_FIELDS)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        df.to_excel(writer, index=False, sheet_name='Equipements')
+    return len(output.getvalue())
+
+
+def export_after(docs, max_rows=XLSX_MAX_ROWS):
+    """Nouvel export : écriture ligne à ligne dans un fichier temporaire."""
+    with tempfile.TemporaryFile(suffix='.xlsx') as output:
+        write_xlsx(docs, output, max_rows=max_rows)
+        return output.tell()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--mongo', action='store_true', help='lire la collection equipment')
+    parser.add_argument('--sheet-rows', type=int, default=XLSX_MAX_ROWS,
+                        help='lignes par feuille (pour tester le découpage)')
+    args = parser.parse_args()
+
+    if args.mongo:
+        from dashboard.db import get_mongodb_connection
+        rows = get_mongodb_connection()['equipment'].estimated_document_count()
+        docs_factory = iter_equipments
+    else:
+        rows = args.rows
+        docs_factory = lambda: synthetic_docs(rows)  # noqa: E731
+
+    print(f'Export XLSX de {rows} lignes')
+    try:
+        measure('avant (pandas + BytesIO)', export_before, docs_factory, rows)
+    except ImportError:
+        print('avant : pandas non installé, mesure ignorée')
+    measure('après (constant_memory)',
+            lambda docs: export_after(docs, args.sheet_rows), docs_factory, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,12 @@ from tqdm import tqdm
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Importer l'utilitaire de connexion MongoDB
-from dashboard.db import get_mongodb_connection
+from dashboard.db import get_mongodb_connection, check_mongodb_health
+from dashboard.indexes import ensure_equipment_indexes
+from dashboard.search import build_search_fields
+from dashboard.rollups import ROLLUP_MODE, RollupRebuildInProgress, rebuild_rollup
+from dashboard.status import build_status_fields
+from dashboard.versions import bump_version
 
 def parse_date(date_str):
     """
@@ -176,6 +181,12 @@ def import_equipment(csv_path):
                         if pd.notna(v) and v != '':
                             doc[k] = v
                     
+                    # Champs techniques de recherche indexée
+                    doc.update(build_search_fields(doc))
+                    
+                    # Statut normalisé (voir dashboard/status.py)
+                    doc.update(build_status_fields(doc))
+                    
                     # Mettre à jour ou insérer le document
                     result = collection.update_one(
                         {'_id': doc['_id']},
@@ -192,16 +203,8 @@ def import_equipment(csv_path):
                     errors += 1
                     print(f"\nErreur lors de l'import de l'équipement {item.get('_id')}: {e}")
         
-        # Créer des index pour les requêtes fréquentes
-        # Index sur serial (non unique car peut avoir des doublons)
-        collection.create_index([('serial', 1)])
-        
-        # Index sur barcode (non unique pour éviter les erreurs de contrainte)
-        collection.create_index([('barcode', 1)])
-        
-        # Créer d'autres index non-uniques pour les champs fréquemment utilisés dans les requêtes
-        collection.create_index([('status', 1)])
-        collection.create_index([('location', 1)])
+        # Créer des index pour les requêtes fréquentes (voir dashboard/indexes.py)
+        ensure_equipment_indexes(db)
         
         # Vérifier et nettoyer les doublons potentiels de barcode
         # Cette étape est effectuée après l'import pour garantir l'unicité
@@ -238,6 +241,25 @@ def import_equipment(csv_path):
                     {'_id': dup_id},
                     {'$set': {'barcode': new_barcode}}
                 )
+                # Resynchroniser les champs de recherche avec le nouveau code-barres
+                dup_doc = collection.find_one({'_id': dup_id})
+                if dup_doc:
+                    collection.update_one(
+                        {'_id': dup_id},
+                        {'$set': build_search_fields(dup_doc)}
+                    )
+        
+        # Recalculer les agrégats des analytics (voir dashboard/rollups.py) ; en
+        # mode change_stream, les écritures de l'import sont suivies par le script
+        if ROLLUP_MODE == 'inline':
+            try:
+                rebuild_rollup(db)
+            except RollupRebuildInProgress as e:
+                print(f"\nAgrégats non recalculés ({e}) : relancer python scripts/rollup.py --rebuild")
+        
+        # Invalider les caches dérivés (exports, analytics...) ; les documents
+        # importés n'ont pas de date updated_at : instantanés à reconstruire
+        bump_version('equipment', db, reset=True)
         
         # Afficher un résumé
         print("\nRésumé de l'importation:")
@@ -323,6 +345,9 @@ def import_relation_data(csv_path, relation_type):
         collection.create_index([('equipment_id', 1)])
         collection.create_index([(f'{relation_type}_id', 1)])
         
+        # Invalider les réponses incluant cette relation (?include=)
+        bump_version(collection.name, db)
+        
         # Afficher un résumé
         print(f"\nRésumé de l'importation des {relation_type}s:")
         print(f"- Documents insérés: {inserted}")
@@ -354,12 +379,11 @@ def main():
         return
     
     # Vérifier la connexion à MongoDB
-    try:
-        get_mongodb_connection()
-        print("Connexion à MongoDB établie avec succès!")
-    except Exception as e:
-        print(f"Erreur de connexion à MongoDB: {e}")
+    ok, error = check_mongodb_health()
+    if not ok:
+        print(f"Erreur de connexion à MongoDB: {error}")
         return
+    print("Connexion à MongoDB établie avec succès!")
     
     # Exécuter les imports dans l'ordre
     for filename, (relation_type, import_func) in import_mapping.items():
@@ -14,6 +14,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dem_dashboard.settings')
 django.setup()
 
 from dashboard.db import get_mongodb_connection
+from dashboard.geo import build_geo_fields
+from dashboard.indexes import ensure_location_indexes
+from dashboard.versions import bump_version
 
 def clean_value(value):
     """Nettoie et convertit les valeurs du CSV"""
@@ -124,6 +127,9 @@ def import_locations():
                     if coords['latitude'] is None and coords['longitude'] is None:
                         location_doc['coordinates'] = None
                     
+                    # Position canonique (voir dashboard/geo.py)
+                    location_doc.update(build_geo_fields(location_doc))
+                    
                     # Insérer dans MongoDB
                     collection.insert_one(location_doc)
                     imported_count += 1
@@ -148,14 +154,13 @@ def import_locations():
     # Créer des index pour optimiser les requêtes
     print("\nCréation des index...")
     try:
-        collection.create_index("site_name")
-        collection.create_index("region")
-        collection.create_index("province")
-        collection.create_index("category")
-        collection.create_index([("coordinates.latitude", 1), ("coordinates.longitude", 1)])
+        ensure_location_indexes(db)
         print("Index créés avec succès.")
     except Exception as e:
         print(f"Erreur lors de la création des index: {str(e)}")
+    
+    # Invalider les caches dérivés (statistiques, carte...)
+    bump_version('locations', db)
 
 if __name__ == "__main__":
     print("=== IMPORT DES LOCALISATIONS ===")
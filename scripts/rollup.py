@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Script de maintenance des agrégats des analytics (collection 'equipment_rollup').
+Ce script doit être exécuté depuis le répertoire racine du projet.
+
+--rebuild : recalcule entièrement les agrégats depuis 'equipment'
+--check   : compare les agrégats stockés à un recalcul et liste les écarts
+            (code de sortie 2 en cas d'écart)
+
+Usage:
+    python scripts/rollup.py --rebuild
+    python scripts/rollup.py --check [--limit 20]
+"""
+import argparse
+import os
+import sys
+
+# Ajouter le répertoire parent au chemin Python pour pouvoir importer les modules du projet
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.db import get_mongodb_connection, check_mongodb_health
+from dashboard.rollups import RollupRebuildInProgress, check_rollup, rebuild_rollup
+from dashboard.versions import bump_version
+
+
+def main():
+    """Fonction principale du script."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--rebuild', action='store_true', help='recalculer les agrégats')
+    action.add_argument('--check', action='store_true', help='vérifier les agrégats')
+    parser.add_argument('--limit', type=int, default=20, help='écarts affichés au maximum')
+    args = parser.parse_args()
+
+    ok, error = check_mongodb_health()
+    if not ok:
+        print(f"Erreur de connexion à MongoDB: {error}")
+        sys.exit(1)
+
+    db = get_mongodb_connection()
+
+    if args.rebuild:
+        print("Recalcul des agrégats...")
+        try:
+            rows = rebuild_rollup(db)
+        except RollupRebuildInProgress as e:
+            print(f"Erreur : {e}")
+            sys.exit(1)
+        # Invalider les réponses d'analytics mises en cache
+        bump_version('equipment', db)
+        print(f"Terminé : {rows} lignes d'agrégat.")
+        return
+
+    print("Vérification des agrégats...")
+    differences = check_rollup(db)
+    if not differences:
+        print("Aucun écart.")
+        return
+
+    print(f"{len(differences)} écart(s) :")
+    for difference in differences[:args.limit]:
+        print(f"- {difference['key']} : attendu {difference['expected']}, "
+              f"stocké {difference['stored']}")
+    print("Corriger avec : python scripts/rollup.py --rebuild")
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
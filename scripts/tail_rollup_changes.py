@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Maintient les agrégats des analytics en suivant le change stream de la
+collection 'equipment' (alternative au mode 'inline').
+Ce script doit être exécuté depuis le répertoire racine du projet.
+
+Prérequis :
+- MongoDB en replica set (les change streams n'existent pas en standalone) ;
+- ROLLUP_MODE=change_stream pour l'application, sinon chaque écriture serait
+  comptée deux fois.
+
+Les pré- et post-images sont activées sur 'equipment' (MongoDB >= 6.0) pour
+connaître l'état d'un document avant et après chaque mise à jour. Le jeton de
+reprise est sauvegardé après chaque événement : un redémarrage reprend là où le
+suivi s'était arrêté.
+
+Usage:
+    python scripts/tail_rollup_changes.py
+"""
+import os
+import sys
+
+from pymongo.errors import OperationFailure
+
+# Ajouter le répertoire parent au chemin Python pour pouvoir importer les modules du projet
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.db import get_mongodb_connection, check_mongodb_health
+from dashboard.rollups import ROLLUP_COLLECTION, apply_rollup_delta
+
+# Document conservant le jeton de reprise
+STATE_COLLECTION = 'rollup_state'
+STATE_ID = 'change_stream'
+
+
+def main():
+    """Fonction principale du script."""
+    ok, error = check_mongodb_health()
+    if not ok:
+        print(f"Erreur de connexion à MongoDB: {error}")
+        sys.exit(1)
+
+    db = get_mongodb_connection()
+    try:
+        db.command('collMod', 'equipment', changeStreamPreAndPostImages={'enabled': True})
+    except OperationFailure as e:
+        print(f"Impossible d'activer les pré-images sur 'equipment': {e}")
+        sys.exit(1)
+
+    state = db[STATE_COLLECTION].find_one({'_id': STATE_ID}) or {}
+    options = {
+        # Post-images de l'événement (pas l'état courant, qui peut être plus récent)
+        'full_document': 'whenAvailable',
+        'full_document_before_change': 'whenAvailable',
+    }
+    if state.get('resume_token'):
+        options['resume_after'] = state['resume_token']
+
+    print(f"Suivi des modifications de 'equipment' vers '{ROLLUP_COLLECTION}'...")
+    pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+    try:
+        with db['equipment'].watch(pipeline, **options) as stream:
+            for change in stream:
+                old_doc = change.get('fullDocumentBeforeChange')
+                new_doc = change.get('fullDocument')
+                if (change['operationType'] != 'insert' and old_doc is None) or \
+                        (change['operationType'] != 'delete' and new_doc is None):
+                    # Image indisponible (antérieure à l'activation) : delta incalculable
+                    print(f"Image manquante pour {change['documentKey']}, "
+                          f"lancer scripts/rollup.py --rebuild")
+                else:
+                    apply_rollup_delta(old_doc, new_doc, db)
+                db[STATE_COLLECTION].update_one(
+                    {'_id': STATE_ID}, {'$set': {'resume_token': stream.resume_token}}, upsert=True
+                )
+    except OperationFailure as e:
+        print(f"Change stream indisponible (replica set requis): {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("Arrêt.")
+
+
+if __name__ == "__main__":
+    main()